@@ -0,0 +1,169 @@
+import os
+import random
+import argparse
+
+# deterministic synthetic Jack projects for the benchmarks, the same
+# parameters and seed always give the same files
+
+DEFAULTS = {
+    "classes" : 10,
+    "subroutines" : 8,
+    "statements" : 20,
+    "expression_depth" : 3,
+    "identifiers" : 8,
+    "comment_density" : 0.2,
+    "seed" : 0
+}
+
+OPERATORS = ["+", "-", "*", "/", "&", "|", "<", ">", "="]
+
+class CorpusGenerator(object):
+    def __init__(self, classes = DEFAULTS["classes"], subroutines = DEFAULTS["subroutines"],
+                 statements = DEFAULTS["statements"], expression_depth = DEFAULTS["expression_depth"],
+                 identifiers = DEFAULTS["identifiers"], comment_density = DEFAULTS["comment_density"],
+                 seed = DEFAULTS["seed"]):
+        self.classes = classes
+        self.subroutines = subroutines
+        self.statements = statements
+        self.expression_depth = expression_depth
+        self.identifiers = identifiers
+        self.comment_density = comment_density
+        self.random = random.Random(seed)
+        self.lines = []
+
+    def parameters(self):
+        return {"classes" : self.classes, "subroutines" : self.subroutines, "statements" : self.statements,
+                "expression_depth" : self.expression_depth, "identifiers" : self.identifiers,
+                "comment_density" : self.comment_density}
+
+    def class_name(self, i):
+        return "Main" if i == 0 else f"Class{i}"
+
+    def comment(self, indent):
+        if self.random.random() < self.comment_density:
+            if self.random.random() < 0.5:
+                self.lines.append(f"{indent}// step {self.random.randrange(1000)} of the generated code")
+            else:
+                self.lines.append(f"{indent}/** generated block {self.random.randrange(1000)}")
+                self.lines.append(f"{indent} *  with a second line */")
+
+    def expression(self, names, depth):
+        if depth <= 0 or self.random.random() < 0.25:
+            return self.term(names)
+        op = self.random.choice(OPERATORS)
+        left = self.expression(names, depth - 1)
+        right = self.expression(names, depth - 1)
+        if op == "/":
+            #keep the divisor non zero
+            right = f"({right} | 1)"
+        return f"({left} {op} {right})"
+
+    def term(self, names):
+        choice = self.random.random()
+        if choice < 0.45:
+            return self.random.choice(names)
+        elif choice < 0.75:
+            return str(self.random.randrange(1000))
+        elif choice < 0.85:
+            return f"-{self.random.choice(names)}"
+        elif choice < 0.95:
+            return f"a[{self.random.choice(names)} & 7]"
+        return self.random.choice(["true", "false", "null"])
+
+    def statement(self, names, indent, depth, class_index):
+        self.comment(indent)
+        choice = self.random.random()
+        if choice < 0.45 or depth > 2:
+            self.lines.append(f"{indent}let {self.random.choice(names)} = "
+                              f"{self.expression(names, self.expression_depth)};")
+        elif choice < 0.55:
+            self.lines.append(f"{indent}let a[{self.random.choice(names)} & 7] = "
+                              f"{self.expression(names, self.expression_depth)};")
+        elif choice < 0.7:
+            self.lines.append(f"{indent}if ({self.expression(names, 1)}) {{")
+            self.block(names, indent + "    ", depth + 1, class_index)
+            self.lines.append(f"{indent}}} else {{")
+            self.block(names, indent + "    ", depth + 1, class_index)
+            self.lines.append(f"{indent}}}")
+        elif choice < 0.8:
+            counter = self.random.choice(names)
+            self.lines.append(f"{indent}while ({counter} < {self.random.randrange(1, 50)}) {{")
+            self.block(names, indent + "    ", depth + 1, class_index)
+            self.lines.append(f"{indent}    let {counter} = {counter} + 1;")
+            self.lines.append(f"{indent}}}")
+        elif choice < 0.9 and self.classes > 1:
+            #Main only has main, so calls go to the other classes
+            target = self.random.randrange(1, self.classes)
+            subroutine = self.random.randrange(self.subroutines)
+            arguments = ", ".join([self.expression(names, 1) for _ in range(2)])
+            self.lines.append(f"{indent}do {self.class_name(target)}.f{subroutine}({arguments});")
+        else:
+            self.lines.append(f'{indent}do Output.printString("{self.class_name(class_index)} {self.random.randrange(100)}");')
+
+    def block(self, names, indent, depth, class_index):
+        for _ in range(self.random.randint(1, 3)):
+            self.statement(names, indent, depth, class_index)
+
+    def generate_class(self, class_index):
+        self.lines = []
+        name = self.class_name(class_index)
+        fields = [f"field{i}" for i in range(max(1, self.identifiers // 2))]
+        self.comment("")
+        self.lines.append(f"class {name} {{")
+        self.lines.append(f"    field int {', '.join(fields)};")
+        self.lines.append(f"    static Array a;")
+        self.lines.append("")
+        self.lines.append(f"    constructor {name} new() {{")
+        for field in fields:
+            self.lines.append(f"        let {field} = {self.random.randrange(100)};")
+        self.lines.append("        return this;")
+        self.lines.append("    }")
+
+        local_names = [f"local{i}" for i in range(self.identifiers)]
+        for subroutine in range(self.subroutines):
+            self.lines.append("")
+            self.comment("    ")
+            if name == "Main" and subroutine == 0:
+                self.lines.append("    function void main() {")
+                self.lines.append(f"        var int {', '.join(local_names)};")
+                self.lines.append("        let a = Array.new(8);")
+                arguments = []
+            else:
+                self.lines.append(f"    function int f{subroutine}(int x, int y) {{")
+                self.lines.append(f"        var int {', '.join(local_names)};")
+                arguments = ["x", "y"]
+            for _ in range(self.statements):
+                self.statement(local_names + arguments, "        ", 0, class_index)
+            self.lines.append("        return;" if not arguments else
+                              f"        return {self.expression(local_names + arguments, self.expression_depth)};")
+            self.lines.append("    }")
+
+        self.lines.append("")
+        self.lines.append(f"    method int sum() {{")
+        self.lines.append(f"        return {fields[0]};" if len(fields) == 1 else
+                          f"        return ({fields[0]} + {fields[1]});")
+        self.lines.append("    }")
+        self.lines.append("}")
+        return "\n".join(self.lines) + "\n"
+
+    def write(self, directory):
+        # writes the project to directory, returns the .jack paths
+        os.makedirs(directory, exist_ok = True)
+        paths = []
+        for class_index in range(self.classes):
+            path = os.path.join(directory, f"{self.class_name(class_index)}.jack")
+            with open(path, "w") as jack_file:
+                jack_file.write(self.generate_class(class_index))
+            paths.append(path)
+        return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage = "python generate_corpus.py <directory> [options]")
+    parser.add_argument("directory")
+    for name, default in DEFAULTS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type = type(default), default = default)
+    args = parser.parse_args()
+    generator = CorpusGenerator(args.classes, args.subroutines, args.statements, args.expression_depth,
+                                args.identifiers, args.comment_density, args.seed)
+    paths = generator.write(args.directory)
+    print(f"{len(paths)} classes, {sum(os.path.getsize(path) for path in paths) // 1024} KiB in {args.directory}")
@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "jack_analyzer"))
+
+import jack_tokenizer as jt
+import jack_compilation_engine as jce
+from jack_symbol_table import SymbolTable
+from jack_compiler import JackCompiler
+from vm_writer import VMWriter, VMSink, IRSink, ListSink
+from generate_corpus import CorpusGenerator, DEFAULTS
+
+# times each stage of the compiler on a generated corpus and writes the
+# results as JSON, e.g.
+#   python run_benchmarks.py --output before.json
+#   python run_benchmarks.py --output after.json --compare before.json
+
+DEFAULT_REPEAT = 5
+
+class NullSink(VMSink):
+    # VM text goes nowhere, so only the compiler is timed
+    def write(self, text):
+        pass
+
+    def write_code(self, code):
+        pass
+
+def read_all_tokens(jack_file, mode):
+    tokenizer = jt.JackTokenizer(jack_file, mode)
+    count = 0
+    tokenizer.advance()
+    while tokenizer.has_more_tokens():
+        tokenizer.token_type()
+        count += 1
+        tokenizer.advance()
+    tokenizer.close()
+    return count
+
+def identifier_tokens(jack_file):
+    tokenizer = jt.JackTokenizer(jack_file)
+    names = []
+    tokenizer.advance()
+    while tokenizer.has_more_tokens():
+        if tokenizer.token_type() == jt.JackTokenType.IDENTIFIER:
+            names.append(tokenizer.current_token)
+        tokenizer.advance()
+    tokenizer.close()
+    return names
+
+def resolve_identifiers(names, identifiers):
+    # a class scope and a subroutine scope like the engine builds for a generated class,
+    # identifiers is the generator's setting, then a lookup per identifier
+    class_symtab = SymbolTable()
+    for i in range(max(1, identifiers // 2)):
+        class_symtab.define({"name" : f"field{i}", "type" : "int", "kind" : "field"})
+    class_symtab.define({"name" : "a", "type" : "Array", "kind" : "static"})
+    symtab = SymbolTable(class_symtab)
+    for name in ["x", "y"]:
+        symtab.define({"name" : name, "type" : "int", "kind" : "argument"})
+    for i in range(identifiers):
+        symtab.define({"name" : f"local{i}", "type" : "int", "kind" : "local"})
+    for name in names:
+        symtab.resolve(name)
+
+def compile_file(jack_file, sink):
+    tokenizer = jt.JackTokenizer(jack_file)
+    try:
+        jce.CompilationEngine(sink, tokenizer).main()
+    finally:
+        tokenizer.close()
+
+def replay(code):
+    # writes commands through VMWriter the way the engine does
+    vm_writer = VMWriter(ListSink())
+    for command in code:
+        op = command[0]
+        if op == "push":
+            vm_writer.write_push(command[1], command[2])
+        elif op == "pop":
+            vm_writer.write_pop(command[1], command[2])
+        elif op == "label":
+            vm_writer.write_label(command[1])
+        elif op == "goto":
+            vm_writer.write_goto(command[1])
+        elif op == "if-goto":
+            vm_writer.write_if(command[1])
+        elif op == "function":
+            vm_writer.write_function(command[1], command[2])
+        elif op == "call":
+            vm_writer.write_call(command[1], command[2])
+        elif op == "return":
+            vm_writer.write_return()
+        else:
+            vm_writer.write_arithmetic(op)
+    vm_writer.close()
+
+def measure(function, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+    return {"best" : min(runs), "mean" : statistics.mean(runs), "median" : statistics.median(runs),
+            "runs" : runs}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output = True, text = True,
+                              cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_benchmarks(directory, generator, repeat = DEFAULT_REPEAT, jobs = 1):
+    jack_files = generator.write(directory)
+    results = {}
+    for mode in jt.SCAN_MODES:
+        results[f"tokenizer.{mode}"] = measure(lambda: [read_all_tokens(path, mode) for path in jack_files],
+                                               repeat)
+
+    names = [identifier_tokens(path) for path in jack_files]
+    results["symbol_table"] = measure(lambda: [resolve_identifiers(file_names, generator.identifiers)
+                                                for file_names in names],
+                                      repeat)
+    results["compilation_engine"] = measure(lambda: [compile_file(path, NullSink()) for path in jack_files],
+                                            repeat)
+
+    codes = []
+    for path in jack_files:
+        sink = IRSink()
+        compile_file(path, sink)
+        codes.append(sink.code)
+    results["vm_writer"] = measure(lambda: [replay(code) for code in codes], repeat)
+
+    results["end_to_end"] = measure(lambda: JackCompiler(directory).main(), repeat)
+    if jobs > 1:
+        results[f"end_to_end.jobs{jobs}"] = measure(lambda: JackCompiler(directory, jobs = jobs).main(), repeat)
+
+    return {
+        "commit" : git_commit(),
+        "python" : platform.python_version(),
+        "platform" : platform.platform(),
+        "repeat" : repeat,
+        "corpus" : dict(generator.parameters(),
+                        files = len(jack_files),
+                        bytes = sum(os.path.getsize(path) for path in jack_files),
+                        tokens = sum(read_all_tokens(path, "array") for path in jack_files),
+                        vm_commands = sum(len(code) for code in codes)),
+        "results" : results
+    }
+
+def compare(report, baseline):
+    # lines of best time now against best time in baseline
+    lines = []
+    if baseline["corpus"] != report["corpus"]:
+        lines.append("warning: the baseline was run on a different corpus")
+    lines.append(f"{'benchmark':<28} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name, result in report["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            lines.append(f"{name:<28} {'-':>10} {result['best']:>10.4f} {'':>8}")
+            continue
+        change = 100 * (result["best"] - before["best"]) / before["best"]
+        lines.append(f"{name:<28} {before['best']:>10.4f} {result['best']:>10.4f} {change:>+7.1f}%")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage = "python run_benchmarks.py [options]")
+    parser.add_argument("--output", help = "write the results to this JSON file")
+    parser.add_argument("--compare", help = "JSON results of an earlier run to compare against")
+    parser.add_argument("--repeat", type = int, default = DEFAULT_REPEAT, help = "runs of each benchmark")
+    parser.add_argument("-j", "--jobs", type = int, default = 1,
+                        help = "also time a parallel end to end build with this many workers")
+    parser.add_argument("--corpus-dir", help = "keep the generated corpus in this directory")
+    for name, default in DEFAULTS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type = type(default), default = default)
+    args = parser.parse_args()
+
+    generator = CorpusGenerator(args.classes, args.subroutines, args.statements, args.expression_depth,
+                                args.identifiers, args.comment_density, args.seed)
+    if args.corpus_dir is not None:
+        report = run_benchmarks(args.corpus_dir, generator, args.repeat, args.jobs)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            report = run_benchmarks(directory, generator, args.repeat, args.jobs)
+
+    corpus = report["corpus"]
+    print(f"corpus: {corpus['files']} files, {corpus['bytes'] // 1024} KiB, {corpus['tokens']} tokens, "
+          f"{corpus['vm_commands']} VM commands")
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            print(compare(report, json.load(baseline_file)))
+    else:
+        for name, result in report["results"].items():
+            print(f"{name:<28} best {result['best']:.4f}s  mean {result['mean']:.4f}s")
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent = 2)
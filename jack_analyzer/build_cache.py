@@ -0,0 +1,102 @@
+import os
+import glob
+import hashlib
+import tempfile
+
+DEFAULT_CACHE_SIZE = 1000
+# room in the subroutine fragment cache for each file entry
+FRAGMENTS_PER_ENTRY = 16
+
+def _compiler_version():
+    # a hash of the compiler's own source, editing the compiler invalidates every entry
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+        with open(path, "rb") as module_file:
+            digest.update(module_file.read())
+    return digest.hexdigest()
+
+COMPILER_VERSION = _compiler_version()
+
+class CacheStats(object):
+    def __init__(self):
+        self.kept = 0
+        self.restored = 0
+        self.misses = 0
+        self.evicted = 0
+        self.entries = 0
+        self.fragments = 0
+        self.size = 0
+
+    @property
+    def hits(self):
+        return self.kept + self.restored
+
+    def summary(self):
+        return (f"cache: {self.hits} hits ({self.kept} kept, {self.restored} restored), "
+                f"{self.misses} misses, {self.evicted} evicted, "
+                f"{self.entries} entries, {self.fragments} subroutine fragments, "
+                f"{self.size // 1024} KiB")
+
+class BuildCache(object):
+    # compiled VM text stored under the hash of its source, the compiler
+    # version and the options that change the generated code
+    def __init__(self, cache_dir, max_entries = DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok = True)
+
+    def key(self, source, options = ()):
+        digest = hashlib.sha256()
+        digest.update(COMPILER_VERSION.encode())
+        digest.update(repr(options).encode())
+        digest.update(source)
+        return digest.hexdigest()
+
+    def fragment_cache(self):
+        # subroutine code reused when a file is recompiled, kept apart from whole files
+        return BuildCache(os.path.join(self.cache_dir, "fragments"),
+                          self.max_entries * FRAGMENTS_PER_ENTRY)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.vm")
+
+    def get(self, key):
+        path = self._entry_path(key)
+        try:
+            with open(path) as entry:
+                vm_text = entry.read()
+        except FileNotFoundError:
+            return None
+        # eviction goes by modification time, so mark the entry as recently used
+        os.utime(path)
+        return vm_text
+
+    def put(self, key, vm_text):
+        # written to a temporary file and renamed so parallel builds never see half an entry
+        handle, temp_path = tempfile.mkstemp(dir = self.cache_dir, suffix = ".tmp")
+        with os.fdopen(handle, "w") as entry:
+            entry.write(vm_text)
+        os.replace(temp_path, self._entry_path(key))
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".vm")]
+
+    def evict(self):
+        # drops the least recently used entries above max_entries, returns how many went
+        entries = self._entries()
+        if len(entries) <= self.max_entries:
+            return 0
+        entries.sort(key = lambda entry: entry.stat().st_mtime)
+        evicted = 0
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+                evicted += 1
+            except FileNotFoundError:
+                pass
+        return evicted
+
+    def usage(self):
+        # (number of entries, total bytes)
+        entries = self._entries()
+        return len(entries), sum(entry.stat().st_size for entry in entries)
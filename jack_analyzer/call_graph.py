@@ -0,0 +1,112 @@
+import sys
+from vm_ir import VMCode, OPCODE_IDS
+from vm_interpreter import load_files
+
+# whole program dead code elimination: the call graph of the compiled classes is
+# walked from the entry point and every function it never reaches is dropped.
+# Calls to functions outside the program (the OS) are simply leaf calls.
+
+FUNCTION = OPCODE_IDS["function"]
+CALL = OPCODE_IDS["call"]
+
+# Sys.init when the program brings its own, as the VM bootstrap calls it, Main.main otherwise
+ENTRY_POINTS = ["Sys.init", "Main.main"]
+
+def functions(code):
+    # (name, start, end) of each function in code
+    starts = [i for i, opcode in enumerate(code.opcodes) if opcode == FUNCTION]
+    names = code.names.names
+    return [(names[code.targets[start]], start, end) for start, end in zip(starts, starts[1:] + [len(code)])]
+
+def call_graph(files):
+    # function name -> names of the functions it calls, for each function defined in files,
+    # a list of (file name, VMCode)
+    graph = {}
+    for _, code in files:
+        names = code.names.names
+        for name, start, end in functions(code):
+            graph[name] = {names[code.targets[i]] for i in range(start, end) if code.opcodes[i] == CALL}
+    return graph
+
+def entry_point(graph):
+    for name in ENTRY_POINTS:
+        if name in graph:
+            return name
+    return None
+
+def reachable(graph, roots):
+    seen = set()
+    stack = [root for root in roots if root in graph]
+    while stack:
+        name = stack.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        stack.extend(callee for callee in graph[name] if callee in graph and callee not in seen)
+    return seen
+
+class DeadCodeStats(object):
+    def __init__(self):
+        self.entry = None
+        self.functions = 0
+        self.functions_removed = 0
+        # files left without any function
+        self.files_removed = []
+        self.commands = 0
+        self.commands_removed = 0
+        # size of the VM text
+        self.size = 0
+        self.size_removed = 0
+
+    def summary(self):
+        if self.entry is None:
+            return "dead code: no Sys.init or Main.main to start from, nothing removed"
+        return (f"dead code: {self.functions_removed} of {self.functions} subroutines removed "
+                f"({len(self.files_removed)} classes), {self.commands_removed} of {self.commands} commands, "
+                f"{self.size_removed // 1024} of {self.size // 1024} KiB")
+
+def eliminate_dead_code(files, roots = None):
+    # returns files with only the functions reachable from roots (the entry point by
+    # default), in the same order, and a DeadCodeStats. A file with nothing reachable
+    # is kept with an empty VMCode
+    graph = call_graph(files)
+    stats = DeadCodeStats()
+    if roots is None:
+        stats.entry = entry_point(graph)
+        roots = [] if stats.entry is None else [stats.entry]
+    else:
+        stats.entry = ", ".join(roots)
+    live = reachable(graph, roots) if stats.entry is not None else set(graph)
+
+    kept_files = []
+    for file_name, code in files:
+        kept = VMCode(names = code.names)
+        for name, start, end in functions(code):
+            function_code = code[start:end]
+            size = len(function_code.to_text())
+            stats.functions += 1
+            stats.commands += end - start
+            stats.size += size
+            if name in live:
+                kept.extend(function_code)
+            else:
+                stats.functions_removed += 1
+                stats.commands_removed += end - start
+                stats.size_removed += size
+        if len(kept) == 0 and len(code) > 0:
+            stats.files_removed.append(file_name)
+        kept_files.append((file_name, kept))
+    return kept_files, stats
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python call_graph.py <directory>")
+        sys.exit(1)
+
+    # lists the functions of a directory of .vm/.vmb files that can never run
+    files = load_files(sys.argv[1])
+    kept_files, stats = eliminate_dead_code(files)
+    live = {name for _, code in kept_files for name, _, _ in functions(code)}
+    for name in sorted(set(call_graph(files)) - live):
+        print(name)
+    print(stats.summary())
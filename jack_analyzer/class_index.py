@@ -0,0 +1,156 @@
+import os
+import sys
+import json
+import hashlib
+import tempfile
+import jack_tokenizer as jt
+
+from collections import namedtuple
+
+# what the compiler knows about the classes of a project before compiling any of
+# them: the kind and arity of every subroutine, and the field and static counts.
+# Built by a quick pass over the declarations that skips subroutine bodies, and
+# kept in a JSON file between builds where each file is only rescanned when its
+# hash changes.
+
+INDEX_VERSION = 1
+
+Subroutine = namedtuple("Subroutine", ["kind", "return_type", "arity"])
+ClassSignature = namedtuple("ClassSignature", ["name", "subroutines", "fields", "statics"])
+
+def scan_class(source):
+    # the ClassSignature of one class, source is its text as str or bytes
+    tokenizer = jt.JackTokenizer.from_source(source, "array")
+    try:
+        tokenizer.advance_n(2) #class
+        name = tokenizer.current_token
+        tokenizer.advance_n(2) #className {
+
+        counts = {"field" : 0, "static" : 0}
+        while tokenizer.current_token in ["static", "field"]:
+            kind = tokenizer.current_token
+            tokenizer.advance_n(3) #kind type varName
+            counts[kind] += 1
+            while tokenizer.current_token == ",":
+                tokenizer.advance_n(2) #, varName
+                counts[kind] += 1
+            tokenizer.advance() #;
+
+        subroutines = {}
+        while tokenizer.current_token in ["function", "constructor", "method"]:
+            start = tokenizer.cursor
+            kind = tokenizer.current_token
+            tokenizer.advance()
+            return_type = tokenizer.current_token
+            tokenizer.advance()
+            sub_name = tokenizer.current_token
+            tokenizer.advance_n(2) #subroutineName (
+
+            arity = 0 if tokenizer.current_token == ")" else 1
+            while tokenizer.current_token != ")":
+                if tokenizer.current_token == ",":
+                    arity += 1
+                tokenizer.advance()
+            subroutines[sub_name] = Subroutine(kind, return_type, arity)
+            tokenizer.seek(tokenizer.find_block_end(start) + 1) #past the body
+    finally:
+        tokenizer.close()
+    return ClassSignature(name, subroutines, counts["field"], counts["static"])
+
+def _signature_to_json(signature):
+    return {"name" : signature.name, "fields" : signature.fields, "statics" : signature.statics,
+            "subroutines" : {name : list(subroutine) for name, subroutine in signature.subroutines.items()}}
+
+def _signature_from_json(data):
+    return ClassSignature(data["name"], {name : Subroutine(*subroutine)
+                                         for name, subroutine in data["subroutines"].items()},
+                          data["fields"], data["statics"])
+
+class ClassIndex(object):
+    def __init__(self, classes = ()):
+        self.classes = {signature.name : signature for signature in classes}
+        # files scanned by the last build, as opposed to taken from the index file
+        self.scanned = 0
+        self._digest = None
+
+    def add(self, signature):
+        self.classes[signature.name] = signature
+        self._digest = None
+
+    def subroutine(self, class_name, sub_name):
+        # the Subroutine, or None when the class or subroutine is unknown, e.g. the OS
+        signature = self.classes.get(class_name)
+        if signature is None:
+            return None
+        return signature.subroutines.get(sub_name)
+
+    def digest(self):
+        # changes whenever any signature does, part of the build cache key
+        if self._digest is None:
+            data = [_signature_to_json(self.classes[name]) for name in sorted(self.classes)]
+            self._digest = hashlib.sha256(json.dumps(data, sort_keys = True).encode()).hexdigest()
+        return self._digest
+
+    @classmethod
+    def build(cls, jack_files, index_file = None):
+        # the index of jack_files, reusing the entries of index_file whose hash still
+        # matches and writing the refreshed index back to it
+        entries = _load_entries(index_file) if index_file is not None else {}
+        index = cls()
+        # the index file can be shared by several projects, files that are gone are dropped
+        refreshed = {path : entry for path, entry in entries.items() if os.path.exists(path)}
+        for jack_file in jack_files:
+            with open(jack_file, "rb") as source_file:
+                source = source_file.read()
+            path = os.path.abspath(jack_file)
+            file_hash = hashlib.sha256(source).hexdigest()
+            entry = entries.get(path)
+            if entry is not None and entry["hash"] == file_hash:
+                signature = _signature_from_json(entry["class"])
+            else:
+                try:
+                    signature = scan_class(source)
+                except Exception:
+                    #left out, compiling the file reports what's wrong with it
+                    refreshed.pop(path, None)
+                    continue
+                index.scanned += 1
+            index.add(signature)
+            refreshed[path] = {"hash" : file_hash, "class" : _signature_to_json(signature)}
+
+        if index_file is not None and refreshed != entries:
+            _save_entries(index_file, refreshed)
+        return index
+
+def _load_entries(index_file):
+    try:
+        with open(index_file) as index_json:
+            data = json.load(index_json)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if data.get("version") != INDEX_VERSION:
+        return {}
+    return data["files"]
+
+def _save_entries(index_file, entries):
+    # written to a temporary file and renamed like build cache entries
+    directory = os.path.dirname(os.path.abspath(index_file))
+    handle, temp_path = tempfile.mkstemp(dir = directory, suffix = ".tmp")
+    with os.fdopen(handle, "w") as index_json:
+        json.dump({"version" : INDEX_VERSION, "files" : entries}, index_json, indent = 1, sort_keys = True)
+    os.replace(temp_path, index_file)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python class_index.py <filename.jack> | <directory>")
+        sys.exit(1)
+
+    source = sys.argv[1]
+    if os.path.isdir(source):
+        jack_files = sorted(os.path.join(source, name) for name in os.listdir(source) if name.endswith(".jack"))
+    else:
+        jack_files = [source]
+    for name, signature in sorted(ClassIndex.build(jack_files).classes.items()):
+        print(f"class {name} ({signature.fields} fields, {signature.statics} statics)")
+        for sub_name, subroutine in signature.subroutines.items():
+            print(f"    {subroutine.kind} {subroutine.return_type} {sub_name}/{subroutine.arity}")
@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+import socket
+import argparse
+import tempfile
+
+# thin client for compile_server.py, it only needs the standard library so it
+# starts quickly, e.g.
+#   python compile_client.py Main.jack      prints the VM code
+#   python compile_client.py project/       compiles the directory in place
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), f"jack-compiler-{os.getuid()}.sock")
+# longest request or response line
+MAX_MESSAGE_SIZE = 64 << 20
+
+class CompileClient(object):
+    def __init__(self, socket_path = DEFAULT_SOCKET_PATH):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socket_path)
+        self.stream = self.socket.makefile("rwb")
+
+    def request(self, request):
+        self.stream.write(json.dumps(request).encode() + b"\n")
+        self.stream.flush()
+        line = self.stream.readline(MAX_MESSAGE_SIZE)
+        if not line:
+            raise ConnectionError("The compile server closed the connection")
+        return json.loads(line)
+
+    def compile_source(self, source, **options):
+        return self.request({"source" : source, "options" : options})
+
+    def compile_path(self, path, **options):
+        return self.request({"path" : os.path.abspath(path), "options" : options})
+
+    def close(self):
+        self.stream.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage = "python compile_client.py <filename.jack> | <directory>")
+    parser.add_argument("jack_file", nargs = "?")
+    parser.add_argument("--socket", default = DEFAULT_SOCKET_PATH)
+    parser.add_argument("-O", "--optimize", action = "store_true")
+    parser.add_argument("--shutdown", action = "store_true", help = "stop the server")
+    args = parser.parse_args()
+
+    options = {"optimize" : True} if args.optimize else {}
+    with CompileClient(args.socket) as client:
+        if args.shutdown:
+            client.request({"command" : "shutdown"})
+            sys.exit(0)
+        elif args.jack_file is None:
+            parser.error("a .jack file or directory is needed")
+        elif os.path.isdir(args.jack_file):
+            response = client.compile_path(args.jack_file, **options)
+        else:
+            with open(args.jack_file) as jack_file:
+                response = client.compile_source(jack_file.read(), **options)
+
+    if "error" in response:
+        print(response["error"], file = sys.stderr)
+        sys.exit(1)
+    elif "vm" in response:
+        sys.stdout.write(response["vm"])
+    else:
+        for result in response["results"]:
+            if result["error"] is None:
+                print(f"{result['jack_file']} -> {result['vm_file']} ({result['status']})")
+            else:
+                print(f"{result['jack_file']}: {result['error']}", file = sys.stderr)
+        if any(result["error"] is not None for result in response["results"]):
+            sys.exit(1)
@@ -0,0 +1,169 @@
+import os
+import sys
+import json
+import signal
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from jack_compiler import CompileOptions, JackCompiler, build_class_index, compile_file, compile_source, evict_cache
+from compile_client import DEFAULT_SOCKET_PATH, MAX_MESSAGE_SIZE
+
+# a long running compiler answering requests on a Unix domain socket, so
+# editors and test runners don't pay for a Python start up per compile.
+# Requests and responses are one JSON object per line:
+#   {"source": "<jack text>", "options": {...}} -> {"vm": "<vm text>"}
+#   {"path": "<.jack file or directory>", "options": {...}}
+#       -> {"results": [{"jack_file", "vm_file", "status", "error"}, ...]},
+#          the .vm files are written next to the sources like jack_compiler.py does,
+#          with a cache_dir the cache is trimmed to cache_size afterwards
+#   {"command": "ping"} -> {"ok": true}
+#   {"command": "shutdown"} -> {"ok": true}, then the server exits
+# Failures come back as {"error": "<message>"}. options are CompileOptions
+# fields, e.g. {"optimize": true}; source requests only produce "vm", path requests "vm"
+# or "vmb". Responses carry the request's "id" if it had one.
+
+DEFAULT_JOBS = os.cpu_count() or 1
+# options only JackCompiler itself can act on, or that have nowhere to go in a response
+PROJECT_OPTIONS = {"class_index", "whole_program", "inline_accessors", "collect_stats"}
+# output formats each kind of request can produce, asm needs every file of a program
+SOURCE_FORMATS = ["vm"]
+PATH_FORMATS = ["vm", "vmb"]
+
+class RequestError(Exception):
+    pass
+
+def parse_options(options, output_formats):
+    if not isinstance(options, dict):
+        raise RequestError("options must be an object")
+    unknown = set(options) - (set(CompileOptions._fields) - PROJECT_OPTIONS)
+    if unknown:
+        raise RequestError(f"Unknown options: {', '.join(sorted(unknown))}")
+    options = CompileOptions(**options)
+    if options.output_format not in output_formats:
+        raise RequestError(f"output_format {options.output_format} isn't supported here, "
+                           f"use one of {', '.join(output_formats)}")
+    return options
+
+class CompileServer(object):
+    def __init__(self, socket_path = DEFAULT_SOCKET_PATH, jobs = DEFAULT_JOBS):
+        self.socket_path = socket_path
+        self.jobs = jobs
+        self.executor = None
+        self.server = None
+        self.stopped = None
+        self.connections = {}
+
+    async def start(self):
+        # the workers are started up front so the first request finds them warm
+        self.executor = ProcessPoolExecutor(max_workers = self.jobs)
+        await asyncio.gather(*[asyncio.get_running_loop().run_in_executor(self.executor, os.getpid)
+                               for _ in range(self.jobs)])
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.stopped = asyncio.Event()
+        self.server = await asyncio.start_unix_server(self.handle_connection, self.socket_path,
+                                                      limit = MAX_MESSAGE_SIZE)
+
+    async def serve(self):
+        await self.start()
+        try:
+            await self.stopped.wait()
+        finally:
+            await self.close()
+
+    def stop(self):
+        self.stopped.set()
+
+    async def close(self):
+        self.server.close()
+        # idle connections see EOF and their handlers return
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*self.connections.values())
+        await self.server.wait_closed()
+        self.executor.shutdown()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    async def handle_connection(self, reader, writer):
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.respond(line)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            # the client went away, or sent a line over MAX_MESSAGE_SIZE
+            pass
+        finally:
+            del self.connections[writer]
+            writer.close()
+
+    async def respond(self, line):
+        request = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError("Requests must be JSON objects")
+            response = await self.dispatch(request)
+        except json.JSONDecodeError:
+            response = {"error" : "Invalid JSON"}
+        except (RequestError, TypeError) as e:
+            response = {"error" : str(e)}
+        except Exception as e:
+            response = {"error" : f"{type(e).__name__}: {e}"}
+        if isinstance(request, dict) and "id" in request:
+            response["id"] = request["id"]
+        return response
+
+    async def dispatch(self, request):
+        command = request.get("command")
+        if command == "ping":
+            return {"ok" : True}
+        elif command == "shutdown":
+            self.stop()
+            return {"ok" : True}
+        elif command is not None:
+            raise RequestError(f"Unknown command {command}")
+
+        loop = asyncio.get_running_loop()
+        if "source" in request:
+            options = parse_options(request.get("options", {}), SOURCE_FORMATS)
+            vm_text = await loop.run_in_executor(self.executor, compile_source, request["source"], options)
+            return {"vm" : vm_text}
+        elif "path" in request:
+            options = parse_options(request.get("options", {}), PATH_FORMATS)
+            path = request["path"]
+            if not os.path.exists(path):
+                raise RequestError(f"{path} not found")
+            jack_files = JackCompiler(path).jack_files
+            # scanning the project is as much work as compiling, so it's kept off the loop too
+            class_index = await loop.run_in_executor(self.executor, build_class_index, path, options)
+            options = options._replace(class_index = class_index)
+            results = await asyncio.gather(*[loop.run_in_executor(self.executor, compile_file, jack_file, options)
+                                             for jack_file in jack_files])
+            if options.cache_dir is not None:
+                await loop.run_in_executor(self.executor, evict_cache, options)
+            return {"results" : [{"jack_file" : result.jack_file, "vm_file" : result.vm_file,
+                                  "status" : result.status, "error" : result.error} for result in results]}
+        raise RequestError("A request needs a source, a path or a command")
+
+async def _serve(server):
+    loop = asyncio.get_running_loop()
+    for signal_number in [signal.SIGINT, signal.SIGTERM]:
+        loop.add_signal_handler(signal_number, server.stop)
+    await server.serve()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage = "python compile_server.py [--socket PATH] [-j JOBS]")
+    parser.add_argument("--socket", default = DEFAULT_SOCKET_PATH, help = "Unix domain socket to listen on")
+    parser.add_argument("-j", "--jobs", type = int, default = DEFAULT_JOBS, help = "number of worker processes")
+    args = parser.parse_args()
+
+    server = CompileServer(args.socket, args.jobs)
+    print(f"listening on {args.socket} with {args.jobs} workers", file = sys.stderr)
+    asyncio.run(_serve(server))
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+from collections import Counter
+from jack_symbol_table import SymbolTable
+from vm_writer import VMSink
+from vm_ir import OPCODES
+import jack_compilation_engine as jce
+
+# timings and counters for one build, only gathered when asked for: the
+# compiler swaps in the instrumented classes below so a normal build runs
+# exactly the same code as before
+
+PHASES = ["tokenize", "compile", "write"]
+
+class FileStats(object):
+    # what compiling one file cost, times are in seconds
+    def __init__(self, jack_file):
+        self.jack_file = jack_file
+        self.status = "compiled"
+        self.total = 0.0
+        self.phases = {phase : 0.0 for phase in PHASES}
+        self.bytes_read = 0
+        # None until the file is tokenized
+        self.tokens = None
+        self.symbol_lookups = 0
+        self.subroutines = 0
+        self.instructions = Counter()
+
+    def to_dict(self):
+        return {"jack_file" : self.jack_file, "status" : self.status, "total" : self.total,
+                "phases" : dict(self.phases), "bytes_read" : self.bytes_read, "tokens" : self.tokens,
+                "symbol_lookups" : self.symbol_lookups, "subroutines" : self.subroutines,
+                "instructions" : dict(self.instructions)}
+
+class BuildStats(object):
+    def __init__(self, files = None):
+        self.files = [] if files is None else files
+
+    def totals(self):
+        totals = FileStats(None)
+        totals.status = None
+        totals.tokens = 0
+        for stats in self.files:
+            totals.total += stats.total
+            for phase in PHASES:
+                totals.phases[phase] += stats.phases[phase]
+            totals.bytes_read += stats.bytes_read
+            totals.tokens += stats.tokens or 0
+            totals.symbol_lookups += stats.symbol_lookups
+            totals.subroutines += stats.subroutines
+            totals.instructions.update(stats.instructions)
+        return totals
+
+    def to_json(self):
+        return json.dumps({"files" : [stats.to_dict() for stats in self.files],
+                           "totals" : self.totals().to_dict()}, indent = 2)
+
+    def table(self, top = None):
+        # one row per file, slowest first, then the totals and instruction kinds
+        rows = sorted(self.files, key = lambda stats: -stats.total)[:top]
+        lines = [f"{'file':<24} {'status':<9} {'total ms':>9} {'tokenize':>9} {'compile':>9} {'write':>9} "
+                 f"{'bytes':>8} {'tokens':>7} {'lookups':>8} {'instrs':>7} {'subs':>5}"]
+        for stats in rows + [self.totals()]:
+            name = "total" if stats.jack_file is None else os.path.basename(stats.jack_file)
+            tokens = "-" if stats.tokens is None else stats.tokens
+            lines.append(f"{name:<24} {stats.status or '':<9} {stats.total * 1000:>9.2f} "
+                         f"{stats.phases['tokenize'] * 1000:>9.2f} {stats.phases['compile'] * 1000:>9.2f} "
+                         f"{stats.phases['write'] * 1000:>9.2f} {stats.bytes_read:>8} {tokens:>7} "
+                         f"{stats.symbol_lookups:>8} {sum(stats.instructions.values()):>7} "
+                         f"{stats.subroutines:>5}")
+        kinds = self.totals().instructions.most_common()
+        if kinds:
+            lines.append("instructions: " + ", ".join([f"{kind} {count}" for kind, count in kinds]))
+        return "\n".join(lines)
+
+class CountingSymbolTable(SymbolTable):
+    def __init__(self, stats, parent = None):
+        super().__init__(parent)
+        self.stats = stats
+
+    def resolve(self, name):
+        self.stats.symbol_lookups += 1
+        return super().resolve(name)
+
+class InstrumentedCompilationEngine(jce.CompilationEngine):
+    # counts symbol lookups, see CountingSymbolTable, and the subroutines of the source,
+    # the __string builders of intern_strings aren't among them
+    def __init__(self, stats, *args, **kwargs):
+        self.stats = stats
+        super().__init__(*args, **kwargs)
+
+    def new_symbol_table(self, parent = None):
+        return CountingSymbolTable(self.stats, parent)
+
+    def compile_subroutine(self):
+        self.stats.subroutines += 1
+        super().compile_subroutine()
+
+def time_scanning(tokenizer, stats):
+    # the bytes and regex scan modes tokenize as the engine advances, this counts
+    # the time spent in advance (and the tokens read) under tokenize instead of compile
+    advance = tokenizer.advance
+    stats.tokens = 0
+    def timed_advance():
+        start = time.perf_counter()
+        advance()
+        stats.phases["tokenize"] += time.perf_counter() - start
+        if tokenizer.has_more_tokens():
+            stats.tokens += 1
+    tokenizer.advance = timed_advance
+
+class StatsSink(VMSink):
+    # passes everything on to sink, timing it and counting the commands by kind
+    def __init__(self, sink, stats):
+        self.sink = sink
+        self.stats = stats
+
+    def write(self, text):
+        #already formatted code, e.g. a cached subroutine
+        start = time.perf_counter()
+        for line in text.splitlines():
+            if line:
+                self.stats.instructions[line.split(" ", 1)[0]] += 1
+        self.sink.write(text)
+        self.stats.phases["write"] += time.perf_counter() - start
+
+    def write_code(self, code):
+        start = time.perf_counter()
+        for opcode, count in Counter(code.opcodes).items():
+            self.stats.instructions[OPCODES[opcode]] += count
+        self.sink.write_code(code)
+        self.stats.phases["write"] += time.perf_counter() - start
+
+    def close(self):
+        start = time.perf_counter()
+        self.sink.close()
+        self.stats.phases["write"] += time.perf_counter() - start
+
+    def __getattr__(self, name):
+        # e.g. getvalue on a ListSink
+        return getattr(self.sink, name)
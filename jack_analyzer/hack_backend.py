@@ -0,0 +1,201 @@
+import os
+import sys
+from vm_ir import VMCode
+
+# lowers VM commands straight to Hack assembly, following the nand2tetris
+# calling convention: SP, LCL, ARG, THIS, THAT in RAM[0..4], pointer at 3,
+# temp at 5, statics as <File>.<index> symbols
+
+BASE_REGISTERS = {"local" : "LCL", "argument" : "ARG", "this" : "THIS", "that" : "THAT"}
+FIXED_BASES = {"pointer" : 3, "temp" : 5}
+
+BINARY_OPS = {"add" : "M=M+D", "sub" : "M=M-D", "and" : "M=M&D", "or" : "M=M|D"}
+UNARY_OPS = {"neg" : "M=-M", "not" : "M=!M"}
+COMPARISON_JUMPS = {"eq" : "JEQ", "gt" : "JGT", "lt" : "JLT"}
+
+# every return jumps here instead of repeating the frame teardown
+RETURN_ROUTINE = "$RETURN"
+RETURN_CODE = [
+    f"({RETURN_ROUTINE})",
+    #R13 = frame, R14 = return address
+    "@LCL", "D=M", "@R13", "M=D",
+    "@5", "A=D-A", "D=M", "@R14", "M=D",
+    #*ARG = return value, SP = ARG + 1
+    "@SP", "A=M-1", "D=M", "@ARG", "A=M", "M=D",
+    "D=A+1", "@SP", "M=D",
+    #THAT, THIS, ARG, LCL from the frame
+    "@R13", "AM=M-1", "D=M", "@THAT", "M=D",
+    "@R13", "AM=M-1", "D=M", "@THIS", "M=D",
+    "@R13", "AM=M-1", "D=M", "@ARG", "M=D",
+    "@R13", "AM=M-1", "D=M", "@LCL", "M=D",
+    "@R14", "A=M", "0;JMP"
+]
+
+PUSH_D = ["@SP", "AM=M+1", "A=A-1", "M=D"]
+POP_D = ["@SP", "AM=M-1", "D=M"]
+
+class HackBackendError(Exception):
+    pass
+
+class HackBackend(object):
+    def __init__(self, bootstrap = True):
+        self.lines = []
+        self.file_name = ""
+        self.function_name = ""
+        self.label_counter = 0
+        if bootstrap:
+            self.lines.extend(["@256", "D=A", "@SP", "M=D"])
+            self.write_call("Sys.init", 0)
+
+    def getvalue(self):
+        return "\n".join(self.lines + RETURN_CODE) + "\n"
+
+    def unique_label(self, kind):
+        self.label_counter += 1
+        return f"{kind}.{self.label_counter}"
+
+    def address(self, segment, index):
+        # instructions leaving the address of segment index in A
+        if segment == "static":
+            return [f"@{self.file_name}.{index}"]
+        elif segment in FIXED_BASES:
+            return [f"@{FIXED_BASES[segment] + index}"]
+        elif segment in BASE_REGISTERS:
+            base = BASE_REGISTERS[segment]
+            if index == 0:
+                return [f"@{base}", "A=M"]
+            elif index == 1:
+                return [f"@{base}", "A=M+1"]
+            return [f"@{index}", "D=A", f"@{base}", "A=D+M"]
+        raise HackBackendError(f"No address for {segment} {index}")
+
+    def load_d(self, segment, index):
+        # D = segment index
+        if segment == "constant" and index in [0, 1]:
+            return [f"D={index}"]
+        elif segment == "constant":
+            return [f"@{index}", "D=A"]
+        return self.address(segment, index) + ["D=M"]
+
+    def store_d(self, segment, index):
+        # segment index = D, through R13 when working out the address needs D
+        if segment == "constant":
+            raise HackBackendError(f"Cannot pop to constant {index}")
+        address = self.address(segment, index)
+        if "D=A" not in address:
+            return address + ["M=D"]
+        return ["@R13", "M=D"] + address[:-1] + ["D=D+M", "@R14", "M=D",
+                                                 "@R13", "D=M", "@R14", "A=M", "M=D"]
+
+    def label_name(self, label):
+        return f"{self.function_name}${label}"
+
+    def translate(self, file_name, commands):
+        # appends the assembly for one file's commands (a VMCode or tuples)
+        self.file_name = file_name
+        commands = list(commands)
+        i = 0
+        while i < len(commands):
+            command = commands[i]
+            following = commands[i + 1] if i + 1 < len(commands) else None
+            if command[0] == "push" and following is not None:
+                #push followed by something that takes the value right off the stack
+                if following[0] == "pop":
+                    self.lines.extend(self.load_d(*command[1:]) + self.store_d(*following[1:]))
+                    i += 2
+                    continue
+                elif following[0] == "if-goto":
+                    self.lines.extend(self.load_d(*command[1:]) +
+                                      [f"@{self.label_name(following[1])}", "D;JNE"])
+                    i += 2
+                    continue
+                elif following[0] in BINARY_OPS:
+                    self.lines.extend(self.load_d(*command[1:]) +
+                                      ["@SP", "A=M-1", BINARY_OPS[following[0]]])
+                    i += 2
+                    continue
+            self.write_command(command)
+            i += 1
+
+    def write_command(self, command):
+        op = command[0]
+        if op == "push":
+            self.lines.extend(self.load_d(command[1], command[2]) + PUSH_D)
+        elif op == "pop":
+            self.lines.extend(POP_D + self.store_d(command[1], command[2]))
+        elif op in BINARY_OPS:
+            self.lines.extend(POP_D + ["A=A-1", BINARY_OPS[op]])
+        elif op in UNARY_OPS:
+            self.lines.extend(["@SP", "A=M-1", UNARY_OPS[op]])
+        elif op in COMPARISON_JUMPS:
+            true_label = self.unique_label("$CMP")
+            #x - y, then replace it with true (-1) or false (0)
+            self.lines.extend(POP_D + ["A=A-1", "D=M-D", "M=-1", f"@{true_label}",
+                                       f"D;{COMPARISON_JUMPS[op]}", "@SP", "A=M-1", "M=0",
+                                       f"({true_label})"])
+        elif op == "label":
+            self.lines.append(f"({self.label_name(command[1])})")
+        elif op == "goto":
+            self.lines.extend([f"@{self.label_name(command[1])}", "0;JMP"])
+        elif op == "if-goto":
+            self.lines.extend(POP_D + [f"@{self.label_name(command[1])}", "D;JNE"])
+        elif op == "function":
+            self.write_function(command[1], command[2])
+        elif op == "call":
+            self.write_call(command[1], command[2])
+        elif op == "return":
+            self.lines.extend([f"@{RETURN_ROUTINE}", "0;JMP"])
+        else:
+            raise HackBackendError(f"Unknown VM command {op}")
+
+    def write_function(self, name, num_locals):
+        self.function_name = name
+        self.lines.append(f"({name})")
+        if num_locals == 1:
+            self.lines.extend(["D=0"] + PUSH_D)
+        elif num_locals > 1:
+            #zero the locals with one SP update
+            self.lines.extend(["@SP", "A=M"] + ["M=0", "A=A+1"] * (num_locals - 1) +
+                              ["M=0", "D=A+1", "@SP", "M=D"])
+
+    def write_call(self, name, num_args):
+        return_label = self.unique_label(f"{self.function_name}$ret")
+        self.lines.extend([f"@{return_label}", "D=A"] + PUSH_D)
+        for register in ["LCL", "ARG", "THIS", "THAT"]:
+            self.lines.extend([f"@{register}", "D=M"] + PUSH_D)
+        #ARG = SP - num_args - 5, LCL = SP
+        self.lines.extend(["@SP", "D=M", "@LCL", "M=D", f"@{num_args + 5}", "D=D-A", "@ARG", "M=D",
+                           f"@{name}", "0;JMP", f"({return_label})"])
+
+def defines_function(files, name):
+    return any(command[0] == "function" and command[1] == name for _, code in files for command in code)
+
+def translate_program(files, bootstrap = None):
+    # files is a list of (file name, commands), bootstrap defaults to whether Sys.init exists
+    if bootstrap is None:
+        bootstrap = defines_function(files, "Sys.init")
+    backend = HackBackend(bootstrap)
+    for file_name, code in files:
+        backend.translate(file_name, code)
+    return backend.getvalue()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python hack_backend.py <filename.vm> | <directory>")
+        sys.exit(1)
+
+    # a standalone VM translator for existing .vm files
+    source = sys.argv[1].rstrip(os.sep)
+    if os.path.isdir(source):
+        vm_files = sorted(os.path.join(source, name) for name in os.listdir(source) if name.endswith(".vm"))
+        asm_path = os.path.join(source, os.path.basename(source) + ".asm")
+    else:
+        vm_files = [source]
+        asm_path = os.path.splitext(source)[0] + ".asm"
+    files = []
+    for vm_path in vm_files:
+        with open(vm_path) as vm_file:
+            files.append((os.path.splitext(os.path.basename(vm_path))[0], VMCode.from_text(vm_file.read())))
+    with open(asm_path, "w") as asm_file:
+        asm_file.write(translate_program(files))
+    print(f"{source} -> {asm_path}")
@@ -0,0 +1,122 @@
+import sys
+import vm_optimizer
+from collections import Counter
+from vm_ir import VMCode
+from call_graph import functions
+from vm_interpreter import load_files
+
+# whole program inlining of trivial subroutines: calls to one line field getters
+# and setters and to subroutines returning a constant are replaced by the
+# commands the call would have run, on the receiver the caller pushed.
+#
+# An inlined getter or setter reaches the object through pointer 1 (that) and a
+# setter keeps the value in temp 0, the compiler sets both right before every use
+# so neither is live across a call. Anything else, or a call whose argument count
+# doesn't match, is left as a call.
+
+class Accessor(object):
+    __slots__ = ("kind", "file_name", "num_args", "body")
+
+    def __init__(self, kind, file_name, num_args, body):
+        # "getter", "setter", "constant" or "static", see classify
+        self.kind = kind
+        self.file_name = file_name
+        # arguments a call must pass, None when any count is fine
+        self.num_args = num_args
+        # commands leaving the result once the arguments are off the stack, or the
+        # whole replacement for getters and setters
+        self.body = body
+
+    def replacement(self, num_args):
+        if self.kind in ["getter", "setter"]:
+            return self.body
+        return [("pop", "temp", 0)] * num_args + self.body
+
+METHOD_PROLOGUE = [("push", "argument", 0), ("pop", "pointer", 0)]
+UNARY_OPS = [("neg",), ("not",)]
+
+def classify(file_name, commands):
+    # the Accessor for the commands of one function, None if it isn't trivial
+    if commands[0][2] != 0 or commands[-1] != ("return",):
+        return None
+    body = commands[1:-1]
+    is_method = body[:2] == METHOD_PROLOGUE
+    if is_method:
+        body = body[2:]
+
+    if is_method and len(body) == 1 and body[0][:2] == ("push", "this"):
+        return Accessor("getter", file_name, 1, [("pop", "pointer", 1), ("push", "that", body[0][2])])
+    elif (is_method and len(body) == 3 and body[0] == ("push", "argument", 1)
+          and body[1][:2] == ("pop", "this") and body[2] == ("push", "constant", 0)):
+        return Accessor("setter", file_name, 2, [("pop", "temp", 0), ("pop", "pointer", 1), ("push", "temp", 0),
+                                                 ("pop", "that", body[1][2]), ("push", "constant", 0)])
+    elif body and body[0][:2] == ("push", "constant") and all(command in UNARY_OPS for command in body[1:]):
+        return Accessor("constant", file_name, None, body)
+    elif not is_method and len(body) == 1 and body[0][:2] == ("push", "static"):
+        #statics belong to their file, so these only inline within it
+        return Accessor("static", file_name, None, body)
+    return None
+
+def find_accessors(files):
+    # function name -> Accessor for the trivial functions of files, a list of (file name, VMCode)
+    accessors = {}
+    for file_name, code in files:
+        for name, start, end in functions(code):
+            accessor = classify(file_name, list(code[start:end]))
+            if accessor is not None:
+                accessors[name] = accessor
+    return accessors
+
+class InlineStats(object):
+    def __init__(self):
+        self.accessors = 0
+        # calls inlined by accessor kind
+        self.inlined = Counter()
+        self.commands_before = 0
+        self.commands_after = 0
+
+    def summary(self):
+        kinds = ", ".join(f"{count} {kind}" for kind, count in sorted(self.inlined.items()))
+        return (f"inlined: {sum(self.inlined.values())} calls to {self.accessors} trivial subroutines"
+                + (f" ({kinds})" if kinds else "")
+                + f", {self.commands_before} -> {self.commands_after} commands")
+
+def inline_accessors(files, optimize = False):
+    # returns files with the calls to trivial subroutines inlined, in the same order, and an
+    # InlineStats. With optimize the peephole optimizer runs again over the functions changed
+    accessors = find_accessors(files)
+    stats = InlineStats()
+    stats.accessors = len(accessors)
+    inlined_files = []
+    for file_name, code in files:
+        inlined = VMCode(names = code.names)
+        for name, start, end in functions(code):
+            commands = []
+            changed = False
+            for command in code[start:end]:
+                accessor = accessors.get(command[1]) if command[0] == "call" else None
+                if (accessor is None or (accessor.kind == "static" and accessor.file_name != file_name)
+                        or (accessor.num_args is not None and accessor.num_args != command[2])):
+                    commands.append(command)
+                    continue
+                commands.extend(accessor.replacement(command[2]))
+                stats.inlined[accessor.kind] += 1
+                changed = True
+            if changed and optimize:
+                commands = vm_optimizer.optimize(commands)
+            inlined.extend(commands)
+        stats.commands_before += len(code)
+        stats.commands_after += len(inlined)
+        inlined_files.append((file_name, inlined))
+    return inlined_files, stats
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python inliner.py <directory>")
+        sys.exit(1)
+
+    # lists the trivial subroutines of a directory of .vm/.vmb files
+    files = load_files(sys.argv[1])
+    for name, accessor in sorted(find_accessors(files).items()):
+        print(f"{name}: {accessor.kind}")
+    print(inline_accessors(files)[1].summary())
@@ -1,6 +1,7 @@
 import jack_tokenizer as jt
-from jack_symbol_table import SymbolTable, JackSymbolNotFound
+from jack_symbol_table import SymbolTable
 from vm_writer import VMWriter
+from vm_optimizer import to_word
 
 class CompileError(Exception):
     pass
@@ -23,9 +24,13 @@ JACK_OP_TO_VM = {
     "|" : "or",
     "<" : "lt",
     ">" : "gt",
-    "=" : "eq",
-    "*" : "call Math.multiply 2",
-    "/" : "call Math.divide 2"
+    "=" : "eq"
+}
+
+# operators without a VM command are calls into the OS
+JACK_OP_TO_OS_CALL = {
+    "*" : "Math.multiply",
+    "/" : "Math.divide"
 }
 
 JACK_UNARY_OP_TO_VM = {
@@ -33,15 +38,92 @@ JACK_UNARY_OP_TO_VM = {
     "~" : "not"
 }
 
+JACK_KEYWORD_CONST_VALUES = {
+    "true" : -1,
+    "false" : 0,
+    "null" : 0
+}
+
+def divide(a, b):
+    #Math.divide rounds towards zero
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+JACK_OP_FOLDS = {
+    "+" : lambda a, b: a + b,
+    "-" : lambda a, b: a - b,
+    "*" : lambda a, b: a * b,
+    "/" : lambda a, b: divide(a, b) if b != 0 else None,
+    "&" : lambda a, b: a & b,
+    "|" : lambda a, b: a | b,
+    "<" : lambda a, b: -1 if a < b else 0,
+    ">" : lambda a, b: -1 if a > b else 0,
+    "=" : lambda a, b: -1 if a == b else 0
+}
+
+JACK_UNARY_OP_FOLDS = {
+    "-" : lambda a: -a,
+    "~" : lambda a: ~a
+}
+
+# most additions strength reduction emits in place of a multiplication
+MAX_DOUBLINGS = 8
+
+def fold_constant(op, left, right = None):
+    #value of a constant expression as the Hack machine computes it, None if it can't be done at compile time
+    if right is None:
+        return to_word(JACK_UNARY_OP_FOLDS[op](left))
+    value = JACK_OP_FOLDS[op](left, right)
+    return None if value is None else to_word(value)
+
+# what ends a nested expression: a ")" around it, the "]" of an array index
+# or the "," or ")" after a call argument
+PAREN_CLOSER = ")"
+INDEX_CLOSER = "]"
+ARGUMENT_CLOSER = ","
+
+class ExpressionFrame(object):
+    # an expression being compiled, see compile_expression
+    __slots__ = ("start", "closer", "data", "value", "op", "right_start", "unary_ops")
+
+    def __init__(self, start, closer = None, data = None):
+        self.start = start
+        self.closer = closer
+        # (name, token type) of the array for an index, (call name, arguments so far) for an argument
+        self.data = data
+        # constant value of what has been compiled so far, None if it isn't one
+        self.value = None
+        # operator waiting for its right operand, which starts at right_start
+        self.op = None
+        self.right_start = None
+        # (op, mark) of the unary ops in front of the current term
+        self.unary_ops = []
+
 class CompilationEngine:
-    def __init__(self, output_filepath, tokenizer):
-        self.vm_writer = VMWriter(output_filepath)
+    def __init__(self, output, tokenizer, fragment_cache = None, optimize = False, fold_constants = True,
+                 strength_reduction = True, intern_strings = False, class_index = None):
+        # output is anything VMWriter accepts: a path, a list, a stream or a VMSink
+        self.vm_writer = VMWriter(output, optimize = optimize)
         self.tokenizer = tokenizer
+        # a BuildCache to reuse the VM code of unchanged subroutines from
+        self.fragment_cache = fragment_cache
+        self.fragments_reused = 0
+        # evaluate constant expressions at compile time
+        self.fold_constants = fold_constants
+        # replace Math.multiply/divide by a constant with cheaper commands
+        self.strength_reduction = strength_reduction
+        # build each distinct string literal once and keep it in a static
+        self.intern_strings = intern_strings
+        self.pooled_strings = []
+        # a ClassIndex telling methods from functions at call sites, without one
+        # every call on an object or on this is compiled as a method call
+        self.class_index = class_index
         
-        self.symtab = SymbolTable()
-        self.class_symtab = SymbolTable()
+        self.class_symtab = self.new_symbol_table()
+        self.symtab = self.new_symbol_table(self.class_symtab)
         
         self.class_name = ""
+        self.subroutine_name = ""
         self.memory_chunks = 0
 
     def main(self):
@@ -61,6 +143,7 @@ class CompilationEngine:
         while self.tokenizer.current_token in ["function", "constructor", "method"]:
             self.compile_subroutine()
 
+        self.compile_string_builders()
         self.tokenizer.advance() #} end
         self.vm_writer.close()
 
@@ -92,16 +175,60 @@ class CompilationEngine:
 
         self.tokenizer.advance()
             
+    def new_symbol_table(self, parent = None):
+        return SymbolTable(parent)
+
     def compile_subroutine(self):
         self.vm_writer.write_comment("subroutine")
         #clear old symbol table
         self.if_counter = -1
         self.while_counter = -1
+        self.string_counter = -1
         
-        self.symtab = SymbolTable()
+        self.symtab = self.new_symbol_table(self.class_symtab)
 
         #counters for labels
 
+        if self.fragment_cache is not None and self.tokenizer.mode in ["array", "mmap"]:
+            self.compile_cached_subroutine()
+        else:
+            self.compile_subroutine_declaration()
+
+    def compile_cached_subroutine(self):
+        #reuse the code of a subroutine whose tokens and class state haven't changed
+        start = self.tokenizer.cursor
+        end = self.tokenizer.find_block_end(start)
+        key = self.fragment_cache.key(self.subroutine_fingerprint(start, end), self.codegen_options())
+
+        fragment = self.fragment_cache.get(key)
+        if fragment is not None:
+            self.vm_writer.write_raw(fragment)
+            if self.intern_strings:
+                #the literals the cached code uses still need their statics
+                for string in self.tokenizer.string_constants(start, end + 1):
+                    self.pool_string(string)
+            self.tokenizer.seek(end + 1) #past the closing }
+            self.fragments_reused += 1
+            return
+
+        self.vm_writer.start_capture()
+        self.compile_subroutine_declaration()
+        self.fragment_cache.put(key, self.vm_writer.end_capture())
+
+    def subroutine_fingerprint(self, start, end):
+        #everything the code of the subroutine between tokens start and end depends on
+        class_state = [(symbol.name, symbol.type, symbol.kind, symbol.index)
+                       for symbol in self.class_symtab.symbols.values()]
+        header = repr((self.class_name, self.memory_chunks, class_state,
+                       self.if_counter, self.while_counter, self.string_counter))
+        return "\0".join([header] + self.tokenizer.token_texts(start, end + 1)).encode()
+
+    def codegen_options(self):
+        #settings that change the generated code
+        return (self.vm_writer.optimize, self.fold_constants, self.strength_reduction,
+                self.intern_strings, None if self.class_index is None else self.class_index.digest())
+
+    def compile_subroutine_declaration(self):
         self.sub_keyword = self.tokenizer.current_token
         self.tokenizer.advance() #keyword
         #!!!
@@ -263,19 +390,17 @@ class CompilationEngine:
             self.find_segment_and_pop(name)
             
 
+    def resolve_symbol(self, name):
+        #subroutine scope first, then the class
+        symbol = self.symtab.resolve(name)
+        if symbol is None:
+            raise CompileError(f"Undefined variable {name} in {self.subroutine_name}")
+        return symbol
+
     def find_segment_and_pop(self, name):
         #pop off whatever into assigned var
-        try:
-            segment = self.symtab.kind_of(name)
-            index = self.symtab.index_of(name)
-        except JackSymbolNotFound:
-            if self.class_symtab.kind_of(name)== "field":
-                segment = "this"
-            else:
-                segment = self.class_symtab.kind_of(name)
-            index = self.class_symtab.index_of(name)
-            
-        self.vm_writer.write_pop(segment, index)
+        symbol = self.resolve_symbol(name)
+        self.vm_writer.write_pop(symbol.segment, symbol.index)
 
     def find_segment_and_push(self, name, token_type):
         #pop off whatever into assigned var
@@ -297,6 +422,8 @@ class CompilationEngine:
                 
         elif token_type == jt.JackTokenType.INT_CONST:
             self.vm_writer.write_push("constant", name)
+        elif token_type == jt.JackTokenType.STRING_CONST and self.intern_strings:
+            self.push_pooled_string(name)
         elif token_type == jt.JackTokenType.STRING_CONST:
             string = name[1:-1]
             self.vm_writer.write_push("constant", len(string))
@@ -306,18 +433,44 @@ class CompilationEngine:
                 self.vm_writer.write_push("constant", ord(c))
                 self.vm_writer.write_call("String.appendChar", 2)
         else:
-            try:
-                segment = self.symtab.kind_of(name)
-                index = self.symtab.index_of(name)
-            except JackSymbolNotFound:
-                segment = self.class_symtab.kind_of(name)
-                if segment == "field":
-                    segment = "this"
-
-                index = self.class_symtab.index_of(name)
-
-            self.vm_writer.write_push(segment, index)
+            symbol = self.resolve_symbol(name)
+            self.vm_writer.write_push(symbol.segment, symbol.index)
    
+    def pool_string(self, literal):
+        #the static holding literal (quotes included), which can't clash with a variable name
+        symbol = self.class_symtab.resolve(literal)
+        if symbol is None:
+            self.class_symtab.define({"name" : literal,
+                                      "type" : "String",
+                                      "kind" : "static"})
+            symbol = self.class_symtab.resolve(literal)
+            self.pooled_strings.append(symbol)
+        return symbol
+
+    def push_pooled_string(self, literal):
+        #build the string the first time this is run, afterwards just push the static
+        symbol = self.pool_string(literal)
+        self.string_counter += 1
+        string_counter = self.string_counter
+        self.vm_writer.write_push("static", symbol.index)
+        self.vm_writer.write_if(f"STRING_READY{string_counter}")
+        self.vm_writer.write_call(f"{self.class_name}.__string{symbol.index}", 0)
+        self.vm_writer.write_pop("static", symbol.index)
+        self.vm_writer.write_label(f"STRING_READY{string_counter}")
+        self.vm_writer.write_push("static", symbol.index)
+
+    def compile_string_builders(self):
+        #one function per pooled literal returning a new String with its characters
+        for symbol in self.pooled_strings:
+            string = symbol.name[1:-1]
+            self.vm_writer.write_function(f"{self.class_name}.__string{symbol.index}", 0)
+            self.vm_writer.write_push("constant", len(string))
+            self.vm_writer.write_call("String.new", 1)
+            for c in string:
+                self.vm_writer.write_push("constant", ord(c))
+                self.vm_writer.write_call("String.appendChar", 2)
+            self.vm_writer.write_return()
+
     def compile_while(self):
         self.vm_writer.write_comment("while")
         self.while_counter += 1
@@ -380,119 +533,214 @@ class CompilationEngine:
 
         self.vm_writer.write_label(f"IF_END{if_counter}")
 
+    def write_folded(self, start, value):
+        #replace everything written since start by the constant it computes
+        self.vm_writer.rewind(start)
+        self.vm_writer.write_constant(value)
+        return value
+
+    def reduce_strength(self, op, start, right_start, left, right):
+        #cheaper code for * or / by a constant than the Math call, False if there isn't any
+        factor = right if right is not None else (left if op == "*" else None)
+        if factor is None:
+            return False
+
+        factor = to_word(factor)
+        magnitude = abs(factor)
+        doublings = magnitude.bit_length() - 1
+        if op == "*" and factor == 0:
+            pass
+        elif magnitude == 0 or magnitude & (magnitude - 1) != 0 or doublings > MAX_DOUBLINGS:
+            return False
+        elif op == "/" and magnitude != 1:
+            return False
+
+        #take the constant out, leaving the code of the other operand
+        if right is not None:
+            self.vm_writer.rewind(right_start)
+            operand = self.vm_writer.cut(start)
+        else:
+            operand = self.vm_writer.cut(right_start)
+            self.vm_writer.rewind(start)
+
+        if factor == 0:
+            if any(command[0] == "call" for command in operand):
+                #keep the side effects of the other operand
+                self.vm_writer.paste(operand)
+                self.vm_writer.write_pop("temp", 0)
+            self.vm_writer.write_push("constant", 0)
+            return True
+
+        self.vm_writer.paste(operand)
+        for i in range(doublings):
+            if i == 0 and len(operand) == 1 and operand[0][0] == "push":
+                #a plain push can just be repeated
+                self.vm_writer.paste(operand)
+            else:
+                self.vm_writer.write_pop("temp", 0)
+                self.vm_writer.write_push("temp", 0)
+                self.vm_writer.write_push("temp", 0)
+            self.vm_writer.write_arithmetic("add")
+        if factor < 0:
+            self.vm_writer.write_arithmetic("neg")
+        return True
+
     def compile_expression(self):
+        #returns the value of the expression if it's a constant, else None
+        #nested terms are kept on an explicit stack of ExpressionFrames, so
+        #neither long operator chains nor deep nesting recurse
         self.vm_writer.write_comment("(expression)")
-        self.compile_term()
+        stack = [ExpressionFrame(self.vm_writer.mark())]
+        while True:
+            frame = stack[-1]
+            token = self.tokenizer.current_token
 
-        if self.tokenizer.current_token in JACK_OPS:
-            op = self.tokenizer.current_token #this needs to go last
-            self.tokenizer.advance() #op
-            self.compile_term()
-            self.vm_writer.write_arithmetic(JACK_OP_TO_VM[op]) #also handles * and /
-        
+            if token in JACK_UNARY_OPS:
+                frame.unary_ops.append((token, self.vm_writer.mark()))
+                self.tokenizer.advance() #unary op
+                continue
 
-    def compile_term(self):
-        self.vm_writer.write_comment("term")
+            if token == "(":
+                self.tokenizer.advance() #(
+                stack.append(ExpressionFrame(self.vm_writer.mark(), PAREN_CLOSER))
+                continue
 
-        if self.tokenizer.current_token in JACK_UNARY_OPS:
-            unary_op = self.tokenizer.current_token
-            self.tokenizer.advance() #unary_up
-            self.compile_term()
-            self.vm_writer.write_arithmetic(JACK_UNARY_OP_TO_VM[unary_op])
-            
-        elif self.tokenizer.current_token == "(":
-            self.tokenizer.advance() #(
-            self.compile_expression()
-            self.tokenizer.advance() #)
-            
-        else:
-            name = self.tokenizer.current_token
+            name = token
             token_type = self.tokenizer.token_type()
             self.tokenizer.advance() #varName
-
-            if self.tokenizer.current_token == "(":
-                self.vm_writer.write_comment("(subroutine call - no class specified")
-                #subroutineCall
-                #if its a method need to push base address
-                # assume it's always a method if no name before .
-                self.vm_writer.write_push("pointer", 0)
-                self.tokenizer.advance() #(
-                num_args = self.compile_expression_list() + 1
-
-                self.vm_writer.write_call(f"{self.class_name}.{name}", num_args)
+            value = None
+            if self.tokenizer.current_token == "[":
+                self.tokenizer.advance() #[
+                stack.append(ExpressionFrame(self.vm_writer.mark(), INDEX_CLOSER, (name, token_type)))
+                continue
+            elif self.tokenizer.current_token in ["(", "."]:
+                call = self.compile_call_target(name)
+                if self.tokenizer.current_token != ")":
+                    stack.append(ExpressionFrame(self.vm_writer.mark(), ARGUMENT_CLOSER, call))
+                    continue
                 self.tokenizer.advance() #)
+                self.vm_writer.write_call(call[0], call[1])
+            else:
+                self.find_segment_and_push(name, token_type)
+                if token_type == jt.JackTokenType.INT_CONST:
+                    value = int(name)
+                elif token_type == jt.JackTokenType.KEYWORD:
+                    value = JACK_KEYWORD_CONST_VALUES.get(name)
+
+            #the term is done, fold it into its expression and close every expression it finishes
+            while True:
+                self.finish_term(frame, value)
+                if self.tokenizer.current_token in JACK_OPS:
+                    frame.op = self.tokenizer.current_token
+                    self.tokenizer.advance() #op
+                    frame.right_start = self.vm_writer.mark()
+                    break
+
+                stack.pop()
+                value = frame.value
+                if frame.closer is None:
+                    return value
+                elif frame.closer == PAREN_CLOSER:
+                    self.tokenizer.advance() #)
+                elif frame.closer == INDEX_CLOSER:
+                    self.find_segment_and_push(*frame.data)
+                    self.vm_writer.write_arithmetic("add")
+                    self.vm_writer.write_pop("pointer", 1)
+                    self.tokenizer.advance() #]
+                    self.vm_writer.write_push("that", 0)
+                    value = None
+                else:
+                    call_name, num_args = frame.data
+                    if self.tokenizer.current_token == ",":
+                        #next argument of the same call
+                        self.tokenizer.advance() #,
+                        stack.append(ExpressionFrame(self.vm_writer.mark(), ARGUMENT_CLOSER,
+                                                     (call_name, num_args + 1)))
+                        break
+                    self.tokenizer.advance() #)
+                    self.vm_writer.write_call(call_name, num_args + 1)
+                    value = None
+                frame = stack[-1]
+
+    def finish_term(self, frame, value):
+        #applies the term's unary ops and the pending operator of its expression
+        while frame.unary_ops:
+            unary_op, start = frame.unary_ops.pop()
+            if self.fold_constants and value is not None:
+                value = self.write_folded(start, fold_constant(unary_op, value))
+            else:
+                self.vm_writer.write_arithmetic(JACK_UNARY_OP_TO_VM[unary_op])
+                value = None
 
-            elif self.tokenizer.current_token == ".":
-                self.vm_writer.write_comment("(subroutine call)")
+        op = frame.op
+        if op is None:
+            frame.value = value
+            return
+        frame.op = None
+        left = frame.value
+        frame.value = None
+        if self.fold_constants and left is not None and value is not None:
+            folded = fold_constant(op, left, value)
+            if folded is not None:
+                frame.value = self.write_folded(frame.start, folded)
+                return
+
+        if (self.strength_reduction and op in JACK_OP_TO_OS_CALL
+                and self.reduce_strength(op, frame.start, frame.right_start, left, value)):
+            return
 
-                num_args = 0
-                if not (self.symtab.exists(name) or self.class_symtab.exists(name)):
-                    #then must be a function call, or constructor, don't push the object
-                    class_name = name
-                else:
-                    #its a method! push address to stack
-                    num_args += 1
-                    self.find_segment_and_push(name, "")
-                    try:
-                        class_name = self.symtab.type_of(name)
-                    except:
-                        class_name = self.class_symtab.type_of(name)
-                        
-                self.tokenizer.advance() #.
-                sub_name = self.tokenizer.current_token
-                self.tokenizer.advance() #name
+        if op in JACK_OP_TO_OS_CALL:
+            self.vm_writer.write_call(JACK_OP_TO_OS_CALL[op], 2)
+        else:
+            self.vm_writer.write_arithmetic(JACK_OP_TO_VM[op])
 
-                self.tokenizer.advance() #(
-                num_args += self.compile_expression_list()
-                self.tokenizer.advance() #)
+    def compile_call_target(self, name):
+        #compiles up to the arguments of a call whose name has just been read,
+        #returns the full name and the number of arguments pushed so far
+        if self.tokenizer.current_token == "(":
+            self.vm_writer.write_comment("(subroutine call - no class specified")
+            self.tokenizer.advance() #(
+            #if its a method need to push base address
+            if self.is_method(self.class_name, name):
+                self.vm_writer.write_push("pointer", 0)
+                return f"{self.class_name}.{name}", 1
+            return f"{self.class_name}.{name}", 0
 
-                self.vm_writer.write_call(f"{class_name}.{sub_name}", num_args) #need to convert name to type_of if not class
-                
-            elif self.tokenizer.current_token == "[":
-                # array expression
-                self.tokenizer.advance() #[
-                self.compile_expression() #expression
-                self.find_segment_and_push(name, token_type)
-                self.vm_writer.write_arithmetic("add")
-                self.vm_writer.write_pop("pointer", 1)
-                self.tokenizer.advance() #]
-                self.vm_writer.write_push("that", 0)
+        self.vm_writer.write_comment("(subroutine call)")
+        num_args = 0
+        symbol = self.symtab.resolve(name)
+        self.tokenizer.advance() #.
+        sub_name = self.tokenizer.current_token
+        self.tokenizer.advance() #name
+        self.tokenizer.advance() #(
+        if symbol is None:
+            #then must be a function call, or constructor, don't push the object
+            class_name = name
+        else:
+            #its a method! push address to stack
+            class_name = symbol.type
+            if self.is_method(class_name, sub_name):
+                num_args += 1
+                self.vm_writer.write_push(symbol.segment, symbol.index)
+        return f"{class_name}.{sub_name}", num_args
 
-            else:
-                self.find_segment_and_push(name, token_type)
+    def is_method(self, class_name, sub_name):
+        #whether a call to class_name.sub_name passes an object, anything the
+        #class index doesn't know (like the OS classes) is taken to be a method
+        if self.class_index is None:
+            return True
+        subroutine = self.class_index.subroutine(class_name, sub_name)
+        return subroutine is None or subroutine.kind == "method"
 
     def compile_subroutine_call(self):
         # this is just a do call
-        num_args = 0
         name = self.tokenizer.current_token
 
         self.tokenizer.advance() #class/subrotuineName
-        if self.tokenizer.current_token == ".":
-            if not (self.symtab.exists(name) or self.class_symtab.exists(name)):
-                #then must be a function call, or constructor, don't push the object
-                class_name = name
-            else:
-                #its a method!
-                num_args += 1
-                self.find_segment_and_push(name, "")
-                try:
-                    class_name = self.symtab.type_of(name)
-                except:
-                    class_name = self.class_symtab.type_of(name)
-            
-            self.tokenizer.advance() #.
-            name = self.tokenizer.current_token
-            self.tokenizer.advance() #methodName
-        else:
-            #its this class method
-            self.vm_writer.write_push("pointer", 0)
-            num_args += 1
-            class_name = self.class_name
-
-        self.tokenizer.advance() #(
+        full_name, num_args = self.compile_call_target(name)
         num_args += self.compile_expression_list()
 
-        self.vm_writer.write_call(f"{class_name}.{name}", num_args)
+        self.vm_writer.write_call(full_name, num_args)
         self.tokenizer.advance() #)
 
     def compile_expression_list(self):
@@ -1,36 +1,445 @@
+import io
 import os
 import sys
+import time
+import argparse
 import jack_tokenizer as jt
 import jack_compilation_engine as jce
+import vm_binary
+import hack_backend
+from call_graph import eliminate_dead_code
+from inliner import inline_accessors
+from vm_ir import VMCode
+from vm_writer import DEFAULT_BUFFER_SIZE, BufferedFileSink, BinarySink, IRSink, ListSink, StreamSink
+from class_index import ClassIndex, scan_class
+from build_cache import BuildCache, CacheStats, DEFAULT_CACHE_SIZE
+from compile_stats import BuildStats, FileStats, InstrumentedCompilationEngine, StatsSink, time_scanning
 
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 import glob
 
+# settings for compiling one file, passed as is to worker processes
+CompileOptions = namedtuple("CompileOptions", ["scan_mode", "buffer_size", "cache_dir", "cache_size",
+                                               "optimize", "fold_constants", "strength_reduction",
+                                               "intern_strings", "output_format", "collect_stats",
+                                               "class_index", "whole_program", "inline_accessors"],
+                            defaults = ["array", DEFAULT_BUFFER_SIZE, None, DEFAULT_CACHE_SIZE, False, True,
+                                        True, False, "vm", False, None, False, False])
+
+# the ClassIndex of the files compiled is kept in the cache directory under this name
+CLASS_INDEX_FILE = "classes.json"
+
+# asm writes one Hack assembly file for all the files compiled together
+OUTPUT_FORMATS = ["vm", "vmb", "asm"]
+
+# error is None when the file compiled, status is "compiled", "kept", "restored" or,
+# for whole program builds, "eliminated" when none of the file's code is reachable,
+# commands_removed counts what the peephole optimizer took out, code holds the
+# commands as a VMCode for the asm backend, stats is a FileStats when collect_stats is set
+CompileResult = namedtuple("CompileResult", ["jack_file", "vm_file", "error", "status", "commands_removed",
+                                             "code", "stats"],
+                           defaults = ["compiled", 0, None, None])
+
+def codegen_options(options):
+    # the options that change the generated VM code, part of the build cache key
+    return (options.optimize, options.fold_constants, options.strength_reduction, options.intern_strings,
+            None if options.class_index is None else options.class_index.digest())
+
+def build_class_index(jack_file, options = CompileOptions()):
+    # the ClassIndex of the project (directory) jack_file is in or is, with cache_dir it's
+    # stored there and only changed files are scanned again
+    directory = jack_file if os.path.isdir(jack_file) else os.path.dirname(os.path.abspath(jack_file))
+    index_file = None if options.cache_dir is None else os.path.join(options.cache_dir, CLASS_INDEX_FILE)
+    if index_file is not None:
+        os.makedirs(options.cache_dir, exist_ok = True)
+    return ClassIndex.build(sorted(glob.glob(f"{directory}/*.jack")), index_file)
+
+def evict_cache(options):
+    # trims the build cache of options.cache_dir to cache_size entries, returns how many went
+    cache = BuildCache(options.cache_dir, options.cache_size)
+    return cache.evict() + cache.fragment_cache().evict()
+
+def compile_file(jack_file, options = CompileOptions()):
+    # compiles one .jack file to the .vm (or .vmb) file next to it, runs in worker processes too
+    if not options.collect_stats:
+        return _compile_file(jack_file, options)
+    stats = FileStats(jack_file)
+    start = time.perf_counter()
+    result = _compile_file(jack_file, options, stats)
+    stats.total = time.perf_counter() - start
+    stats.status = result.status if result.error is None else "error"
+    return result._replace(stats = stats)
+
+def compile_source(source, options = CompileOptions()):
+    # compiles one class held in memory, str or bytes, and returns its VM text. Without
+    # a class_index in options calls are resolved against the class itself
+    sink = ListSink()
+    _compile_to(_source_stream(source), sink, _with_own_index(source, options))
+    return sink.getvalue()
+
+def compile_stream(input_stream, output_stream, options = CompileOptions()):
+    # compiles the class read from input_stream into output_stream, returns the number of
+    # commands the optimizer removed. VM text goes out a function at a time; vmb output needs
+    # a binary stream, asm a text one. Neither stream is closed, calls are resolved like compile_source
+    source = input_stream.read()
+    source_stream = _source_stream(source)
+    options = _with_own_index(source, options)
+    if options.output_format == "vm":
+        compilation_engine = _compile_to(source_stream, StreamSink(output_stream), options)
+        return compilation_engine.vm_writer.commands_removed
+
+    sink = IRSink()
+    compilation_engine = _compile_to(source_stream, sink, options)
+    if options.output_format == "vmb":
+        output_stream.write(vm_binary.encode(sink.code))
+    else:
+        output_stream.write(hack_backend.translate_program([(compilation_engine.class_name, sink.code)]))
+    output_stream.flush()
+    return compilation_engine.vm_writer.commands_removed
+
+def _with_own_index(source, options):
+    if options.class_index is not None:
+        return options
+    return options._replace(class_index = ClassIndex([scan_class(source)]))
+
+def _source_stream(source):
+    if isinstance(source, str):
+        source = source.encode("utf-8")
+    return io.BytesIO(source)
+
+def _compile_file(jack_file, options, stats = None):
+    out_file = os.path.splitext(jack_file)[0] + "." + options.output_format
+    try:
+        if options.output_format == "asm" or options.whole_program or options.inline_accessors:
+            return _compile_code(jack_file, options, stats)
+        elif options.cache_dir is None:
+            return _compile_uncached(jack_file, out_file, options, stats)
+        return _compile_cached(jack_file, out_file, options, stats)
+    except Exception as e:
+        return CompileResult(jack_file, out_file, f"{type(e).__name__}: {e}")
+
+def _compile_uncached(jack_file, out_file, options, stats = None):
+    # written to a temporary file renamed over out_file once the compile succeeds,
+    # a failed compile leaves the last good output in place
+    temp_path = f"{out_file}.{os.getpid()}.tmp"
+    if options.output_format == "vmb":
+        sink = BinarySink(temp_path)
+    else:
+        sink = BufferedFileSink(temp_path, options.buffer_size)
+    try:
+        compilation_engine = _compile_to(jack_file, sink, options, stats = stats)
+    except BaseException:
+        sink.close()
+        os.remove(temp_path)
+        raise
+    os.replace(temp_path, out_file)
+    return CompileResult(jack_file, out_file, None, "compiled", compilation_engine.vm_writer.commands_removed)
+
+def _compile_to(jack_file, sink, options, fragment_cache = None, stats = None):
+    # jack_file is a path or a binary file-like object
+    if stats is not None:
+        return _compile_instrumented(jack_file, sink, options, fragment_cache, stats)
+    tokenizer = jt.JackTokenizer(jack_file, options.scan_mode)
+    try:
+        compilation_engine = jce.CompilationEngine(sink, tokenizer, fragment_cache, options.optimize,
+                                                   options.fold_constants, options.strength_reduction,
+                                                   options.intern_strings, options.class_index)
+        compilation_engine.main()
+    finally:
+        tokenizer.close()
+    return compilation_engine
+
+def _compile_instrumented(jack_file, sink, options, fragment_cache, stats):
+    # _compile_to filling in stats, compile time leaves out the time spent writing and,
+    # in the scan modes that tokenize as they go, scanning
+    stats.bytes_read = os.path.getsize(jack_file)
+    start = time.perf_counter()
+    tokenizer = jt.JackTokenizer(jack_file, options.scan_mode)
+    stats.phases["tokenize"] = opened = time.perf_counter() - start
+    stats.tokens = tokenizer.token_count()
+    if stats.tokens is None:
+        time_scanning(tokenizer, stats)
+    try:
+        start = time.perf_counter()
+        compilation_engine = InstrumentedCompilationEngine(stats, StatsSink(sink, stats), tokenizer,
+                                                           fragment_cache, options.optimize,
+                                                           options.fold_constants, options.strength_reduction,
+                                                           options.intern_strings, options.class_index)
+        compilation_engine.main()
+        stats.phases["compile"] = time.perf_counter() - start - stats.phases["write"]
+        if tokenizer.token_count() is None:
+            stats.phases["compile"] -= stats.phases["tokenize"] - opened
+    finally:
+        tokenizer.close()
+    return compilation_engine
+
+def _compile_code(jack_file, options, stats = None):
+    # compiles to a VMCode instead of a file, the asm backend takes it from there
+    if options.cache_dir is None:
+        sink = IRSink()
+        compilation_engine = _compile_to(jack_file, sink, options, stats = stats)
+        return CompileResult(jack_file, None, None, "compiled", compilation_engine.vm_writer.commands_removed,
+                             sink.code)
+    vm_text, status, commands_removed = _cached_vm_text(jack_file, options, stats)
+    return CompileResult(jack_file, None, None, status, commands_removed, VMCode.from_text(vm_text))
+
+def _compile_cached(jack_file, out_file, options, stats = None):
+    # entries are always VM text, .vmb output is encoded from it
+    vm_text, status, commands_removed = _cached_vm_text(jack_file, options, stats)
+    if status == "restored" and _read_output(out_file, options) == _output(vm_text, options):
+        return CompileResult(jack_file, out_file, None, "kept")
+
+    with open(out_file, "wb") as vm_file:
+        vm_file.write(_output(vm_text, options))
+    return CompileResult(jack_file, out_file, None, status, commands_removed)
+
+def _cached_vm_text(jack_file, options, stats = None):
+    # (VM text, "restored" or "compiled", commands removed)
+    cache = BuildCache(options.cache_dir, options.cache_size)
+    with open(jack_file, "rb") as source_file:
+        key = cache.key(source_file.read(), codegen_options(options))
+
+    vm_text = cache.get(key)
+    if vm_text is not None:
+        return vm_text, "restored", 0
+
+    #unchanged subroutines of an edited file come from the cache too
+    sink = ListSink()
+    compilation_engine = _compile_to(jack_file, sink, options, cache.fragment_cache(), stats)
+    vm_text = sink.getvalue()
+    cache.put(key, vm_text)
+    return vm_text, "compiled", compilation_engine.vm_writer.commands_removed
+
+def _output(vm_text, options):
+    # the bytes written to the output file for vm_text
+    if options.output_format == "vmb":
+        return vm_binary.encode(VMCode.from_text(vm_text))
+    return vm_text.encode()
+
+def _read_output(path, options):
+    try:
+        with open(path, "rb") as out_file:
+            return out_file.read()
+    except FileNotFoundError:
+        return None
+
 class JackCompiler:
-    def __init__(self, jack_file):
+    def __init__(self, jack_file, scan_mode = "array", buffer_size = DEFAULT_BUFFER_SIZE, jobs = 1,
+                 cache_dir = None, cache_size = DEFAULT_CACHE_SIZE, optimize = False, fold_constants = True,
+                 strength_reduction = True, intern_strings = False, output_format = "vm",
+                 collect_stats = False, whole_program = False, inline_accessors = False):
         self.jack_file = jack_file
+        self.options = CompileOptions(scan_mode, buffer_size, cache_dir, cache_size, optimize,
+                                      fold_constants, strength_reduction, intern_strings, output_format,
+                                      collect_stats, whole_program = whole_program,
+                                      inline_accessors = inline_accessors)
+        self.jobs = jobs
+        self.cache_stats = None
+        # BuildStats of the last build when collect_stats is set, see also add_hook
+        self.stats = None
+        # the ClassIndex the last build resolved calls with
+        self.class_index = None
+        # DeadCodeStats of the last whole program build
+        self.dead_code = None
+        # InlineStats of the last build with inline_accessors
+        self.inlined = None
+        self.hooks = []
         if os.path.isdir(jack_file):
-            self.jack_files = list(glob.glob(f"{jack_file}/*.jack"))
+            self.jack_files = sorted(glob.glob(f"{jack_file}/*.jack"))
+            self.asm_file = os.path.join(jack_file, os.path.basename(os.path.normpath(jack_file)) + ".asm")
         else:
             self.jack_files = [jack_file]
+            self.asm_file = os.path.splitext(jack_file)[0] + ".asm"
+
+    def add_hook(self, hook):
+        # hook(result) runs as each file's result comes in, with result.stats filled in
+        self.hooks.append(hook)
+        self.options = self.options._replace(collect_stats = True)
 
     def main(self):
-        for file in self.jack_files:
-            out_file = os.path.splitext(file)[0] + ".vm"
-            tokenizer = jt.JackTokenizer(file)
-            compilation_engine = jce.CompilationEngine(out_file, tokenizer)
-            compilation_engine.main()
-            tokenizer.close()
+        # returns a CompileResult per file, in the same order as jack_files
+        self.class_index = build_class_index(self.jack_file, self.options)
+        self.options = self.options._replace(class_index = self.class_index)
+        if self.jobs > 1 and len(self.jack_files) > 1:
+            with ProcessPoolExecutor(max_workers = self.jobs) as executor:
+                results = self._run_hooks(executor.map(compile_file, self.jack_files, repeat(self.options)))
+        else:
+            results = self._run_hooks(compile_file(file, self.options) for file in self.jack_files)
+        if self.options.collect_stats:
+            self.stats = BuildStats([result.stats for result in results])
+
+        if self.options.cache_dir is not None:
+            self.cache_stats = self._update_cache(results)
+        if self.options.inline_accessors:
+            results = self._inline_accessors(results)
+        if self.options.whole_program:
+            results = self._eliminate_dead_code(results)
+        if self.options.output_format == "asm":
+            results = self._write_asm(results)
+        elif self.options.whole_program or self.options.inline_accessors:
+            results = self._write_outputs(results)
+        return results
+
+    def _run_hooks(self, results):
+        collected = []
+        for result in results:
+            for hook in self.hooks:
+                hook(result)
+            collected.append(result)
+        return collected
+
+    def _program(self, results):
+        # (file name, VMCode) of each file, as the whole program passes take them
+        return [(os.path.splitext(os.path.basename(result.jack_file))[0], result.code) for result in results]
+
+    def _inline_accessors(self, results):
+        # like dead code elimination, only done when every file compiled
+        if any(result.error is not None for result in results):
+            return results
+        files, self.inlined = inline_accessors(self._program(results), self.options.optimize)
+        return [result._replace(code = code) for result, (_, code) in zip(results, files)]
+
+    def _eliminate_dead_code(self, results):
+        # the call graph needs every file, with errors the code is written as compiled
+        if any(result.error is not None for result in results):
+            return results
+        files, self.dead_code = eliminate_dead_code(self._program(results))
+        return [result._replace(code = code, status = "eliminated" if len(code) == 0 else result.status)
+                for result, (_, code) in zip(results, files)]
+
+    def _write_outputs(self, results):
+        # the .vm (or .vmb) files of a whole program build, files with no code left get
+        # none and an out of date one is removed
+        written = []
+        for result in results:
+            if result.error is not None:
+                written.append(result)
+                continue
+            out_file = os.path.splitext(result.jack_file)[0] + "." + self.options.output_format
+            if result.status == "eliminated":
+                if os.path.exists(out_file):
+                    os.remove(out_file)
+                written.append(result)
+                continue
+            with open(out_file, "wb") as vm_file:
+                vm_file.write(_output(result.code.to_text(), self.options))
+            written.append(result._replace(vm_file = out_file))
+        return written
+
+    def _write_asm(self, results):
+        # one .asm for every file, only written when they all compiled
+        if any(result.error is not None for result in results):
+            return results
+        with open(self.asm_file, "w") as asm_file:
+            asm_file.write(hack_backend.translate_program(self._program(results)))
+        return [result if result.status == "eliminated" else result._replace(vm_file = self.asm_file)
+                for result in results]
+
+    def _update_cache(self, results):
+        stats = CacheStats()
+        for result in results:
+            if result.error is not None:
+                continue
+            elif result.status == "kept":
+                stats.kept += 1
+            elif result.status == "restored":
+                stats.restored += 1
+            else:
+                stats.misses += 1
+
+        stats.evicted = evict_cache(self.options)
+        cache = BuildCache(self.options.cache_dir, self.options.cache_size)
+        fragment_cache = cache.fragment_cache()
+        stats.entries, stats.size = cache.usage()
+        stats.fragments, fragments_size = fragment_cache.usage()
+        stats.size += fragments_size
+        return stats
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python jack_compiler.py <filename.jack> | <directory>")
+    parser = argparse.ArgumentParser(usage = "python jack_compiler.py <filename.jack> | <directory> | -")
+    parser.add_argument("jack_file", help = "- reads one class from stdin and writes the compiled code to stdout")
+    parser.add_argument("-j", "--jobs", type = int, default = 1,
+                        help = "number of worker processes compiling a directory")
+    parser.add_argument("--scan-mode", choices = jt.SCAN_MODES, default = "array",
+                        help = "tokenizer backend")
+    parser.add_argument("-O", "--optimize", action = "store_true",
+                        help = "run the peephole optimizer over the generated code")
+    parser.add_argument("--no-fold", dest = "fold_constants", action = "store_false",
+                        help = "don't evaluate constant expressions at compile time")
+    parser.add_argument("--no-strength-reduction", dest = "strength_reduction", action = "store_false",
+                        help = "always call Math.multiply and Math.divide for * and /")
+    parser.add_argument("--intern-strings", action = "store_true",
+                        help = "build each distinct string literal of a class once and reuse it")
+    parser.add_argument("--format", dest = "output_format", choices = OUTPUT_FORMATS, default = "vm",
+                        help = "write VM text or the compact binary encoding")
+    parser.add_argument("--whole-program", action = "store_true",
+                        help = "leave out the subroutines never called from Main.main (or Sys.init)")
+    parser.add_argument("--inline", dest = "inline_accessors", action = "store_true",
+                        help = "replace calls to trivial getters, setters and constant subroutines by their code")
+    parser.add_argument("--stats", action = "store_true",
+                        help = "print the time and counters of each file, slowest first")
+    parser.add_argument("--stats-json", help = "write the time and counters of each file to this JSON file")
+    parser.add_argument("--cache-dir",
+                        help = "skip files whose compiled output is already cached in this directory")
+    parser.add_argument("--cache-size", type = int, default = DEFAULT_CACHE_SIZE,
+                        help = "most entries kept in the build cache")
+    args = parser.parse_args()
+
+    jack_file = args.jack_file
+    if jack_file == "-":
+        if (args.stats or args.stats_json is not None or args.cache_dir is not None or args.jobs != 1
+                or args.whole_program or args.inline_accessors):
+            parser.error("--stats, --stats-json, --cache-dir, -j, --whole-program and --inline "
+                         "need files to compile")
+        options = CompileOptions(args.scan_mode, optimize = args.optimize, fold_constants = args.fold_constants,
+                                 strength_reduction = args.strength_reduction,
+                                 intern_strings = args.intern_strings, output_format = args.output_format)
+        output_stream = sys.stdout.buffer if args.output_format == "vmb" else sys.stdout
+        try:
+            compile_stream(sys.stdin.buffer, output_stream, options)
+        except Exception as e:
+            print(f"<stdin>: {type(e).__name__}: {e}", file = sys.stderr)
+            sys.exit(1)
         sys.exit(0)
-    else:
-        jack_file = sys.argv[1]
-        if not Path(jack_file).is_file() and not Path(jack_file).is_dir():
-            print("File not found!")
-            sys.exit(0)
-    
-    compiler = JackCompiler(jack_file)
-    compiler.main()
+
+    if not Path(jack_file).is_file() and not Path(jack_file).is_dir():
+        print("File not found!")
+        sys.exit(0)
+
+    compiler = JackCompiler(jack_file, args.scan_mode, jobs = args.jobs,
+                            cache_dir = args.cache_dir, cache_size = args.cache_size,
+                            optimize = args.optimize, fold_constants = args.fold_constants,
+                            strength_reduction = args.strength_reduction,
+                            intern_strings = args.intern_strings,
+                            output_format = args.output_format,
+                            collect_stats = args.stats or args.stats_json is not None,
+                            whole_program = args.whole_program,
+                            inline_accessors = args.inline_accessors)
+    results = compiler.main()
+    for result in results:
+        if result.status == "eliminated":
+            print(f"{result.jack_file}: nothing reachable, no output")
+        elif result.error is None and args.optimize:
+            print(f"{result.jack_file} -> {result.vm_file} ({result.status}, "
+                  f"{result.commands_removed} commands removed)")
+        elif result.error is None:
+            print(f"{result.jack_file} -> {result.vm_file} ({result.status})")
+        else:
+            print(f"{result.jack_file}: {result.error}", file = sys.stderr)
+    if compiler.cache_stats is not None:
+        print(compiler.cache_stats.summary())
+    if compiler.inlined is not None:
+        print(compiler.inlined.summary())
+    if compiler.dead_code is not None:
+        print(compiler.dead_code.summary())
+    if args.stats:
+        print(compiler.stats.table())
+    if args.stats_json is not None:
+        with open(args.stats_json, "w") as stats_file:
+            stats_file.write(compiler.stats.to_json())
+
+    if any(result.error is not None for result in results):
+        sys.exit(1)
@@ -3,43 +3,71 @@
 class JackSymbolNotFound(Exception):
     pass
 
+# the VM segment each kind of variable lives in
+KIND_TO_SEGMENT = {
+    "static" : "static",
+    "field" : "this",
+    "argument" : "argument",
+    "local" : "local"
+}
+
+class Symbol(object):
+    __slots__ = ("name", "type", "kind", "index", "segment")
+
+    def __init__(self, name, type_of, kind, index):
+        self.name = name
+        self.type = type_of
+        self.kind = kind
+        self.index = index
+        self.segment = KIND_TO_SEGMENT.get(kind, kind)
+
 class SymbolTable(object):
 
-    def __init__(self):
-        # name, type, kind, index
-        self.table = []
+    def __init__(self, parent = None):
+        # name -> Symbol, with a running count of symbols of each kind
+        self.symbols = {}
+        self.counts = {}
+        # enclosing scope searched by resolve, e.g. the class for a subroutine
+        self.parent = parent
+
+    def define(self, new_row, starting_index = 0):
+        kind = new_row["kind"]
+        index = self.counts.get(kind, 0)
+        self.counts[kind] = index + 1
+        new_row["index"] = index
 
-    def define(self, new_row, starting_index = 0):        
-        new_row["index"] = self.var_count(new_row["kind"])
-        self.table.append(new_row)
+        name = new_row["name"]
+        if name not in self.symbols:
+            self.symbols[name] = Symbol(name, new_row["type"], kind, index)
 
     def var_count(self, kind):
-        return sum([row["kind"]==kind for row in self.table])
+        return self.counts.get(kind, 0)
+
+    def lookup(self, name):
+        try:
+            return self.symbols[name]
+        except KeyError:
+            raise JackSymbolNotFound from None
+
+    def resolve(self, name):
+        # search this scope then the enclosing ones, None if nothing defines name
+        table = self
+        while table is not None:
+            symbol = table.symbols.get(name)
+            if symbol is not None:
+                return symbol
+            table = table.parent
+        return None
 
     def kind_of(self, name):
-        for row in self.table:
-            if row["name"]==name:
-                return row["kind"]
+        return self.lookup(name).kind
 
-        raise JackSymbolNotFound
-    
     def type_of(self, name):
-        for row in self.table:
-            if row["name"]==name:
-                return row["type"]
-
-        raise JackSymbolNotFound
+        return self.lookup(name).type
 
     def index_of(self, name):
-        for i, row in enumerate(self.table):
-            if row["name"]==name:
-                return row["index"]
+        return self.lookup(name).index
 
-        raise JackSymbolNotFound
     def exists(self, name):
-        for row in self.table:
-            if row["name"] == name:
-                return True
+        return name in self.symbols
 
-        return False
-    
@@ -4,6 +4,8 @@ import re
 from enum import Enum
 import pdb
 import io
+import mmap
+from array import array
 
 class InvalidToken(Exception):
     def __init(self, token):
@@ -27,14 +29,85 @@ JACK_SYMBOLS = ["{", "}", "(", ")", "[", "]", ".", ",", ";",
                 "+", "-", "*", "/", "&", "|", "<", ">", "=",
                 "~"]
 
+_KEYWORD_SET = frozenset(JACK_KEYWORDS)
+_SYMBOL_SET = frozenset(JACK_SYMBOLS)
+
+# "array" scans the whole file up front into a token array walked with a cursor,
+# "mmap" does the same over a memory mapped file keeping (start, end) spans,
+# "regex" reads the whole file at once and scans it with JACK_TOKEN_REGEX as it goes,
+# "bytes" is the original one byte at a time reader
+SCAN_MODES = ["array", "mmap", "regex", "bytes"]
+
+_SYMBOL_CHARS = re.escape("".join(JACK_SYMBOLS))
+# the end of a word is whitespace, a symbol or the end of the file
+_WORD_END = rf"(?![^\s{_SYMBOL_CHARS}])"
+
+_JACK_TOKEN_PATTERN = (
+    r"(?P<skip>(?:\s+|//[^\n]*|/\*.*?(?:\*/|\Z))+)"
+    r'|(?P<string>"[^"]*")'
+    rf"|(?P<symbol>[{_SYMBOL_CHARS}])"
+    rf"|(?P<keyword>(?:{'|'.join(JACK_KEYWORDS)}){_WORD_END})"
+    rf"|(?P<int_const>\d+{_WORD_END})"
+    rf"|(?P<identifier>[a-zA-Z_][a-zA-Z0-9_]*{_WORD_END})"
+    # anything else up to the next symbol or space is kept as a single
+    # token, token_type() reports it as invalid like the byte reader does
+    rf'|(?P<word>[^\s{_SYMBOL_CHARS}"][^\s{_SYMBOL_CHARS}]*)')
+
+JACK_TOKEN_REGEX = re.compile(_JACK_TOKEN_PATTERN, re.DOTALL)
+# the same scanner over raw bytes, used on memory mapped sources
+JACK_TOKEN_BYTES_REGEX = re.compile(_JACK_TOKEN_PATTERN.encode(), re.DOTALL)
+
+_GROUP_TOKEN_TYPES = {
+    "string" : JackTokenType.STRING_CONST,
+    "symbol" : JackTokenType.SYMBOL,
+    "keyword" : JackTokenType.KEYWORD,
+    "int_const" : JackTokenType.INT_CONST,
+    "identifier" : JackTokenType.IDENTIFIER,
+    "word" : None
+}
+
+# token types are stored in the token array as their enum value, 0 is an invalid token
+_GROUP_TYPE_CODES = {group : (token_type.value if token_type else 0)
+                     for group, token_type in _GROUP_TOKEN_TYPES.items()}
+_TOKEN_TYPES_BY_CODE = [None] + list(JackTokenType)
+
+# shared strings for tokens that never need decoding from a memory mapped source
+_SYMBOLS_BY_BYTE = {ord(symbol) : symbol for symbol in JACK_SYMBOLS}
+_KEYWORDS_BY_BYTES = {keyword.encode() : keyword for keyword in JACK_KEYWORDS}
+
 class JackTokenizer:
     
     identifier_matcher = re.compile("^[a-zA-Z_][a-zA-Z0-9\_]*$")
     
-    def __init__(self, jack_filepath):
-        self.jack_file = io.open(jack_filepath, "rb")
+    def __init__(self, jack_filepath, mode = "array"):
+        # jack_filepath can also be a binary file-like object, see from_source
+        if mode not in SCAN_MODES:
+            raise ValueError(f"Unknown scan mode: {mode}")
+        self.mode = mode
+        if hasattr(jack_filepath, "read"):
+            self.jack_file = jack_filepath
+        else:
+            self.jack_file = io.open(jack_filepath, "rb")
         self.is_more_tokens = True
         self.current_token = ""
+        self._current_type = None
+
+        if mode in ["array", "regex"]:
+            self._source = self.jack_file.read().decode("utf-8")
+            self._pos = 0
+            self.jack_file.close()
+
+        if mode == "array":
+            self._scan_token_array()
+        elif mode == "mmap":
+            self._scan_token_spans()
+
+    @classmethod
+    def from_source(cls, source, mode = "array"):
+        # tokenizes Jack source held in memory, str or bytes
+        if isinstance(source, str):
+            source = source.encode("utf-8")
+        return cls(io.BytesIO(source), mode)
 
     def has_more_tokens(self):
         return self.is_more_tokens
@@ -51,17 +124,87 @@ class JackTokenizer:
             self.advance()
             
     def advance(self):
+        if self.mode == "array":
+            self._advance_array()
+        elif self.mode == "mmap":
+            self._advance_spans()
+        elif self.mode == "regex":
+            self._advance_regex()
+        else:
+            self._advance_bytes()
+
+    def token_count(self):
+        # tokens in the file, only known up front in array and mmap modes
+        if self.mode not in ["array", "mmap"]:
+            return None
+        return len(self._token_types)
+
+    def peek(self, n = 1):
+        # text of the token n places ahead of the current one, array and mmap modes only
+        index = self._peek_index(n)
+        return None if index is None else self._token_text(index)
+
+    def peek_type(self, n = 1):
+        index = self._peek_index(n)
+        return None if index is None else _TOKEN_TYPES_BY_CODE[self._token_types[index]]
+
+    def _peek_index(self, n):
+        if self.mode not in ["array", "mmap"]:
+            raise ValueError(f"Lookahead is not supported in {self.mode} scan mode")
+        index = self.cursor + n
+        if 0 <= index < len(self._token_types):
+            return index
+        return None
+
+    def token_offset(self):
+        # source offset of the current token, array and mmap modes only
+        return self._offsets[self.cursor]
+
+    def seek(self, index):
+        # makes the token at index the current one, array and mmap modes only
+        self.cursor = index - 1
+        self.is_more_tokens = True
+        self.advance()
+
+    def token_texts(self, start, end):
+        return [self._token_text(index) for index in range(start, end)]
+
+    def string_constants(self, start, end):
+        # texts of the string constants between token indexes start and end
+        return [self._token_text(index) for index in range(start, end)
+                if self._token_types[index] == JackTokenType.STRING_CONST.value]
+
+    def find_block_end(self, start):
+        # index of the "}" closing the first block opened at or after start
+        depth = 0
+        for index in range(start, len(self._token_types)):
+            if self._token_types[index] != JackTokenType.SYMBOL.value:
+                continue
+            text = self._token_text(index)
+            if text == "{":
+                depth += 1
+            elif text == "}":
+                depth -= 1
+                if depth == 0:
+                    return index
+        raise InvalidToken("Unclosed block")
+
+    def token_span(self):
+        # (start, end) of the current token in the mapped file, mmap mode only
+        return self._offsets[self.cursor], self._ends[self.cursor]
+
+    def _advance_bytes(self):
         c = self.get_next_char()
         if not c:
             self.is_more_tokens = False
         elif c == "/":
             is_comment = self._advance_past_comments()
             if is_comment:
-                self.advance()
+                self._advance_bytes()
             else:
                 self.current_token = c
         elif c.isspace():
-            self.advance()
+            self._advance_bytes()
         elif c == '"':
             self.current_token = c
             c = self.get_next_char()
@@ -82,6 +225,131 @@ class JackTokenizer:
             if c:
                 self.go_back_chars(1)
 
+    def _scan_token_array(self):
+        # one pass over the source, each token is stored as an id into the
+        # table of distinct token strings, its type code and its source offset
+        self._strings = []
+        self._token_ids = array("I")
+        self._token_types = array("B")
+        self._offsets = array("L")
+        self.cursor = -1
+
+        string_ids = {}
+        source = self._source
+        pos = 0
+        for match in JACK_TOKEN_REGEX.finditer(source):
+            start = match.start()
+            if start != pos:
+                raise InvalidToken(source[pos:])
+            pos = match.end()
+            group = match.lastgroup
+            if group == "skip":
+                continue
+
+            text = match.group()
+            token_id = string_ids.get(text)
+            if token_id is None:
+                token_id = string_ids[text] = len(self._strings)
+                self._strings.append(text)
+            self._token_ids.append(token_id)
+            self._token_types.append(_GROUP_TYPE_CODES[group])
+            self._offsets.append(start)
+
+        if pos != len(source):
+            raise InvalidToken(source[pos:])
+
+    def _scan_token_spans(self):
+        # tokens are kept as (start, end) spans into the mapped file, so no
+        # text is copied until the token becomes the current one
+        self._ends = array("L")
+        self._token_types = array("B")
+        self._offsets = array("L")
+        self._names = {}
+        self.cursor = -1
+
+        try:
+            fileno = self.jack_file.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            #nothing to map, the source is in memory already
+            self._buffer = self.jack_file.read()
+        else:
+            if os.fstat(fileno).st_size == 0:
+                self._buffer = b""
+            else:
+                self._buffer = mmap.mmap(fileno, 0, access = mmap.ACCESS_READ)
+
+        buffer = self._buffer
+        pos = 0
+        for match in JACK_TOKEN_BYTES_REGEX.finditer(buffer):
+            start = match.start()
+            if start != pos:
+                raise InvalidToken(buffer[pos:].decode("utf-8"))
+            pos = match.end()
+            group = match.lastgroup
+            if group == "skip":
+                continue
+            self._offsets.append(start)
+            self._ends.append(pos)
+            self._token_types.append(_GROUP_TYPE_CODES[group])
+
+        if pos != len(buffer):
+            raise InvalidToken(buffer[pos:].decode("utf-8"))
+
+    def _token_text(self, index):
+        if self.mode == "array":
+            return self._strings[self._token_ids[index]]
+
+        start = self._offsets[index]
+        end = self._ends[index]
+        if end - start == 1 and self._buffer[start] in _SYMBOLS_BY_BYTE:
+            return _SYMBOLS_BY_BYTE[self._buffer[start]]
+
+        raw = self._buffer[start:end]
+        text = _KEYWORDS_BY_BYTES.get(raw)
+        if text is None:
+            # every later use of the same name shares the first decoded string
+            text = self._names.get(raw)
+            if text is None:
+                text = self._names[raw] = raw.decode("utf-8")
+        return text
+
+    def _advance_array(self):
+        cursor = self.cursor + 1
+        if cursor >= len(self._token_types):
+            self.is_more_tokens = False
+            return
+        self.cursor = cursor
+        self.current_token = self._strings[self._token_ids[cursor]]
+        self._current_type = _TOKEN_TYPES_BY_CODE[self._token_types[cursor]]
+
+    def _advance_spans(self):
+        cursor = self.cursor + 1
+        if cursor >= len(self._token_types):
+            self.is_more_tokens = False
+            return
+        self.cursor = cursor
+        self.current_token = self._token_text(cursor)
+        self._current_type = _TOKEN_TYPES_BY_CODE[self._token_types[cursor]]
+
+    def _advance_regex(self):
+        pos = self._pos
+        match = JACK_TOKEN_REGEX.match(self._source, pos)
+        if match is not None and match.lastgroup == "skip":
+            pos = match.end()
+            match = JACK_TOKEN_REGEX.match(self._source, pos)
+
+        if match is None:
+            if pos < len(self._source):
+                # only an unterminated string constant fails to match
+                raise InvalidToken(self._source[pos:])
+            self._pos = pos
+            self.is_more_tokens = False
+            return
+
+        self._pos = match.end()
+        self.current_token = match.group()
+        self._current_type = _GROUP_TOKEN_TYPES[match.lastgroup]
+
     def _advance_past_comments(self):
         c = self.get_next_char()
         # in-line comment
@@ -110,11 +378,14 @@ class JackTokenizer:
     def _set_current_token(self, token):
         # for testing
         self.current_token = token
+        self._current_type = None
     
     def token_type(self):
-        if self.current_token in JACK_KEYWORDS:
+        if self._current_type is not None:
+            return self._current_type
+        elif self.current_token in _KEYWORD_SET:
             return JackTokenType.KEYWORD
-        elif self.current_token in JACK_SYMBOLS:
+        elif self.current_token in _SYMBOL_SET:
             return JackTokenType.SYMBOL
         elif self.current_token.isnumeric():
             return JackTokenType.INT_CONST
@@ -129,7 +400,10 @@ class JackTokenizer:
         return token != "" and JackTokenizer.identifier_matcher.match(token)
         
     def close(self):
-        self.jack_file.close()
+        if self.mode == "mmap" and isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        if not self.jack_file.closed:
+            self.jack_file.close()
 
 if __name__ == "__main__":
     print("Tokenizer")
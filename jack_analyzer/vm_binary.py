@@ -0,0 +1,140 @@
+import os
+import sys
+import mmap
+from vm_ir import VMCode, PUSH, POP, NAMED_OPCODES, COUNTED_OPCODES, OPCODES, SEGMENTS
+
+# .vmb layout, integers are unsigned LEB128 varints:
+#   MAGIC
+#   name count, then each name as its utf-8 length and bytes
+#   command count, then each command as
+#     opcode byte (an index into vm_ir.OPCODES)
+#     push/pop:      segment byte, index
+#     function/call: name id, count
+#     label/goto/if-goto: name id
+
+MAGIC = b"VMB1"
+
+class InvalidVMBinary(Exception):
+    pass
+
+def _write_varint(out, value):
+    if value < 0:
+        raise ValueError(f"Cannot encode negative operand {value}")
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def encode(code):
+    # the .vmb bytes of a VMCode, only the names it uses go in the string table
+    name_ids = {}
+    names = []
+    body = bytearray()
+    _write_varint(body, len(code))
+    for opcode, target, operand in zip(code.opcodes, code.targets, code.operands):
+        body.append(opcode)
+        if opcode == PUSH or opcode == POP:
+            body.append(target)
+            _write_varint(body, operand)
+        elif opcode in NAMED_OPCODES:
+            name_id = name_ids.get(target)
+            if name_id is None:
+                name_id = name_ids[target] = len(names)
+                names.append(code.names.names[target])
+            _write_varint(body, name_id)
+            if opcode in COUNTED_OPCODES:
+                _write_varint(body, operand)
+
+    out = bytearray(MAGIC)
+    _write_varint(out, len(names))
+    for name in names:
+        encoded = name.encode()
+        _write_varint(out, len(encoded))
+        out.extend(encoded)
+    out.extend(body)
+    return bytes(out)
+
+def decode(data, names = None):
+    # a VMCode from .vmb bytes (or an mmap of them), names is an optional NameTable to share
+    if data[:len(MAGIC)] != MAGIC:
+        raise InvalidVMBinary("Not a .vmb file")
+    position = len(MAGIC)
+
+    def read_varint():
+        nonlocal position
+        value = 0
+        shift = 0
+        while True:
+            if position >= len(data):
+                raise InvalidVMBinary("Truncated .vmb file")
+            byte = data[position]
+            position += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    code = VMCode(names = names)
+    name_ids = []
+    for _ in range(read_varint()):
+        length = read_varint()
+        name_ids.append(code.names.intern(bytes(data[position:position + length]).decode()))
+        position += length
+
+    try:
+        for _ in range(read_varint()):
+            opcode = data[position]
+            position += 1
+            if opcode >= len(OPCODES):
+                raise InvalidVMBinary(f"Unknown opcode {opcode}")
+            if opcode == PUSH or opcode == POP:
+                segment = data[position]
+                position += 1
+                if segment >= len(SEGMENTS):
+                    raise InvalidVMBinary(f"Unknown segment {segment}")
+                code.emit(opcode, segment, read_varint())
+            elif opcode in COUNTED_OPCODES:
+                name_id = name_ids[read_varint()]
+                code.emit(opcode, name_id, read_varint())
+            elif opcode in NAMED_OPCODES:
+                code.emit(opcode, name_ids[read_varint()], 0)
+            else:
+                code.emit(opcode, 0, 0)
+    except IndexError:
+        raise InvalidVMBinary("Truncated .vmb file")
+    return code
+
+def load(path, names = None):
+    # decodes a .vmb file straight from a memory map
+    with open(path, "rb") as vmb_file:
+        if os.fstat(vmb_file.fileno()).st_size == 0:
+            raise InvalidVMBinary("Not a .vmb file")
+        with mmap.mmap(vmb_file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+            return decode(data, names)
+
+def save(path, code):
+    with open(path, "wb") as vmb_file:
+        vmb_file.write(encode(code))
+
+def vm_to_vmb(vm_path, vmb_path):
+    with open(vm_path) as vm_file:
+        save(vmb_path, VMCode.from_text(vm_file.read()))
+
+def vmb_to_vm(vmb_path, vm_path):
+    with open(vm_path, "w") as vm_file:
+        vm_file.write(load(vmb_path).to_text())
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or os.path.splitext(sys.argv[1])[1] not in [".vm", ".vmb"]:
+        print("usage: python vm_binary.py <filename.vm> | <filename.vmb>")
+        sys.exit(1)
+
+    # converts to the other format, next to the input
+    source = sys.argv[1]
+    base, extension = os.path.splitext(source)
+    if extension == ".vm":
+        vm_to_vmb(source, base + ".vmb")
+        print(f"{source} -> {base}.vmb")
+    else:
+        vmb_to_vm(source, base + ".vm")
+        print(f"{source} -> {base}.vm")
@@ -0,0 +1,424 @@
+import os
+import sys
+import math
+import argparse
+import vm_binary
+from vm_ir import VMCode
+from vm_optimizer import to_word
+
+# runs compiled VM code with the Hack memory layout: SP, LCL, ARG, THIS, THAT
+# in RAM[0..4], temp at 5, statics from 16, the stack from 256 and the heap
+# from 2048. OS functions that aren't defined in the VM code run natively,
+# see OS_FUNCTIONS.
+
+RAM_SIZE = 32768
+STACK_BASE = 256
+HEAP_BASE = 2048
+HEAP_END = 16384
+DEFAULT_MAX_STEPS = 50000000
+
+# where push/pop operands live once resolved: a base register in RAM[1..4],
+# or an absolute address for static, temp and pointer
+SEGMENT_CONSTANT = 0
+BASE_REGISTERS = {"local" : 1, "argument" : 2, "this" : 3, "that" : 4}
+SEGMENT_ABSOLUTE = 5
+FIXED_BASES = {"pointer" : 3, "temp" : 5}
+
+(PUSH, POP, ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+ GOTO, IF_GOTO, FUNCTION, CALL, CALL_NATIVE, CALL_MISSING, RETURN) = range(18)
+
+SIMPLE_OPS = {"add" : ADD, "sub" : SUB, "neg" : NEG, "eq" : EQ, "gt" : GT, "lt" : LT,
+              "and" : AND, "or" : OR, "not" : NOT, "return" : RETURN}
+
+# a return address that ends the run when the entry function returns
+EXIT_ADDRESS = -1
+
+class VMRuntimeError(Exception):
+    pass
+
+class Halt(Exception):
+    pass
+
+class Profile(object):
+    # instructions run and calls made per function, natives only count calls
+    def __init__(self):
+        self.instructions = {}
+        self.calls = {}
+        self.max_stack_depth = 0
+        self.steps = 0
+
+    def hot_functions(self, top = 10):
+        # (function, instructions, calls) by instructions run
+        names = sorted(self.calls.keys() | self.instructions.keys(),
+                       key = lambda name: (-self.instructions.get(name, 0), name))
+        return [(name, self.instructions.get(name, 0), self.calls.get(name, 0)) for name in names[:top]]
+
+    def summary(self, top = 10):
+        lines = [f"{self.steps} instructions, max stack depth {self.max_stack_depth}",
+                 f"{'function':<32} {'instructions':>12} {'%':>6} {'calls':>8}"]
+        for name, instructions, calls in self.hot_functions(top):
+            share = 100 * instructions / self.steps if self.steps else 0
+            lines.append(f"{name:<32} {instructions:>12} {share:>6.1f} {calls:>8}")
+        return "\n".join(lines)
+
+class VMInterpreter(object):
+    def __init__(self, files):
+        # files is a list of (file name, commands), as for hack_backend.translate_program
+        self.ram = [0] * RAM_SIZE
+        self.output = []
+        self.profile = Profile()
+        self.free_blocks = []
+        self.heap_top = HEAP_BASE
+        self.function_names = []
+        self.functions = {}
+        self.program = []
+        self.load(files)
+
+    def load(self, files):
+        labels = {}
+        jumps = []
+        next_static = 16
+        for file_name, code in files:
+            statics = 0
+            function_name = ""
+            for command in code:
+                op = command[0]
+                if op == "push" or op == "pop":
+                    segment, index = command[1], command[2]
+                    if segment == "constant":
+                        operand = (SEGMENT_CONSTANT, index)
+                    elif segment in BASE_REGISTERS:
+                        operand = (BASE_REGISTERS[segment], index)
+                    elif segment == "static":
+                        operand = (SEGMENT_ABSOLUTE, next_static + index)
+                        statics = max(statics, index + 1)
+                    else:
+                        operand = (SEGMENT_ABSOLUTE, FIXED_BASES[segment] + index)
+                    self.program.append((PUSH if op == "push" else POP,) + operand)
+                elif op == "label":
+                    labels[f"{function_name}${command[1]}"] = len(self.program)
+                elif op in ["goto", "if-goto"]:
+                    jumps.append(len(self.program))
+                    self.program.append((GOTO if op == "goto" else IF_GOTO, f"{function_name}${command[1]}", 0))
+                elif op == "function":
+                    function_name = command[1]
+                    self.functions[function_name] = len(self.program)
+                    self.program.append((FUNCTION, len(self.function_names), command[2]))
+                    self.function_names.append(function_name)
+                elif op == "call":
+                    self.program.append((CALL, command[1], command[2]))
+                else:
+                    self.program.append((SIMPLE_OPS[op], 0, 0))
+            next_static += statics
+
+        for i in jumps:
+            op, label, _ = self.program[i]
+            if label not in labels:
+                raise VMRuntimeError(f"Unknown label {label}")
+            self.program[i] = (op, labels[label], 0)
+        for i, (op, name, num_args) in enumerate(self.program):
+            if op != CALL:
+                continue
+            elif name in self.functions:
+                self.program[i] = (CALL, self.functions[name], num_args)
+            elif name in OS_FUNCTIONS:
+                self.program[i] = (CALL_NATIVE, name, num_args)
+            else:
+                #only an error if it is actually called
+                self.program[i] = (CALL_MISSING, name, num_args)
+
+    def entry_point(self):
+        for name in ["Sys.init", "Main.main"]:
+            if name in self.functions:
+                return name
+        raise VMRuntimeError("No Sys.init or Main.main to run")
+
+    def run(self, entry = None, max_steps = DEFAULT_MAX_STEPS):
+        # runs entry (Sys.init or Main.main by default) and returns its result
+        entry = self.entry_point() if entry is None else entry
+        ram = self.ram
+        program = self.program
+        instructions = [0] * len(self.function_names)
+        calls = [0] * len(self.function_names)
+        native_calls = self.profile.calls
+
+        ram[0] = STACK_BASE
+        ram[1] = ram[2] = STACK_BASE
+        frames = []
+        current = 0
+        max_sp = STACK_BASE
+        steps = 0
+        #enter the entry function as if it had been called with no arguments
+        for value in [EXIT_ADDRESS, ram[1], ram[2], ram[3], ram[4]]:
+            ram[ram[0]] = value
+            ram[0] += 1
+        ram[1] = ram[0]
+        pc = self.functions[entry]
+
+        try:
+            while True:
+                if steps >= max_steps:
+                    raise VMRuntimeError(f"Gave up after {max_steps} instructions")
+                op, x, y = program[pc]
+                pc += 1
+                steps += 1
+                instructions[current] += 1
+
+                if op == PUSH:
+                    sp = ram[0]
+                    if x == SEGMENT_CONSTANT:
+                        ram[sp] = y
+                    elif x == SEGMENT_ABSOLUTE:
+                        ram[sp] = ram[y]
+                    else:
+                        ram[sp] = ram[ram[x] + y]
+                    ram[0] = sp + 1
+                    if sp >= max_sp:
+                        max_sp = sp + 1
+                elif op == POP:
+                    sp = ram[0] - 1
+                    ram[0] = sp
+                    if x == SEGMENT_ABSOLUTE:
+                        ram[y] = ram[sp]
+                    else:
+                        ram[ram[x] + y] = ram[sp]
+                elif op <= LT:
+                    sp = ram[0] - 1
+                    if op == NEG:
+                        ram[sp] = to_word(-ram[sp])
+                        continue
+                    ram[0] = sp
+                    a, b = ram[sp - 1], ram[sp]
+                    if op == ADD:
+                        ram[sp - 1] = to_word(a + b)
+                    elif op == SUB:
+                        ram[sp - 1] = to_word(a - b)
+                    elif op == EQ:
+                        ram[sp - 1] = -1 if a == b else 0
+                    elif op == GT:
+                        ram[sp - 1] = -1 if a > b else 0
+                    else:
+                        ram[sp - 1] = -1 if a < b else 0
+                elif op == AND:
+                    ram[0] -= 1
+                    ram[ram[0] - 1] &= ram[ram[0]]
+                elif op == OR:
+                    ram[0] -= 1
+                    ram[ram[0] - 1] |= ram[ram[0]]
+                elif op == NOT:
+                    ram[ram[0] - 1] = ~ram[ram[0] - 1]
+                elif op == GOTO:
+                    pc = x
+                elif op == IF_GOTO:
+                    ram[0] -= 1
+                    if ram[ram[0]] != 0:
+                        pc = x
+                elif op == FUNCTION:
+                    current = x
+                    calls[x] += 1
+                    sp = ram[0]
+                    for i in range(sp, sp + y):
+                        ram[i] = 0
+                    ram[0] = sp + y
+                    if ram[0] > max_sp:
+                        max_sp = ram[0]
+                elif op == CALL:
+                    sp = ram[0]
+                    ram[sp:sp + 5] = [pc, ram[1], ram[2], ram[3], ram[4]]
+                    ram[2] = sp - y
+                    ram[0] = ram[1] = sp + 5
+                    frames.append(current)
+                    pc = x
+                elif op == RETURN:
+                    frame = ram[1]
+                    return_address = ram[frame - 5]
+                    ram[ram[2]] = ram[ram[0] - 1]
+                    ram[0] = ram[2] + 1
+                    ram[4], ram[3], ram[2], ram[1] = ram[frame - 1], ram[frame - 2], ram[frame - 3], ram[frame - 4]
+                    if return_address == EXIT_ADDRESS:
+                        return ram[ram[0] - 1]
+                    pc = return_address
+                    current = frames.pop()
+                elif op == CALL_NATIVE:
+                    native_calls[x] = native_calls.get(x, 0) + 1
+                    sp = ram[0] - y
+                    ram[sp] = to_word(OS_FUNCTIONS[x](self, *ram[sp:sp + y]))
+                    ram[0] = sp + 1
+                    if ram[0] > max_sp:
+                        max_sp = ram[0]
+                else:
+                    raise VMRuntimeError(f"Call to undefined function {x}")
+        except Halt:
+            return None
+        finally:
+            self.profile.steps += steps
+            self.profile.max_stack_depth = max(self.profile.max_stack_depth, max_sp - STACK_BASE)
+            for i, name in enumerate(self.function_names):
+                if calls[i] or instructions[i]:
+                    self.profile.calls[name] = self.profile.calls.get(name, 0) + calls[i]
+                    self.profile.instructions[name] = self.profile.instructions.get(name, 0) + instructions[i]
+
+    def alloc(self, size):
+        # first fit from freed blocks, otherwise from the top of the heap; the size is kept in the word before
+        if size <= 0:
+            raise VMRuntimeError(f"Memory.alloc of {size} words")
+        for i, (address, block_size) in enumerate(self.free_blocks):
+            if block_size >= size:
+                del self.free_blocks[i]
+                return address
+        if self.heap_top + size + 1 > HEAP_END:
+            raise VMRuntimeError("Heap overflow")
+        address = self.heap_top + 1
+        self.ram[self.heap_top] = size
+        self.heap_top += size + 1
+        return address
+
+    def dealloc(self, address):
+        self.free_blocks.append((address, self.ram[address - 1]))
+        return 0
+
+    def read_string(self, address):
+        # strings are laid out as max length, length, characters
+        return "".join([chr(c) for c in self.ram[address + 2:address + 2 + self.ram[address + 1]]])
+
+    def write(self, text):
+        self.output.append(text)
+        return 0
+
+def _string_new(vm, max_length):
+    address = vm.alloc(max_length + 2)
+    vm.ram[address] = max_length
+    vm.ram[address + 1] = 0
+    return address
+
+def _string_append_char(vm, this, c):
+    length = vm.ram[this + 1]
+    if length >= vm.ram[this]:
+        raise VMRuntimeError("String is full")
+    vm.ram[this + 2 + length] = c
+    vm.ram[this + 1] = length + 1
+    return this
+
+def _string_erase_last_char(vm, this):
+    if vm.ram[this + 1] > 0:
+        vm.ram[this + 1] -= 1
+    return 0
+
+def _string_set_char_at(vm, this, i, c):
+    vm.ram[this + 2 + i] = c
+    return 0
+
+def _string_int_value(vm, this):
+    text = vm.read_string(this)
+    sign = -1 if text.startswith("-") else 1
+    value = 0
+    for c in text[1 if sign < 0 else 0:]:
+        if not c.isdigit():
+            break
+        value = value * 10 + int(c)
+    return sign * value
+
+def _string_set_int(vm, this, value):
+    text = str(value)
+    if len(text) > vm.ram[this]:
+        raise VMRuntimeError("String is too short for the number")
+    vm.ram[this + 2:this + 2 + len(text)] = [ord(c) for c in text]
+    vm.ram[this + 1] = len(text)
+    return 0
+
+def _divide(vm, a, b):
+    if b == 0:
+        raise VMRuntimeError("Division by zero")
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+def _sqrt(vm, a):
+    if a < 0:
+        raise VMRuntimeError("Square root of a negative number")
+    return math.isqrt(a)
+
+def _poke(vm, address, value):
+    vm.ram[address] = value
+    return 0
+
+def _halt(vm):
+    raise Halt()
+
+def _error(vm, code):
+    raise VMRuntimeError(f"Sys.error {code}")
+
+# name -> fn(vm, *arguments), called when the program doesn't define the function itself
+OS_FUNCTIONS = {
+    "Math.multiply" : lambda vm, a, b: a * b,
+    "Math.divide" : _divide,
+    "Math.min" : lambda vm, a, b: min(a, b),
+    "Math.max" : lambda vm, a, b: max(a, b),
+    "Math.abs" : lambda vm, a: abs(a),
+    "Math.sqrt" : _sqrt,
+    "Memory.alloc" : lambda vm, size: vm.alloc(size),
+    "Memory.deAlloc" : lambda vm, address: vm.dealloc(address),
+    "Memory.peek" : lambda vm, address: vm.ram[address],
+    "Memory.poke" : _poke,
+    "Array.new" : lambda vm, size: vm.alloc(size),
+    "Array.dispose" : lambda vm, this: vm.dealloc(this),
+    "String.new" : _string_new,
+    "String.dispose" : lambda vm, this: vm.dealloc(this),
+    "String.length" : lambda vm, this: vm.ram[this + 1],
+    "String.charAt" : lambda vm, this, i: vm.ram[this + 2 + i],
+    "String.setCharAt" : _string_set_char_at,
+    "String.appendChar" : _string_append_char,
+    "String.eraseLastChar" : _string_erase_last_char,
+    "String.intValue" : _string_int_value,
+    "String.setInt" : _string_set_int,
+    "String.backSpace" : lambda vm: 129,
+    "String.doubleQuote" : lambda vm: 34,
+    "String.newLine" : lambda vm: 128,
+    "Output.printChar" : lambda vm, c: vm.write("\n" if c == 128 else chr(c)),
+    "Output.printString" : lambda vm, s: vm.write(vm.read_string(s)),
+    "Output.printInt" : lambda vm, i: vm.write(str(i)),
+    "Output.println" : lambda vm: vm.write("\n"),
+    "Output.backSpace" : lambda vm: 0,
+    "Output.moveCursor" : lambda vm, row, column: 0,
+    "Sys.halt" : _halt,
+    "Sys.error" : _error,
+    "Sys.wait" : lambda vm, duration: 0
+}
+
+def load_files(path):
+    # (file name, VMCode) for a .vm/.vmb file or every one in a directory
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(path, name) for name in os.listdir(path)
+                       if os.path.splitext(name)[1] in [".vm", ".vmb"])
+    else:
+        paths = [path]
+    files = []
+    for vm_path in paths:
+        base, extension = os.path.splitext(vm_path)
+        if extension == ".vmb":
+            code = vm_binary.load(vm_path)
+        else:
+            with open(vm_path) as vm_file:
+                code = VMCode.from_text(vm_file.read())
+        files.append((os.path.basename(base), code))
+    return files
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage = "python vm_interpreter.py <filename.vm> | <directory>")
+    parser.add_argument("vm_file")
+    parser.add_argument("--entry", help = "function to run instead of Sys.init or Main.main")
+    parser.add_argument("--max-steps", type = int, default = DEFAULT_MAX_STEPS,
+                        help = "stop after this many VM instructions")
+    parser.add_argument("--top", type = int, default = 10, help = "rows in the hot function table")
+    args = parser.parse_args()
+
+    interpreter = VMInterpreter(load_files(args.vm_file))
+    try:
+        result = interpreter.run(args.entry, args.max_steps)
+    except VMRuntimeError as e:
+        print("".join(interpreter.output))
+        print(f"error: {e}", file = sys.stderr)
+        print(interpreter.profile.summary(args.top), file = sys.stderr)
+        sys.exit(1)
+    print("".join(interpreter.output))
+    print(f"returned {result}")
+    print(interpreter.profile.summary(args.top))
@@ -0,0 +1,163 @@
+from array import array
+
+# VM code kept as three parallel arrays, one entry per command:
+#   opcodes  - index into OPCODES
+#   targets  - index into SEGMENTS for push/pop, a NameTable id for
+#              label/goto/if-goto/function/call, 0 otherwise
+#   operands - the segment index for push/pop, the argument or local count
+#              for call/function, 0 otherwise
+# Commands go in and come out as the tuples VMWriter buffers, e.g.
+# ("push", "constant", 3), ("label", "IF_TRUE0"), ("call", "Math.multiply", 2).
+
+OPCODES = ["push", "pop", "add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not",
+           "label", "goto", "if-goto", "function", "call", "return"]
+OPCODE_IDS = {opcode : i for i, opcode in enumerate(OPCODES)}
+
+SEGMENTS = ["constant", "argument", "local", "static", "this", "that", "pointer", "temp"]
+SEGMENT_IDS = {segment : i for i, segment in enumerate(SEGMENTS)}
+
+PUSH = OPCODE_IDS["push"]
+POP = OPCODE_IDS["pop"]
+# opcodes whose target is a name, and the ones of those with a count as well
+NAMED_OPCODES = {OPCODE_IDS[opcode] for opcode in ["label", "goto", "if-goto", "function", "call"]}
+COUNTED_OPCODES = {OPCODE_IDS["function"], OPCODE_IDS["call"]}
+
+class InvalidVMCommand(Exception):
+    pass
+
+def format_command(command):
+    return " ".join([str(part) for part in command]) + "\n"
+
+def parse_command(line):
+    # the command on one line of VM text, None for blank and comment lines
+    line = line.split("//", 1)[0].split()
+    if not line:
+        return None
+    if line[0] not in OPCODE_IDS:
+        raise InvalidVMCommand(f"Unknown VM command {' '.join(line)}")
+    try:
+        return tuple(line[:-1]) + (int(line[-1]),) if len(line) == 3 else tuple(line)
+    except ValueError:
+        raise InvalidVMCommand(f"Invalid VM command {' '.join(line)}")
+
+class NameTable(object):
+    # labels and function names, each stored once and referred to by id
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def intern(self, name):
+        name_id = self.ids.get(name)
+        if name_id is None:
+            name_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def __len__(self):
+        return len(self.names)
+
+class VMCode(object):
+    __slots__ = ("opcodes", "targets", "operands", "names")
+
+    def __init__(self, commands = (), names = None):
+        self.opcodes = array("B")
+        self.targets = array("I")
+        self.operands = array("i")
+        self.names = NameTable() if names is None else names
+        self.extend(commands)
+
+    @classmethod
+    def from_text(cls, text, names = None):
+        code = cls(names = names)
+        code.extend_text(text)
+        return code
+
+    def append(self, command):
+        opcode = OPCODE_IDS.get(command[0])
+        if opcode is None:
+            raise InvalidVMCommand(f"Unknown VM command {command[0]}")
+        if opcode == PUSH or opcode == POP:
+            segment = SEGMENT_IDS.get(command[1])
+            if segment is None:
+                raise InvalidVMCommand(f"Unknown segment {command[1]}")
+            self.emit(opcode, segment, command[2])
+        elif opcode in COUNTED_OPCODES:
+            self.emit(opcode, self.names.intern(command[1]), command[2])
+        elif opcode in NAMED_OPCODES:
+            self.emit(opcode, self.names.intern(command[1]), 0)
+        else:
+            self.emit(opcode, 0, 0)
+
+    def emit(self, opcode, target, operand):
+        self.opcodes.append(opcode)
+        self.targets.append(target)
+        self.operands.append(operand)
+
+    def extend(self, commands):
+        if isinstance(commands, VMCode) and commands.names is self.names:
+            self.opcodes.extend(commands.opcodes)
+            self.targets.extend(commands.targets)
+            self.operands.extend(commands.operands)
+        else:
+            for command in commands:
+                self.append(command)
+
+    def extend_text(self, text):
+        for line in text.splitlines():
+            command = parse_command(line)
+            if command is not None:
+                self.append(command)
+
+    def command(self, i):
+        opcode = self.opcodes[i]
+        name = OPCODES[opcode]
+        if opcode == PUSH or opcode == POP:
+            return (name, SEGMENTS[self.targets[i]], self.operands[i])
+        elif opcode in COUNTED_OPCODES:
+            return (name, self.names.names[self.targets[i]], self.operands[i])
+        elif opcode in NAMED_OPCODES:
+            return (name, self.names.names[self.targets[i]])
+        return (name,)
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            code = VMCode(names = self.names)
+            code.opcodes = self.opcodes[i]
+            code.targets = self.targets[i]
+            code.operands = self.operands[i]
+            return code
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("VM command index out of range")
+        return self.command(i)
+
+    def __iter__(self):
+        for i in range(len(self.opcodes)):
+            yield self.command(i)
+
+    def __eq__(self, other):
+        if not isinstance(other, (VMCode, list, tuple)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def truncate(self, length):
+        del self.opcodes[length:]
+        del self.targets[length:]
+        del self.operands[length:]
+
+    def cut(self, start):
+        # removes the commands from start on and returns them
+        code = self[start:]
+        self.truncate(start)
+        return code
+
+    def to_text(self):
+        return "".join([format_command(command) for command in self])
+
+    def nbytes(self):
+        # memory taken by the command arrays, the names aside
+        return sum(len(a) * a.itemsize for a in (self.opcodes, self.targets, self.operands))
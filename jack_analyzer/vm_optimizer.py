@@ -0,0 +1,209 @@
+# Peephole rewrites over the commands of one VM function.
+#
+# Commands are tuples as buffered by VMWriter, e.g. ("push", "constant", 3),
+# ("add",), ("label", "IF_TRUE0"), ("call", "Math.multiply", 2).
+# Labels are local to a function so every pass works on a single function.
+#
+# temp 0 is treated as scratch space: the compiler only ever reads it
+# right after writing it, so rewrites may drop writes to it.
+
+MAX_CONSTANT = 32767
+
+def to_word(value):
+    # wraps to a signed 16 bit value like the Hack ALU
+    return ((value + 32768) & 0xFFFF) - 32768
+
+def push_constant(value):
+    # shortest commands leaving value (signed 16 bit) on the stack
+    value = to_word(value)
+    if value >= 0:
+        return [("push", "constant", value)]
+    elif value >= -MAX_CONSTANT:
+        return [("push", "constant", -value), ("neg",)]
+    return [("push", "constant", MAX_CONSTANT), ("not",)]
+
+UNARY_FOLDS = {
+    "neg" : lambda a: -a,
+    "not" : lambda a: ~a
+}
+
+BINARY_FOLDS = {
+    "add" : lambda a, b: a + b,
+    "sub" : lambda a, b: a - b,
+    "and" : lambda a, b: a & b,
+    "or" : lambda a, b: a | b,
+    "eq" : lambda a, b: -1 if a == b else 0,
+    "lt" : lambda a, b: -1 if a < b else 0,
+    "gt" : lambda a, b: -1 if a > b else 0
+}
+
+# x op constant that leaves x unchanged
+BINARY_IDENTITIES = {
+    "add" : 0,
+    "sub" : 0,
+    "or" : 0,
+    "and" : -1
+}
+
+# commands that always leave true (-1) or false (0) on the stack
+BOOLEAN_COMMANDS = ["eq", "lt", "gt"]
+
+# segments a push can be moved across a pop pointer 1 from
+STABLE_SEGMENTS = ["constant", "local", "argument", "static", "this"]
+
+JUMPS = ["goto", "if-goto"]
+
+def optimize(commands):
+    # runs every pass until none of them changes anything, commands can be a VMCode
+    commands = list(commands)
+    while True:
+        optimized = fold_constants(commands)
+        optimized = cancel_push_pop(optimized)
+        optimized = thread_jumps(optimized)
+        optimized = remove_unreachable(optimized)
+        optimized = remove_dead_labels(optimized)
+        if optimized == commands:
+            return optimized
+        commands = optimized
+
+def fold_constants(commands):
+    # values[i] is (value, start) when out[start:i + 1] only pushes a constant
+    out = []
+    values = []
+    for command in commands:
+        op = command[0]
+        if op == "push" and command[1] == "constant":
+            out.append(command)
+            values.append((to_word(command[2]), len(out) - 1))
+            continue
+
+        if op in UNARY_FOLDS and values and values[-1] is not None:
+            value, start = values[-1]
+            _replace_constant(out, values, start, UNARY_FOLDS[op](value))
+            continue
+
+        if op in UNARY_FOLDS and out and out[-1] == (op,):
+            #--x and ~~x
+            _truncate(out, values, len(out) - 1)
+            continue
+
+        if op in BINARY_FOLDS and values and values[-1] is not None:
+            right, right_start = values[-1]
+            left = values[right_start - 1] if right_start > 0 else None
+            if left is not None:
+                _replace_constant(out, values, left[1], BINARY_FOLDS[op](left[0], right))
+                continue
+            if BINARY_IDENTITIES.get(op) == right:
+                _truncate(out, values, right_start)
+                continue
+
+        out.append(command)
+        values.append(None)
+    return out
+
+def _truncate(out, values, length):
+    del out[length:]
+    del values[length:]
+
+def _replace_constant(out, values, start, value):
+    _truncate(out, values, start)
+    for command in push_constant(value):
+        out.append(command)
+    values.extend([None] * (len(out) - start - 1) + [(to_word(value), start)])
+
+def cancel_push_pop(commands):
+    out = []
+    i = 0
+    while i < len(commands):
+        command = commands[i]
+        following = commands[i + 1] if i + 1 < len(commands) else None
+        if (following is not None and command[0] == "push" and following[0] == "pop"
+                and command[1:] == following[1:] and command[1] != "constant"):
+            #push x, pop x
+            i += 2
+            continue
+
+        if (command[0] == "push" and command[1] in STABLE_SEGMENTS
+                and commands[i + 1:i + 5] == [("pop", "temp", 0), ("pop", "pointer", 1),
+                                              ("push", "temp", 0), ("pop", "that", 0)]):
+            #array store of a simple value, push it after pointer 1 is set instead of going through temp 0
+            out.extend([("pop", "pointer", 1), command, ("pop", "that", 0)])
+            i += 5
+            continue
+
+        out.append(command)
+        i += 1
+    return out
+
+def _is_boolean(commands, i):
+    command = commands[i]
+    if command[0] in BOOLEAN_COMMANDS:
+        return True
+    return command == ("not",) and i > 0 and _is_boolean(commands, i - 1)
+
+def thread_jumps(commands):
+    # label -> the label it ends up jumping to when the label is just followed by a goto
+    label_positions = {command[1] : i for i, command in enumerate(commands) if command[0] == "label"}
+
+    def final_target(label):
+        seen = set()
+        while label not in seen:
+            seen.add(label)
+            i = label_positions.get(label)
+            if i is None:
+                return label
+            i += 1
+            while i < len(commands) and commands[i][0] == "label":
+                i += 1
+            if i < len(commands) and commands[i][0] == "goto":
+                label = commands[i][1]
+            else:
+                return label
+        return label
+
+    out = []
+    i = 0
+    while i < len(commands):
+        command = commands[i]
+        if command[0] in JUMPS:
+            command = (command[0], final_target(command[1]))
+
+        if (command[0] == "if-goto" and i > 0 and _is_boolean(commands, i - 1)
+                and i + 2 < len(commands) and commands[i + 1][0] == "goto"
+                and commands[i + 2] == ("label", command[1])):
+            #b, if-goto T, goto F, label T -> b, not, if-goto F, label T
+            out.extend([("not",), ("if-goto", final_target(commands[i + 1][1]))])
+            i += 2
+            continue
+
+        if command[0] == "goto":
+            #goto to the label run straight after it
+            j = i + 1
+            while j < len(commands) and commands[j][0] == "label":
+                if commands[j][1] == command[1]:
+                    break
+                j += 1
+            if j < len(commands) and commands[j] == ("label", command[1]):
+                i += 1
+                continue
+
+        out.append(command)
+        i += 1
+    return out
+
+def remove_unreachable(commands):
+    # nothing after a goto or return runs until the next label
+    out = []
+    reachable = True
+    for command in commands:
+        if command[0] in ["label", "function"]:
+            reachable = True
+        if reachable:
+            out.append(command)
+        if command[0] in ["goto", "return"]:
+            reachable = False
+    return out
+
+def remove_dead_labels(commands):
+    used = {command[1] for command in commands if command[0] in JUMPS}
+    return [command for command in commands if command[0] != "label" or command[1] in used]
@@ -1,38 +1,200 @@
+import os
+import vm_optimizer
+import vm_binary
+from vm_ir import VMCode, NameTable
 
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+class VMSink(object):
+    # somewhere for VMWriter to send VM text, subclasses override write
+    def write(self, text):
+        raise NotImplementedError
+
+    def write_code(self, code):
+        # a function's VMCode, sinks that don't want text override this
+        self.write(code.to_text())
+
+    def close(self):
+        pass
+
+class ListSink(VMSink):
+    # keeps the VM text in memory, one entry per write, usually a whole function's text
+    def __init__(self, lines = None):
+        self.lines = [] if lines is None else lines
+
+    def write(self, text):
+        self.lines.append(text)
+
+    def getvalue(self):
+        return "".join(self.lines)
+
+class IRSink(VMSink):
+    # keeps the commands themselves in one VMCode, for stages after the compiler
+    def __init__(self, code = None):
+        self.code = VMCode() if code is None else code
+
+    def write(self, text):
+        self.code.extend_text(text)
+
+    def write_code(self, code):
+        self.code.extend(code)
+
+class BinarySink(IRSink):
+    # collects the program and writes it as a .vmb file on close
+    def __init__(self, filepath):
+        super().__init__()
+        self.filepath = filepath
+        self.closed = False
+
+    def close(self):
+        if not self.closed:
+            vm_binary.save(self.filepath, self.code)
+            self.closed = True
+
+class StreamSink(VMSink):
+    # writes to a caller supplied file-like object, which is left open
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        self.stream.write(text)
+
+    def close(self):
+        if hasattr(self.stream, "flush"):
+            self.stream.flush()
+
+class BufferedFileSink(VMSink):
+    # holds up to buffer_size characters before writing them out in one go
+    def __init__(self, filepath, buffer_size = DEFAULT_BUFFER_SIZE):
+        self.vm_file = open(filepath, "w")
+        self.buffer_size = buffer_size
+        self.chunks = []
+        self.buffered = 0
+
+    def write(self, text):
+        self.chunks.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.chunks:
+            self.vm_file.write("".join(self.chunks))
+            self.chunks = []
+            self.buffered = 0
+
+    def close(self):
+        if not self.vm_file.closed:
+            self.flush()
+            self.vm_file.close()
+
+def make_sink(output, buffer_size = DEFAULT_BUFFER_SIZE):
+    # a file path (.vmb for the binary format), a list to append to, a VMSink
+    # or any object with a write method
+    if isinstance(output, VMSink):
+        return output
+    elif isinstance(output, (str, os.PathLike)) and os.fspath(output).endswith(".vmb"):
+        return BinarySink(output)
+    elif isinstance(output, (str, os.PathLike)):
+        return BufferedFileSink(output, buffer_size)
+    elif isinstance(output, list):
+        return ListSink(output)
+    elif hasattr(output, "write"):
+        return StreamSink(output)
+    raise TypeError(f"Cannot write VM output to {output!r}")
 
 class VMWriter(object):
-    def __init__(self, output_file):
-        self.vm_file = open(output_file, "w")
+    # commands are buffered in a VMCode until the function they belong to
+    # ends, then optionally optimized and written out
+    def __init__(self, output, buffer_size = DEFAULT_BUFFER_SIZE, optimize = False):
+        self.sink = make_sink(output, buffer_size)
+        self._outer_sinks = []
+        self.optimize = optimize
+        #an IRSink takes the buffered arrays as they are when it shares the names
+        self.names = self.sink.code.names if isinstance(self.sink, IRSink) else NameTable()
+        self.commands = VMCode(names = self.names)
+        self.commands_removed = 0
+
+    def flush(self):
+        # writes out the buffered commands of the current function
+        if not self.commands:
+            return
+        commands = self.commands
+        if self.optimize:
+            optimized = VMCode(vm_optimizer.optimize(commands), self.names)
+            self.commands_removed += len(commands) - len(optimized)
+            commands = optimized
+        self.sink.write_code(commands)
+        self.commands = VMCode(names = self.names)
+
+    def start_capture(self):
+        # collect everything written until end_capture, which returns it
+        self.flush()
+        self._outer_sinks.append(self.sink)
+        self.sink = ListSink()
+
+    def end_capture(self):
+        self.flush()
+        text = self.sink.getvalue()
+        self.sink = self._outer_sinks.pop()
+        self.sink.write(text)
+        return text
+
+    def mark(self):
+        # position in the current function's commands, see rewind
+        return len(self.commands)
+
+    def rewind(self, mark):
+        # drops the commands written since mark was taken in the same function
+        self.commands.truncate(mark)
+
+    def cut(self, mark):
+        # like rewind but hands back the dropped commands, see paste
+        return self.commands.cut(mark)
+
+    def paste(self, commands):
+        self.commands.extend(commands)
+
+    def write_raw(self, text):
+        # already formatted VM commands, e.g. a cached subroutine
+        self.flush()
+        self.sink.write(text)
 
     def write_push(self, segment, index):
-        self.vm_file.write(f"push {segment} {index}\n")
+        self.commands.append(("push", segment, int(index)))
 
     def write_pop(self, segment, index):
-        self.vm_file.write(f"pop {segment} {index}\n")
-        
+        self.commands.append(("pop", segment, int(index)))
+
+    def write_constant(self, value):
+        # shortest commands pushing any signed 16 bit value
+        self.commands.extend(vm_optimizer.push_constant(value))
+
     def write_arithmetic(self, command):
-        self.vm_file.write(f"{command}\n")
+        self.commands.append((command,))
 
     def write_label(self, label):
-        self.vm_file.write(f"label {label}\n")
+        self.commands.append(("label", label))
 
     def write_goto(self, label):
-        self.vm_file.write(f"goto {label}\n")
+        self.commands.append(("goto", label))
 
     def write_if(self, label):
-        self.vm_file.write(f"if-goto {label}\n")
+        self.commands.append(("if-goto", label))
 
     def write_call(self, name, num_args):
-        self.vm_file.write(f"call {name} {num_args}\n")
+        self.commands.append(("call", name, num_args))
 
     def write_function(self, name, num_locals):
-        self.vm_file.write(f"function {name} {num_locals}\n")
+        self.flush()
+        self.commands.append(("function", name, num_locals))
 
     def write_return(self):
-        self.vm_file.write(f"return\n")
+        self.commands.append(("return",))
 
     def write_comment(self, comment):
-        #self.vm_file.write(f"\n// {comment}\n")
+        #self.sink.write(f"\n// {comment}\n")
         pass
     def close(self):
-        self.vm_file.close()
+        self.flush()
+        self.sink.close()
@@ -0,0 +1,55 @@
+import unittest
+import call_graph as cg
+from vm_ir import VMCode
+
+def vm_file(*lines):
+    return VMCode.from_text("\n".join(lines))
+
+FILES = [("Main", vm_file("function Main.main 0", "call Util.used 0", "pop temp 0",
+                          "call Output.printInt 1", "return",
+                          "function Main.unused 0", "call Lib.helper 0", "return")),
+         ("Util", vm_file("function Util.used 0", "call Util.recurse 0", "return",
+                          "function Util.recurse 0", "call Util.recurse 0", "call Util.used 0", "return",
+                          "function Util.dead 0", "return")),
+         ("Lib", vm_file("function Lib.helper 0", "push constant 0", "return"))]
+
+class TestCallGraph(unittest.TestCase):
+    def test_graph(self):
+        graph = cg.call_graph(FILES)
+        self.assertEqual(graph["Main.main"], {"Util.used", "Output.printInt"})
+        self.assertEqual(graph["Util.recurse"], {"Util.recurse", "Util.used"})
+        self.assertEqual(graph["Util.dead"], set())
+
+    def test_reachable(self):
+        graph = cg.call_graph(FILES)
+        self.assertEqual(cg.reachable(graph, ["Main.main"]), {"Main.main", "Util.used", "Util.recurse"})
+        self.assertEqual(cg.reachable(graph, ["Missing.f"]), set())
+
+    def test_entry_point(self):
+        self.assertEqual(cg.entry_point(cg.call_graph(FILES)), "Main.main")
+        sys_file = ("Sys", vm_file("function Sys.init 0", "call Main.main 0", "return"))
+        self.assertEqual(cg.entry_point(cg.call_graph(FILES + [sys_file])), "Sys.init")
+
+    def test_eliminate(self):
+        files, stats = cg.eliminate_dead_code(FILES)
+        self.assertEqual([name for name, _ in files], ["Main", "Util", "Lib"])
+        self.assertEqual(files[0][1], FILES[0][1][:5])
+        self.assertEqual(files[1][1], FILES[1][1][:7])
+        self.assertEqual(len(files[2][1]), 0)
+        self.assertEqual((stats.functions, stats.functions_removed), (6, 3))
+        self.assertEqual((stats.commands, stats.commands_removed), (20, 8))
+        self.assertEqual(stats.files_removed, ["Lib"])
+        self.assertEqual(stats.size - stats.size_removed, sum(len(code.to_text()) for _, code in files))
+
+    def test_no_entry_point_keeps_everything(self):
+        files, stats = cg.eliminate_dead_code(FILES[1:])
+        self.assertEqual([code for _, code in files], [code for _, code in FILES[1:]])
+        self.assertEqual(stats.functions_removed, 0)
+        self.assertIn("nothing removed", stats.summary())
+
+    def test_explicit_roots(self):
+        files, stats = cg.eliminate_dead_code(FILES, ["Lib.helper"])
+        self.assertEqual(stats.functions_removed, 5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import class_index as ci
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+class TestScanClass(unittest.TestCase):
+    def test_points(self):
+        with open(os.path.join(FIXTURES_DIR, "Points", "Point.jack")) as jack_file:
+            signature = ci.scan_class(jack_file.read())
+        self.assertEqual(signature.name, "Point")
+        self.assertEqual((signature.fields, signature.statics), (2, 1))
+        self.assertEqual(signature.subroutines["new"], ci.Subroutine("constructor", "Point", 2))
+        self.assertEqual(signature.subroutines["getX"], ci.Subroutine("method", "int", 0))
+        self.assertEqual(signature.subroutines["origin"].kind, "function")
+
+    def test_skips_bodies(self):
+        signature = ci.scan_class("""class A {
+            static int a, b; field Array c;
+            method void f(int x, Array y, A z) { if (x) { let y[0] = "}"; } return; }
+            function int g() { return 0; }
+        }""")
+        self.assertEqual((signature.fields, signature.statics), (1, 2))
+        self.assertEqual(signature.subroutines, {"f" : ci.Subroutine("method", "void", 3),
+                                                 "g" : ci.Subroutine("function", "int", 0)})
+
+class TestClassIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.project = os.path.join(self.directory, "Points")
+        shutil.copytree(os.path.join(FIXTURES_DIR, "Points"), self.project)
+        self.jack_files = [os.path.join(self.project, name) for name in ["Main.jack", "Point.jack"]]
+        self.index_file = os.path.join(self.directory, "classes.json")
+
+    def test_lookup(self):
+        index = ci.ClassIndex.build(self.jack_files)
+        self.assertEqual(index.subroutine("Main", "main").kind, "function")
+        self.assertIsNone(index.subroutine("Point", "missing"))
+        self.assertIsNone(index.subroutine("Output", "printInt"))
+
+    def test_reused_until_file_changes(self):
+        first = ci.ClassIndex.build(self.jack_files, self.index_file)
+        self.assertEqual(first.scanned, 2)
+        second = ci.ClassIndex.build(self.jack_files, self.index_file)
+        self.assertEqual(second.scanned, 0)
+        self.assertEqual(second.digest(), first.digest())
+
+        with open(self.jack_files[1], "a") as jack_file:
+            jack_file.write("\n// edited\n")
+        third = ci.ClassIndex.build(self.jack_files, self.index_file)
+        self.assertEqual(third.scanned, 1)
+        self.assertEqual(third.digest(), first.digest(), "A comment doesn't change the signatures")
+
+    def test_digest_follows_signatures(self):
+        first = ci.ClassIndex.build(self.jack_files)
+        with open(self.jack_files[1]) as jack_file:
+            source = jack_file.read()
+        with open(self.jack_files[1], "w") as jack_file:
+            jack_file.write(source.replace("method int getX()", "function int getX()"))
+        self.assertNotEqual(ci.ClassIndex.build(self.jack_files).digest(), first.digest())
+
+    def test_broken_file_left_out(self):
+        broken = os.path.join(self.project, "Broken.jack")
+        with open(broken, "w") as jack_file:
+            jack_file.write('class Broken { function void f() { let x = "oops; } }')
+        index = ci.ClassIndex.build(self.jack_files + [broken], self.index_file)
+        self.assertEqual(sorted(index.classes), ["Main", "Point"])
+        with open(self.index_file) as index_json:
+            self.assertNotIn(os.path.abspath(broken), json.load(index_json)["files"])
+
+if __name__ == "__main__":
+    unittest.main()
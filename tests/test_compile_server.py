@@ -0,0 +1,139 @@
+import os
+import time
+import shutil
+import asyncio
+import tempfile
+import threading
+import unittest
+import compile_server as cs
+from compile_client import CompileClient
+from jack_compiler import build_class_index
+from tests.test_jack_compilation_engine import compile_jack
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+POINT_SOURCE = """class Point {
+    field int x, y;
+    constructor Point new(int ax, int ay) { let x = ax; let y = ay; return this; }
+    method int getX() { return x * 1; }
+}"""
+
+def slow_build_class_index(path, options):
+    # stands in for scanning a big project, runs in a worker
+    time.sleep(1)
+    return build_class_index(path, options)
+
+class TestCompileServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.socket_path = os.path.join(cls.directory, "compiler.sock")
+        cls.server = cs.CompileServer(cls.socket_path, jobs = 2)
+        cls.loop = asyncio.new_event_loop()
+        cls.loop.run_until_complete(cls.server.start())
+        cls.thread = threading.Thread(target = cls.loop.run_forever)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        asyncio.run_coroutine_threadsafe(cls.server.close(), cls.loop).result()
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join()
+        cls.loop.close()
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        self.client = CompileClient(self.socket_path)
+        self.addCleanup(self.client.close)
+
+    def test_ping(self):
+        self.assertEqual(self.client.request({"command" : "ping", "id" : 7}), {"ok" : True, "id" : 7})
+
+    def test_compile_source(self):
+        response = self.client.compile_source(POINT_SOURCE)
+        self.assertEqual(response["vm"].splitlines(), compile_jack(POINT_SOURCE))
+
+    def test_compile_source_options(self):
+        response = self.client.compile_source(POINT_SOURCE, optimize = True)
+        self.assertEqual(response["vm"].splitlines(), compile_jack(POINT_SOURCE, optimize = True))
+        self.assertNotIn("call Math.multiply 2", response["vm"])
+
+    def test_many_requests_on_one_connection(self):
+        responses = [self.client.compile_source(POINT_SOURCE) for _ in range(5)]
+        self.assertEqual(len({response["vm"] for response in responses}), 1)
+
+    def test_compile_path(self):
+        project = os.path.join(self.directory, "Points")
+        shutil.copytree(os.path.join(FIXTURES_DIR, "Points"), project)
+        response = self.client.compile_path(project)
+        self.assertEqual(sorted(os.path.basename(result["jack_file"]) for result in response["results"]),
+                         ["Main.jack", "Point.jack"])
+        for result in response["results"]:
+            self.assertIsNone(result["error"])
+            self.assertTrue(os.path.exists(result["vm_file"]))
+
+    def test_ping_during_path_request(self):
+        project = os.path.join(self.directory, "Slow")
+        shutil.copytree(os.path.join(FIXTURES_DIR, "Points"), project)
+        original = cs.build_class_index
+        cs.build_class_index = slow_build_class_index
+        self.addCleanup(setattr, cs, "build_class_index", original)
+
+        slow_client = CompileClient(self.socket_path)
+        self.addCleanup(slow_client.close)
+        responses = []
+        thread = threading.Thread(target = lambda: responses.append(slow_client.compile_path(project)))
+        thread.start()
+        time.sleep(0.2)
+        start = time.perf_counter()
+        self.assertEqual(self.client.request({"command" : "ping"}), {"ok" : True})
+        self.assertLess(time.perf_counter() - start, 0.5, "ping waited for the path request")
+        thread.join()
+        self.assertTrue(all(result["error"] is None for result in responses[0]["results"]))
+
+    def test_cache_evicted(self):
+        project = os.path.join(self.directory, "Cached")
+        shutil.copytree(os.path.join(FIXTURES_DIR, "Points"), project)
+        cache_dir = os.path.join(self.directory, "cache")
+        response = self.client.compile_path(project, cache_dir = cache_dir, cache_size = 1)
+        self.assertTrue(all(result["error"] is None for result in response["results"]))
+        self.assertEqual(len([name for name in os.listdir(cache_dir) if name.endswith(".vm")]), 1)
+
+    def test_errors(self):
+        self.assertIn("error", self.client.compile_source(POINT_SOURCE, fast = True))
+        self.assertIn("error", self.client.compile_source('class Point { "abc }'))
+        self.assertIn("error", self.client.request({"command" : "reboot"}))
+        self.assertIn("error", self.client.request({}))
+        self.assertIn("error", self.client.compile_path(os.path.join(self.directory, "missing")))
+        # the connection is still usable after an error
+        self.assertEqual(self.client.request({"command" : "ping"}), {"ok" : True})
+
+    def test_unsupported_options(self):
+        for options in [{"output_format" : "vmb"}, {"output_format" : "asm"}, {"collect_stats" : True},
+                        {"whole_program" : True}]:
+            response = self.client.compile_source(POINT_SOURCE, **options)
+            self.assertIn("error", response, options)
+        project = os.path.join(self.directory, "Unsupported")
+        shutil.copytree(os.path.join(FIXTURES_DIR, "Points"), project)
+        for options in [{"output_format" : "asm"}, {"collect_stats" : True}, {"inline_accessors" : True}]:
+            response = self.client.compile_path(project, **options)
+            self.assertIn("error", response, options)
+        self.assertEqual([name for name in os.listdir(project) if not name.endswith(".jack")], [],
+                         "Rejected requests write nothing")
+
+    def test_compile_path_binary(self):
+        project = os.path.join(self.directory, "Binary")
+        shutil.copytree(os.path.join(FIXTURES_DIR, "Points"), project)
+        response = self.client.compile_path(project, output_format = "vmb")
+        for result in response["results"]:
+            self.assertIsNone(result["error"])
+            self.assertTrue(result["vm_file"].endswith(".vmb"))
+            self.assertTrue(os.path.exists(result["vm_file"]))
+
+    def test_invalid_json(self):
+        self.client.stream.write(b"{not json\n")
+        self.client.stream.flush()
+        self.assertIn(b"Invalid JSON", self.client.stream.readline())
+
+if __name__ == "__main__":
+    unittest.main()
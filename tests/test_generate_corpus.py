@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+import jack_compiler as jc
+from benchmarks.generate_corpus import CorpusGenerator
+
+class TestCorpusGenerator(unittest.TestCase):
+    def generate(self, **kwargs):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        paths = CorpusGenerator(**kwargs).write(directory.name)
+        return directory.name, paths
+
+    def read(self, paths):
+        contents = []
+        for path in paths:
+            with open(path) as jack_file:
+                contents.append(jack_file.read())
+        return contents
+
+    def test_deterministic(self):
+        _, first = self.generate(classes = 3, seed = 7)
+        _, second = self.generate(classes = 3, seed = 7)
+        _, other = self.generate(classes = 3, seed = 8)
+        self.assertEqual(self.read(first), self.read(second))
+        self.assertNotEqual(self.read(first), self.read(other))
+
+    def test_scales(self):
+        _, small = self.generate(classes = 2, statements = 5)
+        _, large = self.generate(classes = 4, statements = 20)
+        self.assertEqual([os.path.basename(path) for path in small], ["Main.jack", "Class1.jack"])
+        self.assertEqual(len(large), 4)
+        self.assertLess(sum(map(len, self.read(small))), sum(map(len, self.read(large))) // 4)
+
+    def test_comment_density(self):
+        _, paths = self.generate(classes = 2, comment_density = 0)
+        self.assertFalse(any("//" in source or "/**" in source for source in self.read(paths)))
+
+    def test_compiles(self):
+        directory, _ = self.generate(classes = 3, subroutines = 3, statements = 10, expression_depth = 4)
+        results = jc.JackCompiler(directory).main()
+        self.assertTrue(all(result.error is None for result in results), [result.error for result in results])
+        with open(os.path.join(directory, "Main.vm")) as vm_file:
+            self.assertEqual(vm_file.read().count("function "), 5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+import hack_backend
+from vm_ir import VMCode
+from tests.test_jack_compilation_engine import compile_jack
+
+PREDEFINED = {"SP" : 0, "LCL" : 1, "ARG" : 2, "THIS" : 3, "THAT" : 4,
+              **{f"R{i}" : i for i in range(16)}}
+JUMPS = {"JGT" : lambda v: v > 0, "JEQ" : lambda v: v == 0, "JGE" : lambda v: v >= 0,
+         "JLT" : lambda v: v < 0, "JNE" : lambda v: v != 0, "JLE" : lambda v: v <= 0,
+         "JMP" : lambda v: True}
+
+def to_word(value):
+    return ((value + 32768) & 0xFFFF) - 32768
+
+def assemble(asm):
+    # (instructions, symbols), instructions are ("@", address) or ("C", dest, comp, jump)
+    lines = [line for line in asm.splitlines() if line]
+    symbols = dict(PREDEFINED)
+    address = 0
+    for line in lines:
+        if line.startswith("("):
+            symbols[line[1:-1]] = address
+        else:
+            address += 1
+    instructions = []
+    next_variable = 16
+    for line in lines:
+        if line.startswith("("):
+            continue
+        elif line.startswith("@"):
+            value = line[1:]
+            if not value.isdigit() and value not in symbols:
+                symbols[value] = next_variable
+                next_variable += 1
+            instructions.append(("@", int(value) if value.isdigit() else symbols[value]))
+        else:
+            dest, _, rest = line.rpartition("=")
+            comp, _, jump = rest.partition(";")
+            instructions.append(("C", dest, comp.replace("!", "~"), jump))
+    return instructions, symbols
+
+def run(asm, stop_at, max_steps = 100000):
+    # runs until the program counter reaches stop_at, returns (ram, symbols)
+    instructions, symbols = assemble(asm)
+    ram = [0] * 32768
+    a = d = pc = 0
+    for _ in range(max_steps):
+        if pc == symbols[stop_at]:
+            return ram, symbols
+        instruction = instructions[pc]
+        pc += 1
+        if instruction[0] == "@":
+            a = instruction[1]
+            continue
+        _, dest, comp, jump = instruction
+        value = to_word(eval(comp, {"A" : a, "D" : d, "M" : ram[a]}))
+        if "M" in dest:
+            ram[a] = value
+        if "A" in dest:
+            a = value & 0x7FFF
+        if "D" in dest:
+            d = value
+        if jump and JUMPS[jump](value):
+            pc = a
+    raise AssertionError("Program did not finish")
+
+# just enough OS to run compiled classes: a bump allocator and a Sys.init calling Main.main
+OS_VM = """function Sys.init 0
+call Main.main 0
+pop static 0
+label HALT
+goto HALT
+function Memory.alloc 0
+push static 1
+push constant 2048
+add
+push static 1
+push argument 0
+add
+pop static 1
+return
+"""
+
+COUNTER_PROGRAM = """class Main {
+    function int main() {
+        var Counter c;
+        var int i, total;
+        let c = Counter.new(3);
+        let i = 0;
+        while (i < 5) { do c.add(i); let i = i + 1; }
+        if (c.get() = 13) { let total = c.get() * 2; } else { let total = -1; }
+        if (~(total > 20)) { let total = 0; }
+        return total - 1;
+    }
+}"""
+
+COUNTER_CLASS = """class Counter {
+    field int count;
+    constructor Counter new(int start) { let count = start; return this; }
+    method void add(int n) { let count = count + n; return; }
+    method int get() { return count; }
+}"""
+
+class TestHackBackend(unittest.TestCase):
+    def run_program(self, optimize = False):
+        files = [("Sys", VMCode.from_text(OS_VM))]
+        for name, source in [("Main", COUNTER_PROGRAM), ("Counter", COUNTER_CLASS)]:
+            files.append((name, VMCode.from_text("\n".join(compile_jack(source, optimize = optimize)))))
+        asm = hack_backend.translate_program(files)
+        ram, symbols = run(asm, "Sys.init$HALT")
+        return ram[symbols["Sys.0"]], ram[0], asm
+
+    def test_runs_program(self):
+        result, sp, _ = self.run_program()
+        self.assertEqual(result, 25)
+        self.assertEqual(sp, 256 + 5, "Only Sys.init's frame should be left on the stack")
+
+    def test_runs_optimized_program(self):
+        self.assertEqual(self.run_program(optimize = True)[0], 25)
+
+    def test_bootstrap_only_with_sys_init(self):
+        code = VMCode.from_text("function Main.main 0\npush constant 1\nreturn\n")
+        asm = hack_backend.translate_program([("Main", code)])
+        self.assertTrue(asm.startswith("(Main.main)"))
+        asm = hack_backend.translate_program([("Sys", VMCode.from_text(OS_VM))])
+        self.assertTrue(asm.startswith("@256\nD=A\n@SP\nM=D\n"))
+
+    def test_push_pop_uses_d(self):
+        code = VMCode.from_text("function Main.main 0\npush argument 0\npop static 3\n")
+        asm = hack_backend.translate_program([("Main", code)], bootstrap = False).splitlines()
+        self.assertEqual(asm[1:5], ["@ARG", "A=M", "D=M", "@Main.3"])
+        self.assertNotIn("@SP", asm[1:6])
+
+    def test_unique_comparison_labels(self):
+        code = VMCode.from_text("function Main.main 0\n" + "push local 0\npush local 1\neq\n" * 3)
+        asm = hack_backend.translate_program([("Main", code)], bootstrap = False).splitlines()
+        labels = [line for line in asm if line.startswith("($CMP")]
+        self.assertEqual(len(labels), len(set(labels)))
+        self.assertEqual(len(labels), 3)
+
+if __name__ == "__main__":
+    unittest.main()
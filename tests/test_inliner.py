@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+import inliner
+import jack_compiler as jc
+import vm_interpreter as vi
+from vm_ir import VMCode
+
+MAIN = """class Main {
+    function int main() {
+        var Counter c, d;
+        var int i, total;
+        let c = Counter.new(3);
+        let d = Counter.new(10);
+        while (i < 5) {
+            do c.setCount(c.getCount() + d.getStep());
+            let total = total + c.getCount() + Counter.limit() + c.flag();
+            let i = i + 1;
+        }
+        do c.scale(2);
+        return total + c.getCount() + Counter.made();
+    }
+}"""
+
+COUNTER = """class Counter {
+    static int made;
+    field int count, step;
+    constructor Counter new(int s) { let count = 0; let step = s; let made = made + 1; return this; }
+    method int getCount() { return count; }
+    method int getStep() { return step; }
+    method void setCount(int value) { let count = value; return; }
+    method boolean flag() { return true; }
+    method void scale(int by) { let count = count * by; return; }
+    function int limit() { return -7; }
+    function int made() { return made; }
+}"""
+
+def vm_file(*lines):
+    return list(VMCode.from_text("\n".join(lines)))
+
+class TestClassify(unittest.TestCase):
+    def test_getter(self):
+        accessor = inliner.classify("P", vm_file("function P.getX 0", "push argument 0", "pop pointer 0",
+                                                 "push this 2", "return"))
+        self.assertEqual(accessor.kind, "getter")
+        self.assertEqual(accessor.replacement(1), [("pop", "pointer", 1), ("push", "that", 2)])
+
+    def test_setter(self):
+        accessor = inliner.classify("P", vm_file("function P.setX 0", "push argument 0", "pop pointer 0",
+                                                 "push argument 1", "pop this 0", "push constant 0", "return"))
+        self.assertEqual(accessor.kind, "setter")
+        self.assertEqual(accessor.num_args, 2)
+
+    def test_constant(self):
+        accessor = inliner.classify("P", vm_file("function P.k 0", "push constant 3", "neg", "return"))
+        self.assertEqual(accessor.replacement(2), [("pop", "temp", 0), ("pop", "temp", 0),
+                                                   ("push", "constant", 3), ("neg",)])
+
+    def test_not_trivial(self):
+        for lines in [["function P.f 1", "push local 0", "return"],
+                      ["function P.f 0", "push argument 0", "pop pointer 0", "push this 0", "push this 1",
+                       "add", "return"],
+                      ["function P.f 0", "push argument 0", "return"],
+                      ["function P.f 0", "push argument 0", "pop pointer 0", "push argument 2", "pop this 0",
+                       "push constant 0", "return"]]:
+            self.assertIsNone(inliner.classify("P", vm_file(*lines)), lines)
+
+class TestInlineProgram(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for name, source in [("Main", MAIN), ("Counter", COUNTER)]:
+            with open(os.path.join(self.directory, f"{name}.jack"), "w") as jack_file:
+                jack_file.write(source)
+
+    def build(self, **kwargs):
+        compiler = jc.JackCompiler(self.directory, **kwargs)
+        results = compiler.main()
+        self.assertTrue(all(result.error is None for result in results))
+        files = vi.load_files(self.directory)
+        return vi.VMInterpreter(files).run(), dict(files), compiler
+
+    def test_same_result(self):
+        expected, _, _ = self.build()
+        for optimize in [False, True]:
+            result, files, compiler = self.build(inline_accessors = True, optimize = optimize)
+            self.assertEqual(result, expected)
+            main = files["Main"].to_text()
+            for name in ["getCount", "getStep", "setCount", "flag", "limit"]:
+                self.assertNotIn(f"call Counter.{name}", main)
+            # scale isn't trivial and made() reads a static of another class
+            self.assertIn("call Counter.scale 2", main)
+            self.assertIn("call Counter.made 0", main)
+            self.assertEqual(sum(compiler.inlined.inlined.values()), 7)
+
+    def test_with_dead_code_elimination(self):
+        expected, _, _ = self.build()
+        result, files, compiler = self.build(inline_accessors = True, whole_program = True)
+        self.assertEqual(result, expected)
+        self.assertNotIn("function Counter.getCount", files["Counter"].to_text())
+        self.assertIn("function Counter.scale", files["Counter"].to_text())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,329 @@
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+import unittest
+import jack_compiler as jc
+import vm_binary
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+class TestJackCompiler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.project = os.path.join(self.directory, "Points")
+        shutil.copytree(os.path.join(FIXTURES_DIR, "Points"), self.project)
+
+    def read_outputs(self):
+        outputs = {}
+        for name in sorted(os.listdir(self.project)):
+            if name.endswith(".vm"):
+                with open(os.path.join(self.project, name), "rb") as vm_file:
+                    outputs[name] = vm_file.read()
+        return outputs
+
+    def test_compile_directory(self):
+        results = jc.JackCompiler(self.project).main()
+        self.assertEqual([os.path.basename(result.vm_file) for result in results],
+                         ["Main.vm", "Point.vm"])
+        self.assertTrue(all(result.error is None for result in results))
+
+    def test_parallel_matches_serial(self):
+        jc.JackCompiler(self.project).main()
+        serial = self.read_outputs()
+        for name in serial:
+            os.remove(os.path.join(self.project, name))
+
+        results = jc.JackCompiler(self.project, jobs = 2).main()
+        self.assertTrue(all(result.error is None for result in results))
+        self.assertEqual(self.read_outputs(), serial, "Parallel build output differs from serial")
+
+    def test_error_reported_per_file(self):
+        with open(os.path.join(self.project, "Broken.jack"), "w") as jack_file:
+            jack_file.write('class Broken { function void f() { let x = "oops; } }')
+        results = jc.JackCompiler(self.project, jobs = 2).main()
+        errors = {os.path.basename(result.jack_file) : result.error for result in results}
+        self.assertIsNotNone(errors["Broken.jack"])
+        self.assertIsNone(errors["Main.jack"])
+        self.assertIsNone(errors["Point.jack"])
+
+    def test_failed_compile_keeps_last_output(self):
+        jc.JackCompiler(self.project).main()
+        expected = self.read_outputs()
+        with open(os.path.join(self.project, "Main.jack"), "w") as jack_file:
+            jack_file.write('class Main { function void f() { let x = "oops; } }')
+        for kwargs in [{}, {"output_format" : "vmb"}]:
+            results = jc.JackCompiler(self.project, **kwargs).main()
+            self.assertIsNotNone(results[0].error)
+        self.assertIsNotNone(jc.compile_file(os.path.join(self.project, "Point.jack"),
+                                             jc.CompileOptions(scan_mode = "fast")).error)
+        self.assertEqual(self.read_outputs(), expected)
+        self.assertEqual([name for name in os.listdir(self.project) if name.endswith(".tmp")], [])
+
+    def test_binary_output(self):
+        jc.JackCompiler(self.project).main()
+        text = self.read_outputs()
+        results = jc.JackCompiler(self.project, output_format = "vmb").main()
+        self.assertEqual([os.path.basename(result.vm_file) for result in results],
+                         ["Main.vmb", "Point.vmb"])
+        for result in results:
+            code = vm_binary.load(result.vm_file)
+            self.assertEqual(code.to_text().encode(), text[os.path.basename(result.jack_file)[:-5] + ".vm"])
+
+    def test_asm_output(self):
+        results = jc.JackCompiler(self.project, output_format = "asm").main()
+        asm_file = os.path.join(self.project, "Points.asm")
+        self.assertEqual([result.vm_file for result in results], [asm_file, asm_file])
+        self.assertEqual(self.read_outputs(), {}, "No .vm files should be written")
+        with open(asm_file) as asm:
+            lines = asm.read().splitlines()
+        self.assertIn("(Main.main)", lines)
+        self.assertIn("(Point.new)", lines)
+
+class TestWholeProgram(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.project = os.path.join(self.directory, "Points")
+        shutil.copytree(os.path.join(FIXTURES_DIR, "Points"), self.project)
+        with open(os.path.join(self.project, "Unused.jack"), "w") as jack_file:
+            jack_file.write("class Unused { function int f() { return Point.origin(); } }")
+
+    def read_vm(self, name):
+        with open(os.path.join(self.project, name)) as vm_file:
+            return vm_file.read()
+
+    def test_unreachable_code_removed(self):
+        compiler = jc.JackCompiler(self.project, whole_program = True)
+        results = compiler.main()
+        statuses = {os.path.basename(result.jack_file) : result.status for result in results}
+        self.assertEqual(statuses, {"Main.jack" : "compiled", "Point.jack" : "compiled", "Unused.jack" : "eliminated"})
+        self.assertFalse(os.path.exists(os.path.join(self.project, "Unused.vm")))
+        point = self.read_vm("Point.vm")
+        self.assertIn("function Point.getX", point)
+        self.assertNotIn("function Point.origin", point)
+        self.assertEqual(compiler.dead_code.files_removed, ["Unused"])
+        self.assertGreater(compiler.dead_code.size_removed, 0)
+
+    def test_reachable_code_unchanged(self):
+        jc.JackCompiler(self.project).main()
+        expected = self.read_vm("Main.vm")
+        os.remove(os.path.join(self.project, "Main.vm"))
+        jc.JackCompiler(self.project, whole_program = True).main()
+        self.assertEqual(self.read_vm("Main.vm"), expected)
+        self.assertFalse(os.path.exists(os.path.join(self.project, "Unused.vm")), "Stale output is removed")
+
+    def test_binary_and_cached(self):
+        cache_dir = os.path.join(self.directory, "cache")
+        for _ in range(2):
+            results = jc.JackCompiler(self.project, whole_program = True, output_format = "vmb",
+                                      cache_dir = cache_dir).main()
+        code = vm_binary.load(os.path.join(self.project, "Point.vmb"))
+        self.assertNotIn("Point.origin", code.to_text())
+        self.assertEqual(sorted(result.status for result in results), ["eliminated", "restored", "restored"])
+
+    def test_errors_keep_everything(self):
+        with open(os.path.join(self.project, "Broken.jack"), "w") as jack_file:
+            jack_file.write('class Broken { function void f() { let x = "oops; } }')
+        compiler = jc.JackCompiler(self.project, whole_program = True)
+        results = compiler.main()
+        self.assertIsNone(compiler.dead_code)
+        self.assertIn("function Point.origin", self.read_vm("Point.vm"))
+        self.assertTrue(os.path.exists(os.path.join(self.project, "Unused.vm")))
+
+class TestCompileSource(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(FIXTURES_DIR, "Points", "Point.jack")) as jack_file:
+            self.source = jack_file.read()
+        # the reference output, compiled from the file
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        jack_path = os.path.join(self.directory, "Point.jack")
+        shutil.copy(os.path.join(FIXTURES_DIR, "Points", "Point.jack"), jack_path)
+        jc.compile_file(jack_path)
+        with open(os.path.join(self.directory, "Point.vm")) as vm_file:
+            self.expected = vm_file.read()
+
+    def test_compile_source(self):
+        self.assertEqual(jc.compile_source(self.source), self.expected)
+        self.assertEqual(jc.compile_source(self.source.encode()), self.expected)
+
+    def test_compile_source_options(self):
+        for scan_mode in ["bytes", "regex", "array", "mmap"]:
+            self.assertEqual(jc.compile_source(self.source, jc.CompileOptions(scan_mode)), self.expected)
+        self.assertIn("call Math.multiply 2", jc.compile_source("class A { function int f(int x) { return x * 3; } }",
+                                                                jc.CompileOptions(strength_reduction = False)))
+
+    def test_compile_source_resolves_own_calls(self):
+        vm = jc.compile_source("class A { function int f() { return g(1); } function int g(int x) { return x; } }")
+        self.assertIn("call A.g 1", vm.splitlines())
+        self.assertNotIn("push pointer 0", vm)
+
+    def test_compile_source_error(self):
+        self.assertRaises(Exception, jc.compile_source, 'class Broken { function void f() { let x = "oops; } }')
+
+    def test_compile_stream(self):
+        output = io.StringIO()
+        jc.compile_stream(io.StringIO(self.source), output)
+        self.assertEqual(output.getvalue(), self.expected)
+
+    def test_compile_stream_binary(self):
+        output = io.BytesIO()
+        jc.compile_stream(io.BytesIO(self.source.encode()), output, jc.CompileOptions(output_format = "vmb"))
+        self.assertEqual(vm_binary.decode(output.getvalue()).to_text(), self.expected)
+
+    def test_compile_stream_asm(self):
+        output = io.StringIO()
+        jc.compile_stream(io.StringIO(self.source), output, jc.CompileOptions(output_format = "asm"))
+        self.assertIn("(Point.new)", output.getvalue().splitlines())
+
+    def test_stdin_stdout(self):
+        compiler = os.path.join(os.path.dirname(jc.__file__), "jack_compiler.py")
+        process = subprocess.run([sys.executable, compiler, "-"], input = self.source, capture_output = True,
+                                 text = True)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertEqual(process.stdout, self.expected)
+
+    def test_stdin_rejects_project_options(self):
+        compiler = os.path.join(os.path.dirname(jc.__file__), "jack_compiler.py")
+        for flags in [["--stats"], ["--cache-dir", self.directory], ["-j", "2"], ["--whole-program"], ["--inline"]]:
+            process = subprocess.run([sys.executable, compiler, "-"] + flags, input = self.source,
+                                     capture_output = True, text = True)
+            self.assertEqual(process.returncode, 2, flags)
+            self.assertEqual(process.stdout, "")
+
+class TestCompileStats(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.project = os.path.join(self.directory, "Points")
+        shutil.copytree(os.path.join(FIXTURES_DIR, "Points"), self.project)
+
+    def test_disabled_by_default(self):
+        compiler = jc.JackCompiler(self.project)
+        results = compiler.main()
+        self.assertIsNone(compiler.stats)
+        self.assertTrue(all(result.stats is None for result in results))
+
+    def test_counters(self):
+        compiler = jc.JackCompiler(self.project, collect_stats = True)
+        compiler.main()
+        stats = {os.path.basename(file_stats.jack_file) : file_stats for file_stats in compiler.stats.files}
+        point = stats["Point.jack"]
+        self.assertEqual(point.bytes_read, os.path.getsize(os.path.join(self.project, "Point.jack")))
+        self.assertGreater(point.tokens, 0)
+        self.assertGreater(point.symbol_lookups, 0)
+        self.assertEqual(point.subroutines, 6)
+        with open(os.path.join(self.project, "Point.vm")) as vm_file:
+            lines = vm_file.read().splitlines()
+        self.assertEqual(sum(point.instructions.values()), len(lines))
+        self.assertEqual(point.instructions["return"], 6)
+        self.assertGreaterEqual(point.total, sum(point.phases.values()))
+
+    def test_string_builders_arent_subroutines(self):
+        compiler = jc.JackCompiler(self.project, collect_stats = True, intern_strings = True)
+        compiler.main()
+        self.assertEqual(compiler.stats.totals().subroutines, 8)
+
+    def test_lazy_scan_modes_time_tokenizing(self):
+        compiler = jc.JackCompiler(self.project, collect_stats = True)
+        compiler.main()
+        expected = {file_stats.jack_file : file_stats.tokens for file_stats in compiler.stats.files}
+        for scan_mode in ["bytes", "regex"]:
+            compiler = jc.JackCompiler(self.project, scan_mode, collect_stats = True)
+            compiler.main()
+            for file_stats in compiler.stats.files:
+                self.assertEqual(file_stats.tokens, expected[file_stats.jack_file], scan_mode)
+                self.assertGreater(file_stats.phases["tokenize"], 0)
+                self.assertGreaterEqual(file_stats.phases["compile"], 0)
+                self.assertGreaterEqual(file_stats.total, sum(file_stats.phases.values()))
+
+    def test_hooks_and_reports(self):
+        seen = []
+        compiler = jc.JackCompiler(self.project, jobs = 2)
+        compiler.add_hook(lambda result: seen.append(os.path.basename(result.stats.jack_file)))
+        compiler.main()
+        self.assertEqual(sorted(seen), ["Main.jack", "Point.jack"])
+        table = compiler.stats.table()
+        self.assertIn("Point.jack", table)
+        self.assertIn("instructions: push", table)
+        report = json.loads(compiler.stats.to_json())
+        self.assertEqual(len(report["files"]), 2)
+        self.assertEqual(report["totals"]["subroutines"], 8)
+
+    def test_cache_hits(self):
+        cache_dir = os.path.join(self.directory, "cache")
+        jc.JackCompiler(self.project, cache_dir = cache_dir).main()
+        compiler = jc.JackCompiler(self.project, cache_dir = cache_dir, collect_stats = True)
+        compiler.main()
+        self.assertEqual([file_stats.status for file_stats in compiler.stats.files], ["kept", "kept"])
+
+class TestBuildCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.project = os.path.join(self.directory, "Points")
+        self.cache_dir = os.path.join(self.directory, "cache")
+        shutil.copytree(os.path.join(FIXTURES_DIR, "Points"), self.project)
+
+    def compile(self, **kwargs):
+        compiler = jc.JackCompiler(self.project, cache_dir = self.cache_dir, **kwargs)
+        results = compiler.main()
+        return {os.path.basename(result.jack_file) : result.status for result in results}, compiler.cache_stats
+
+    def test_unchanged_files_are_kept(self):
+        statuses, stats = self.compile()
+        self.assertEqual(statuses, {"Main.jack" : "compiled", "Point.jack" : "compiled"})
+        self.assertEqual((stats.hits, stats.misses, stats.entries), (0, 2, 2))
+
+        statuses, stats = self.compile()
+        self.assertEqual(statuses, {"Main.jack" : "kept", "Point.jack" : "kept"})
+        self.assertEqual((stats.kept, stats.misses), (2, 0))
+
+    def test_missing_output_is_restored(self):
+        self.compile()
+        vm_path = os.path.join(self.project, "Point.vm")
+        with open(vm_path) as vm_file:
+            expected = vm_file.read()
+        os.remove(vm_path)
+
+        statuses, stats = self.compile(jobs = 2)
+        self.assertEqual(statuses["Point.jack"], "restored")
+        with open(vm_path) as vm_file:
+            self.assertEqual(vm_file.read(), expected)
+
+    def test_changed_source_recompiles(self):
+        self.compile()
+        with open(os.path.join(self.project, "Point.jack"), "a") as jack_file:
+            jack_file.write("\n// edited\n")
+        statuses, stats = self.compile()
+        self.assertEqual(statuses, {"Main.jack" : "kept", "Point.jack" : "compiled"})
+
+    def test_binary_output_kept(self):
+        self.compile(output_format = "vmb")
+        statuses, _ = self.compile(output_format = "vmb")
+        self.assertEqual(statuses, {"Main.jack" : "kept", "Point.jack" : "kept"})
+        self.assertTrue(os.path.exists(os.path.join(self.project, "Main.vmb")))
+
+    def test_class_index_stored(self):
+        self.compile()
+        index_file = os.path.join(self.cache_dir, jc.CLASS_INDEX_FILE)
+        with open(index_file) as index_json:
+            self.assertEqual(len(json.load(index_json)["files"]), 2)
+        compiler = jc.JackCompiler(self.project, cache_dir = self.cache_dir)
+        compiler.main()
+        self.assertEqual(compiler.class_index.scanned, 0)
+
+    def test_eviction(self):
+        self.compile()
+        with open(os.path.join(self.project, "Point.jack"), "a") as jack_file:
+            jack_file.write("\n// edited\n")
+        statuses, stats = self.compile(cache_size = 2)
+        self.assertEqual((stats.evicted, stats.entries), (1, 2))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,321 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import jack_tokenizer as jt
+import jack_compilation_engine as jce
+from build_cache import BuildCache
+from class_index import ClassIndex, scan_class
+
+def compile_engine(source, **kwargs):
+    # compiles a single class, returns the VM commands as a list of lines and the engine
+    with tempfile.TemporaryDirectory() as directory:
+        jack_path = os.path.join(directory, "Test.jack")
+        with open(jack_path, "w") as jack_file:
+            jack_file.write(source)
+        tokenizer = jt.JackTokenizer(jack_path)
+        output = io.StringIO()
+        compilation_engine = jce.CompilationEngine(output, tokenizer, **kwargs)
+        compilation_engine.main()
+        tokenizer.close()
+        return output.getvalue().splitlines(), compilation_engine
+
+def compile_jack(source, **kwargs):
+    return compile_engine(source, **kwargs)[0]
+
+class TestSymbolResolution(unittest.TestCase):
+    def test_field_maps_to_this(self):
+        vm = compile_jack("""class Test {
+            field int a, b;
+            method int getB() { return b; }
+        }""")
+        self.assertIn("push this 1", vm)
+
+    def test_local_shadows_field(self):
+        vm = compile_jack("""class Test {
+            field int a;
+            method int get() { var int a; let a = 3; return a; }
+        }""")
+        self.assertIn("pop local 0", vm)
+        self.assertNotIn("pop this 0", vm)
+
+    def test_static_and_argument(self):
+        vm = compile_jack("""class Test {
+            static int s;
+            function void set(int v) { let s = v; return; }
+        }""")
+        self.assertEqual(vm[1:3], ["push argument 0", "pop static 0"])
+
+    def test_method_call_on_variable(self):
+        vm = compile_jack("""class Test {
+            function void run(Point p) { do p.move(1); return; }
+        }""")
+        self.assertEqual(vm[1:4], ["push argument 0", "push constant 1", "call Point.move 2"])
+
+    def test_undefined_variable(self):
+        self.assertRaises(jce.CompileError, compile_jack, """class Test {
+            function int get() { return missing; }
+        }""")
+
+def compile_return(expression, **kwargs):
+    # VM commands computing the value of expression in a function returning it
+    vm = compile_jack(f"""class Test {{
+        function int f(int x) {{ return {expression}; }}
+    }}""", **kwargs)
+    return vm[1:-1]
+
+class TestConstantFolding(unittest.TestCase):
+    def test_multiply(self):
+        self.assertEqual(compile_return("(3 * 4)"), ["push constant 12"])
+
+    def test_divide_rounds_towards_zero(self):
+        self.assertEqual(compile_return("(-7) / 2"), ["push constant 3", "neg"])
+
+    def test_divide_by_zero_left_to_runtime(self):
+        self.assertEqual(compile_return("1 / 0"),
+                         ["push constant 1", "push constant 0", "call Math.divide 2"])
+
+    def test_not_false(self):
+        self.assertEqual(compile_return("~false"), ["push constant 1", "neg"])
+
+    def test_wraparound(self):
+        self.assertEqual(compile_return("(200 * 200)"), ["push constant 25536", "neg"])
+        self.assertEqual(compile_return("32767 + 1"), ["push constant 32767", "not"])
+
+    def test_nested(self):
+        self.assertEqual(compile_return("((2 + 3) * (10 - 4))"), ["push constant 30"])
+
+    def test_comparison(self):
+        self.assertEqual(compile_return("(1 < 2)"), ["push constant 1", "neg"])
+
+    def test_partly_constant(self):
+        self.assertEqual(compile_return("x + (2 * 3)"),
+                         ["push argument 0", "push constant 6", "add"])
+
+    def test_disabled(self):
+        self.assertEqual(compile_return("3 * 4", fold_constants = False, strength_reduction = False),
+                         ["push constant 3", "push constant 4", "call Math.multiply 2"])
+
+class TestStrengthReduction(unittest.TestCase):
+    def test_double(self):
+        self.assertEqual(compile_return("x * 2"), ["push argument 0", "push argument 0", "add"])
+
+    def test_constant_on_the_left(self):
+        self.assertEqual(compile_return("2 * x"), ["push argument 0", "push argument 0", "add"])
+
+    def test_power_of_two(self):
+        self.assertEqual(compile_return("x * 4"),
+                         ["push argument 0", "push argument 0", "add",
+                          "pop temp 0", "push temp 0", "push temp 0", "add"])
+
+    def test_negative_power_of_two(self):
+        self.assertEqual(compile_return("x * (-2)"), ["push argument 0", "push argument 0", "add", "neg"])
+
+    def test_complex_operand(self):
+        self.assertEqual(compile_return("(x + 1) * 2"),
+                         ["push argument 0", "push constant 1", "add",
+                          "pop temp 0", "push temp 0", "push temp 0", "add"])
+
+    def test_times_one(self):
+        self.assertEqual(compile_return("x * 1"), ["push argument 0"])
+        self.assertEqual(compile_return("x / 1"), ["push argument 0"])
+        self.assertEqual(compile_return("x / (-1)"), ["push argument 0", "neg"])
+
+    def test_times_zero(self):
+        self.assertEqual(compile_return("x * 0"), ["push constant 0"])
+
+    def test_times_zero_keeps_calls(self):
+        self.assertEqual(compile_return("0 * Test.g()"),
+                         ["call Test.g 0", "pop temp 0", "push constant 0"])
+
+    def test_other_constants_call_math(self):
+        self.assertEqual(compile_return("x * 3"), ["push argument 0", "push constant 3", "call Math.multiply 2"])
+        self.assertEqual(compile_return("x / 2"), ["push argument 0", "push constant 2", "call Math.divide 2"])
+        self.assertEqual(compile_return("x / 0"), ["push argument 0", "push constant 0", "call Math.divide 2"])
+
+    def test_disabled(self):
+        self.assertEqual(compile_return("x * 2", strength_reduction = False),
+                         ["push argument 0", "push constant 2", "call Math.multiply 2"])
+
+class TestExpressionChains(unittest.TestCase):
+    def test_left_to_right(self):
+        self.assertEqual(compile_return("x + x - 1", fold_constants = False),
+                         ["push argument 0", "push argument 0", "add", "push constant 1", "sub"])
+
+    def test_no_precedence(self):
+        #Jack evaluates operators left to right, so this is (1 + 2) * 4
+        self.assertEqual(compile_return("1 + 2 * 4"), ["push constant 12"])
+
+    def test_folds_constant_prefix(self):
+        self.assertEqual(compile_return("2 + 3 + x"), ["push constant 5", "push argument 0", "add"])
+
+    def test_strength_reduction_in_chain(self):
+        self.assertEqual(compile_return("x + 1 * 4"),
+                         ["push argument 0", "push constant 1", "add", "pop temp 0",
+                          "push temp 0", "push temp 0", "add", "pop temp 0", "push temp 0", "push temp 0", "add"])
+
+    def test_calls_and_arrays_in_chain(self):
+        vm = compile_return("Test.f(x, -x) + x[x + 1] + g()")
+        self.assertEqual(vm, ["push argument 0", "push argument 0", "neg", "call Test.f 2",
+                              "push argument 0", "push constant 1", "add", "push argument 0", "add",
+                              "pop pointer 1", "push that 0", "add",
+                              "push pointer 0", "call Test.g 1", "add"])
+
+    def test_long_chain(self):
+        vm = compile_return(" + ".join(["x"] * 5000))
+        self.assertEqual(vm.count("add"), 4999)
+
+    def test_deep_nesting(self):
+        depth = 5000
+        vm = compile_return("(" * depth + "x" + " + 1)" * depth)
+        self.assertEqual(vm.count("add"), depth)
+        vm = compile_return("-" * depth + "x")
+        self.assertEqual(vm.count("neg"), depth)
+        vm = compile_return("Test.f(" * depth + "x" + ")" * depth)
+        self.assertEqual(vm.count("call Test.f 1"), depth)
+        vm = compile_return("x[" * depth + "x" + "]" * depth)
+        self.assertEqual(vm.count("push that 0"), depth)
+
+    def test_deep_constant_nesting_folds(self):
+        self.assertEqual(compile_return("(" * 3000 + "1" + " + 1)" * 3000), ["push constant 3001"])
+
+COUNTER_CLASS = """class Test {
+    field int count;
+    method void increment() { let count = count + 1; return; }
+    method int get() { if (count > 10) { return 10; } return count; }
+    method void reset() { while (count > 0) { let count = count - 1; } return; }
+}"""
+
+class TestCallResolution(unittest.TestCase):
+    SOURCE = """class Test {
+        field Test next;
+        function int twice(int x) { return x + x; }
+        method int get() { return 1; }
+        method int run() {
+            do twice(2);
+            do get();
+            do next.twice(3);
+            do next.get();
+            return twice(get());
+        }
+    }"""
+
+    def compile_indexed(self, *classes):
+        index = ClassIndex([scan_class(self.SOURCE)] + [scan_class(source) for source in classes])
+        return compile_jack(self.SOURCE, class_index = index)
+
+    def test_function_called_without_object(self):
+        vm = self.compile_indexed()
+        start = vm.index("function Test.run 0")
+        self.assertEqual(vm[start + 3:start + 6], ["push constant 2", "call Test.twice 1", "pop temp 0"])
+        self.assertEqual(vm[-4:], ["push pointer 0", "call Test.get 1", "call Test.twice 1", "return"])
+        self.assertNotIn("call Test.twice 2", vm)
+
+    def test_methods_still_pass_object(self):
+        vm = self.compile_indexed()
+        self.assertEqual(vm.count("call Test.get 1"), 3)
+        index = vm.index("push constant 3")
+        self.assertEqual(vm[index - 1:index + 2], ["pop temp 0", "push constant 3", "call Test.twice 1"])
+
+    def test_without_index_everything_is_a_method(self):
+        vm = compile_jack(self.SOURCE)
+        self.assertEqual(vm.count("call Test.twice 2"), 3)
+
+    def test_other_classes(self):
+        source = """class Main {
+            function void main() {
+                var Counter c;
+                let c = Counter.new();
+                do c.reset();
+                do c.describe(1);
+                return;
+            }
+        }"""
+        counter = """class Counter {
+            field int count;
+            constructor Counter new() { return this; }
+            method void reset() { let count = 0; return; }
+            function void describe(int x) { return; }
+        }"""
+        index = ClassIndex([scan_class(source), scan_class(counter)])
+        vm = compile_jack(source, class_index = index)
+        self.assertIn("call Counter.new 0", vm)
+        self.assertIn("call Counter.reset 1", vm)
+        self.assertIn("call Counter.describe 1", vm)
+        # OS classes aren't in the index, calls on them are left alone
+        vm = compile_jack("""class Main {
+            function void main() { var String s; do s.appendChar(65); return; }
+        }""", class_index = index)
+        self.assertIn("call String.appendChar 2", vm)
+
+class TestSubroutineFragments(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def compile_cached(self, source):
+        return compile_engine(source, fragment_cache = BuildCache(self.cache_dir))
+
+    def test_unchanged_subroutines_reused(self):
+        vm, compilation_engine = self.compile_cached(COUNTER_CLASS)
+        self.assertEqual(compilation_engine.fragments_reused, 0)
+        self.assertEqual(vm, compile_jack(COUNTER_CLASS))
+
+        edited = COUNTER_CLASS.replace("return 10;", "return 11;")
+        vm, compilation_engine = self.compile_cached(edited)
+        self.assertEqual(compilation_engine.fragments_reused, 2)
+        self.assertEqual(vm, compile_jack(edited))
+
+    def test_class_state_change_recompiles(self):
+        self.compile_cached(COUNTER_CLASS)
+        edited = COUNTER_CLASS.replace("field int count;", "field int other, count;")
+        vm, compilation_engine = self.compile_cached(edited)
+        self.assertEqual(compilation_engine.fragments_reused, 0)
+        self.assertIn("push this 1", vm)
+
+GREETER_CLASS = """class Test {
+    function void hello() { do Output.printString("hi"); return; }
+    function void again() { do Output.printString("hi"); do Output.printString("yo"); return; }
+}"""
+
+class TestStringPool(unittest.TestCase):
+    def test_literal_built_once(self):
+        vm = compile_jack(GREETER_CLASS, intern_strings = True)
+        self.assertEqual(vm.count("call String.new 1"), 2)
+        self.assertEqual(vm[1:7], ["push static 0", "if-goto STRING_READY0", "call Test.__string0 0",
+                                   "pop static 0", "label STRING_READY0", "push static 0"])
+        self.assertEqual(vm.count("call Test.__string0 0"), 2)
+        self.assertIn("call Test.__string1 0", vm)
+
+    def test_builder_function(self):
+        vm = compile_jack(GREETER_CLASS, intern_strings = True)
+        start = vm.index("function Test.__string0 0")
+        self.assertEqual(vm[start + 1:start + 8], ["push constant 2", "call String.new 1",
+                                                   "push constant 104", "call String.appendChar 2",
+                                                   "push constant 105", "call String.appendChar 2",
+                                                   "return"])
+
+    def test_after_class_statics(self):
+        vm = compile_jack("""class Test {
+            static int a, b;
+            function void hello() { do Output.printString("hi"); return; }
+        }""", intern_strings = True)
+        self.assertIn("call Test.__string2 0", vm)
+
+    def test_disabled(self):
+        vm = compile_jack(GREETER_CLASS)
+        self.assertEqual(vm.count("call String.new 1"), 3)
+        self.assertNotIn("push static 0", vm)
+
+    def test_cached_subroutines_keep_pool(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            compile_engine(GREETER_CLASS, intern_strings = True, fragment_cache = BuildCache(cache_dir))
+            edited = GREETER_CLASS.replace('"yo"', '"hey"')
+            vm, compilation_engine = compile_engine(edited, intern_strings = True,
+                                                    fragment_cache = BuildCache(cache_dir))
+        self.assertEqual(compilation_engine.fragments_reused, 1)
+        self.assertEqual(vm, compile_jack(edited, intern_strings = True))
+
+if __name__ == "__main__":
+    unittest.main()
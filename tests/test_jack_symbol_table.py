@@ -0,0 +1,55 @@
+import unittest
+import jack_analyzer.jack_symbol_table as st
+
+class TestSymbolTable(unittest.TestCase):
+    def setUp(self):
+        self.symtab = st.SymbolTable()
+        self.symtab.define({"name" : "x", "type" : "int", "kind" : "local"})
+        self.symtab.define({"name" : "p", "type" : "Point", "kind" : "argument"})
+        self.symtab.define({"name" : "y", "type" : "boolean", "kind" : "local"})
+
+    def test_index_per_kind(self):
+        self.assertEqual(self.symtab.index_of("x"), 0, "First local should have index 0")
+        self.assertEqual(self.symtab.index_of("y"), 1, "Second local should have index 1")
+        self.assertEqual(self.symtab.index_of("p"), 0, "First argument should have index 0")
+
+    def test_var_count(self):
+        self.assertEqual(self.symtab.var_count("local"), 2)
+        self.assertEqual(self.symtab.var_count("argument"), 1)
+        self.assertEqual(self.symtab.var_count("field"), 0)
+
+    def test_kind_and_type(self):
+        self.assertEqual(self.symtab.kind_of("p"), "argument")
+        self.assertEqual(self.symtab.type_of("p"), "Point")
+
+    def test_exists(self):
+        self.assertTrue(self.symtab.exists("y"))
+        self.assertFalse(self.symtab.exists("z"))
+
+    def test_not_found(self):
+        self.assertRaises(st.JackSymbolNotFound, self.symtab.kind_of, "z")
+        self.assertRaises(st.JackSymbolNotFound, self.symtab.index_of, "z")
+
+class TestScopedResolution(unittest.TestCase):
+    def setUp(self):
+        self.class_symtab = st.SymbolTable()
+        self.class_symtab.define({"name" : "x", "type" : "int", "kind" : "field"})
+        self.class_symtab.define({"name" : "count", "type" : "int", "kind" : "static"})
+        self.symtab = st.SymbolTable(self.class_symtab)
+        self.symtab.define({"name" : "count", "type" : "int", "kind" : "local"})
+
+    def test_resolve_class_field(self):
+        symbol = self.symtab.resolve("x")
+        self.assertEqual((symbol.segment, symbol.index, symbol.type), ("this", 0, "int"))
+
+    def test_resolve_prefers_subroutine_scope(self):
+        self.assertEqual(self.symtab.resolve("count").segment, "local")
+
+    def test_resolve_missing(self):
+        self.assertIsNone(self.symtab.resolve("y"))
+
+    def test_local_methods_ignore_parent(self):
+        self.assertFalse(self.symtab.exists("x"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,25 @@
+import os
+import tempfile
 import unittest
 import jack_analyzer.jack_tokenizer as jt
 import pdb
 
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+def read_tokens(jack_filepath, mode):
+    tokenizer = jt.JackTokenizer(jack_filepath, mode)
+    tokens = []
+    tokenizer.advance()
+    while tokenizer.has_more_tokens():
+        tokens.append((tokenizer.current_token, tokenizer.token_type()))
+        tokenizer.advance()
+    tokenizer.close()
+    return tokens
+
 class TestJackTokenizer(unittest.TestCase):
     def setUp(self):
-        self.tokenizer = jt.JackTokenizer(r"C:\Users\verno\OneDrive\Documents\nand2tetris\projects\10\ArrayTest\Main.jack")
+        self.tokenizer = jt.JackTokenizer(os.path.join(FIXTURES_DIR, "Points", "Main.jack"))
+        self.addCleanup(self.tokenizer.close)
 
     def test_tokentype_keyword(self):
         self.tokenizer._set_current_token("class")
@@ -52,5 +67,102 @@ class TestJackTokenizer(unittest.TestCase):
     def tearDown(self):
         self.tokenizer.close()
 
+class TestJackTokenizerScanModes(unittest.TestCase):
+    def write_source(self, source):
+        handle, path = tempfile.mkstemp(suffix=".jack")
+        with os.fdopen(handle, "w") as jack_file:
+            jack_file.write(source)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_modes_match_bytes(self):
+        for name in ["Main.jack", "Point.jack"]:
+            path = os.path.join(FIXTURES_DIR, "Points", name)
+            expected = read_tokens(path, "bytes")
+            for mode in ["regex", "array", "mmap"]:
+                self.assertEqual(read_tokens(path, mode), expected,
+                                 f"{mode} scan mode disagrees with bytes on {name}")
+
+    def test_regex_comments_and_strings(self):
+        path = self.write_source('/** doc */ let s = "a // b"; // c\n/* x * y */ x/y')
+        tokens = [token for token, _ in read_tokens(path, "regex")]
+        self.assertEqual(tokens, ["let", "s", "=", '"a // b"', ";", "x", "/", "y"])
+
+    def test_regex_keyword_prefix(self):
+        path = self.write_source("classes do double")
+        self.assertEqual(read_tokens(path, "regex"),
+                         [("classes", jt.JackTokenType.IDENTIFIER),
+                          ("do", jt.JackTokenType.KEYWORD),
+                          ("double", jt.JackTokenType.IDENTIFIER)])
+
+    def test_regex_invalid_word(self):
+        tokenizer = jt.JackTokenizer(self.write_source("2abc;"), "regex")
+        tokenizer.advance()
+        self.assertEqual(tokenizer.current_token, "2abc")
+        self.assertRaises(jt.InvalidToken, tokenizer.token_type)
+
+    def test_regex_unterminated_string(self):
+        tokenizer = jt.JackTokenizer(self.write_source('x = "abc'), "regex")
+        tokenizer.advance_n(2)
+        self.assertRaises(jt.InvalidToken, tokenizer.advance)
+
+    def test_array_unterminated_string(self):
+        self.assertRaises(jt.InvalidToken, jt.JackTokenizer, self.write_source('x = "abc'), "array")
+
+    def test_array_peek(self):
+        tokenizer = jt.JackTokenizer(self.write_source("do Foo.bar(x);"), "array")
+        tokenizer.advance_n(2)
+        self.assertEqual(tokenizer.current_token, "Foo")
+        self.assertEqual(tokenizer.peek(), ".")
+        self.assertEqual(tokenizer.peek(3), "(")
+        self.assertEqual(tokenizer.peek_type(2), jt.JackTokenType.IDENTIFIER)
+        self.assertIsNone(tokenizer.peek(10))
+        self.assertEqual(tokenizer.token_offset(), 3)
+
+    def test_array_interns_tokens(self):
+        tokenizer = jt.JackTokenizer(self.write_source("x + x + x"), "array")
+        self.assertEqual(len(tokenizer._strings), 2)
+        self.assertEqual(list(tokenizer._token_ids), [0, 1, 0, 1, 0])
+
+    def test_mmap_spans(self):
+        tokenizer = jt.JackTokenizer(self.write_source('let name = "hi";'), "mmap")
+        tokenizer.advance_n(2)
+        self.assertEqual(tokenizer.current_token, "name")
+        self.assertEqual(tokenizer.token_span(), (4, 8))
+        self.assertEqual(tokenizer.peek(2), '"hi"')
+        tokenizer.close()
+
+    def test_mmap_shares_names(self):
+        tokenizer = jt.JackTokenizer(self.write_source("name + name"), "mmap")
+        tokenizer.advance()
+        first = tokenizer.current_token
+        tokenizer.advance_n(2)
+        self.assertIs(tokenizer.current_token, first)
+        tokenizer.close()
+
+    def test_mmap_empty_file(self):
+        tokenizer = jt.JackTokenizer(self.write_source(""), "mmap")
+        tokenizer.advance()
+        self.assertFalse(tokenizer.has_more_tokens())
+        tokenizer.close()
+
+    def test_from_source_matches_file(self):
+        path = os.path.join(FIXTURES_DIR, "Points", "Point.jack")
+        with open(path) as jack_file:
+            source = jack_file.read()
+        for mode in jt.SCAN_MODES:
+            tokenizer = jt.JackTokenizer.from_source(source, mode)
+            tokens = []
+            tokenizer.advance()
+            while tokenizer.has_more_tokens():
+                tokens.append((tokenizer.current_token, tokenizer.token_type()))
+                tokenizer.advance()
+            tokenizer.close()
+            self.assertEqual(tokens, read_tokens(path, mode), f"{mode} scan mode differs on in-memory source")
+
+    def test_regex_peek_unsupported(self):
+        tokenizer = jt.JackTokenizer(self.write_source("x"), "regex")
+        self.assertRaises(ValueError, tokenizer.peek)
+
 if __name__ == "__main__":
     unittest.main()
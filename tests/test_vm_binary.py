@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+import vm_binary
+from vm_ir import VMCode
+
+VM_TEXT = """function Main.main 300
+push constant 20000
+pop static 1
+label LOOP
+push local 0
+push constant 1
+add
+pop local 0
+push local 0
+if-goto LOOP
+call Output.printInt 1
+pop temp 0
+push constant 0
+return
+"""
+
+class TestVMBinary(unittest.TestCase):
+    def test_round_trip(self):
+        code = VMCode.from_text(VM_TEXT)
+        self.assertEqual(vm_binary.decode(vm_binary.encode(code)).to_text(), VM_TEXT)
+
+    def test_compact(self):
+        data = vm_binary.encode(VMCode.from_text(VM_TEXT))
+        self.assertTrue(data.startswith(vm_binary.MAGIC))
+        self.assertLess(len(data), len(VM_TEXT) // 2)
+        #each name is stored once
+        self.assertEqual(data.count(b"LOOP"), 1)
+
+    def test_invalid(self):
+        self.assertRaises(vm_binary.InvalidVMBinary, vm_binary.decode, b"push constant 1\n")
+        data = vm_binary.encode(VMCode.from_text(VM_TEXT))
+        self.assertRaises(vm_binary.InvalidVMBinary, vm_binary.decode, data[:-3])
+
+    def test_convert_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            vm_path = os.path.join(directory, "Main.vm")
+            vmb_path = os.path.join(directory, "Main.vmb")
+            with open(vm_path, "w") as vm_file:
+                vm_file.write(VM_TEXT)
+            vm_binary.vm_to_vmb(vm_path, vmb_path)
+            os.remove(vm_path)
+            vm_binary.vmb_to_vm(vmb_path, vm_path)
+            with open(vm_path) as vm_file:
+                self.assertEqual(vm_file.read(), VM_TEXT)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+import jack_compiler as jc
+import vm_interpreter as vi
+from vm_ir import VMCode
+from tests.test_jack_compilation_engine import compile_jack
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+def run_jack(source, **kwargs):
+    # compiles a Main class and runs Main.main, returns (result, interpreter)
+    code = VMCode.from_text("\n".join(compile_jack(source, **kwargs)))
+    interpreter = vi.VMInterpreter([("Main", code)])
+    return interpreter.run(), interpreter
+
+LOOP_PROGRAM = """class Main {
+    function int main() {
+        var int i, total;
+        while (i < 10) {
+            let total = total + (i * 4);
+            do Output.printString("x");
+            let i = i + 1;
+        }
+        return total;
+    }
+}"""
+
+class TestVMInterpreter(unittest.TestCase):
+    def test_runs_compiled_project(self):
+        with tempfile.TemporaryDirectory() as directory:
+            project = os.path.join(directory, "Points")
+            shutil.copytree(os.path.join(FIXTURES_DIR, "Points"), project)
+            jc.JackCompiler(project).main()
+            interpreter = vi.VMInterpreter(vi.load_files(project))
+        self.assertEqual(interpreter.run(), 0)
+        self.assertEqual("".join(interpreter.output), "total22")
+        self.assertEqual(interpreter.profile.calls["Point.new"], 2)
+        self.assertEqual(interpreter.profile.calls["Output.printInt"], 1)
+
+    def test_profile(self):
+        result, interpreter = run_jack(LOOP_PROGRAM)
+        self.assertEqual(result, 180)
+        profile = interpreter.profile
+        self.assertEqual(profile.hot_functions(1)[0][0], "Main.main")
+        self.assertEqual(profile.instructions["Main.main"], profile.steps)
+        self.assertEqual(profile.calls["String.new"], 10)
+        self.assertGreater(profile.max_stack_depth, 0)
+        self.assertIn("Main.main", profile.summary())
+
+    def test_measures_code_generation(self):
+        _, plain = run_jack(LOOP_PROGRAM, strength_reduction = False)
+        _, reduced = run_jack(LOOP_PROGRAM)
+        _, interned = run_jack(LOOP_PROGRAM, intern_strings = True)
+        self.assertEqual(plain.profile.calls["Math.multiply"], 10)
+        self.assertNotIn("Math.multiply", reduced.profile.calls)
+        self.assertEqual(interned.profile.calls["String.new"], 1)
+        self.assertLess(interned.profile.steps, reduced.profile.steps)
+
+    def test_strings_and_arrays(self):
+        result, interpreter = run_jack("""class Main {
+            function int main() {
+                var String s;
+                var Array a;
+                let s = String.new(6);
+                do s.setInt(-42);
+                let a = Array.new(3);
+                let a[2] = s.intValue() / 5;
+                do Output.printString(s);
+                return a[2] + s.length();
+            }
+        }""")
+        self.assertEqual(result, -5)
+        self.assertEqual(interpreter.output, ["-42"])
+
+    def test_runtime_errors(self):
+        source = "class Main { function int main() { var int z; return %s; } }"
+        self.assertRaises(vi.VMRuntimeError, run_jack, source % "7 / z")
+        self.assertRaises(vi.VMRuntimeError, run_jack, source % "Screen.clearScreen()")
+        code = VMCode.from_text("function Main.main 0\nlabel LOOP\ngoto LOOP\n")
+        self.assertRaises(vi.VMRuntimeError, vi.VMInterpreter([("Main", code)]).run, None, 1000)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import vm_ir
+
+COMMANDS = [("function", "Main.main", 1), ("push", "constant", 7), ("pop", "local", 0),
+            ("label", "WHILE_EXP0"), ("push", "local", 0), ("not",), ("if-goto", "WHILE_END0"),
+            ("call", "Main.step", 0), ("goto", "WHILE_EXP0"), ("label", "WHILE_END0"),
+            ("push", "constant", 0), ("return",)]
+
+class TestVMCode(unittest.TestCase):
+    def test_round_trip(self):
+        code = vm_ir.VMCode(COMMANDS)
+        self.assertEqual(len(code), len(COMMANDS))
+        self.assertEqual(list(code), COMMANDS)
+        self.assertEqual(code[-1], ("return",))
+
+    def test_names_interned(self):
+        code = vm_ir.VMCode(COMMANDS)
+        self.assertEqual(code.names.names, ["Main.main", "WHILE_EXP0", "WHILE_END0", "Main.step"])
+
+    def test_text(self):
+        code = vm_ir.VMCode(COMMANDS)
+        text = code.to_text()
+        self.assertTrue(text.startswith("function Main.main 1\npush constant 7\n"))
+        self.assertEqual(vm_ir.VMCode.from_text(text + "// done\n\n"), COMMANDS)
+
+    def test_cut_and_extend(self):
+        code = vm_ir.VMCode(COMMANDS)
+        tail = code.cut(3)
+        self.assertEqual(list(code), COMMANDS[:3])
+        self.assertIs(tail.names, code.names)
+        code.extend(tail)
+        self.assertEqual(list(code), COMMANDS)
+
+    def test_smaller_than_tuples(self):
+        code = vm_ir.VMCode(COMMANDS)
+        self.assertEqual(code.nbytes(), 9 * len(COMMANDS))
+
+    def test_invalid(self):
+        self.assertRaises(vm_ir.InvalidVMCommand, vm_ir.VMCode, [("push", "heap", 0)])
+        self.assertRaises(vm_ir.InvalidVMCommand, vm_ir.VMCode.from_text, "jump END\n")
+        self.assertRaises(vm_ir.InvalidVMCommand, vm_ir.parse_command, "push local x")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import jack_analyzer.vm_optimizer as vo
+
+FUNCTION = ("function", "Test.f", 0)
+
+def optimize(*commands):
+    return vo.optimize([FUNCTION] + list(commands))[1:]
+
+class TestVMOptimizer(unittest.TestCase):
+    def test_fold_binary(self):
+        self.assertEqual(optimize(("push", "constant", 3), ("push", "constant", 4), ("add",), ("return",)),
+                         [("push", "constant", 7), ("return",)])
+
+    def test_fold_negative_result(self):
+        self.assertEqual(optimize(("push", "constant", 3), ("push", "constant", 4), ("sub",), ("return",)),
+                         [("push", "constant", 1), ("neg",), ("return",)])
+
+    def test_fold_wraps_to_16_bits(self):
+        self.assertEqual(optimize(("push", "constant", 32767), ("push", "constant", 1), ("add",), ("return",)),
+                         [("push", "constant", 32767), ("not",), ("return",)])
+
+    def test_fold_comparison(self):
+        self.assertEqual(optimize(("push", "constant", 1), ("neg",), ("push", "constant", 0), ("lt",), ("return",)),
+                         [("push", "constant", 1), ("neg",), ("return",)])
+
+    def test_identity(self):
+        self.assertEqual(optimize(("push", "local", 0), ("push", "constant", 0), ("add",), ("return",)),
+                         [("push", "local", 0), ("return",)])
+
+    def test_double_not(self):
+        self.assertEqual(optimize(("push", "local", 0), ("not",), ("not",), ("return",)),
+                         [("push", "local", 0), ("return",)])
+
+    def test_push_pop_cancel(self):
+        self.assertEqual(optimize(("push", "local", 1), ("pop", "local", 1), ("push", "constant", 0), ("return",)),
+                         [("push", "constant", 0), ("return",)])
+
+    def test_array_store(self):
+        self.assertEqual(optimize(("push", "local", 0), ("push", "constant", 5), ("pop", "temp", 0),
+                                  ("pop", "pointer", 1), ("push", "temp", 0), ("pop", "that", 0),
+                                  ("push", "constant", 0), ("return",)),
+                         [("push", "local", 0), ("pop", "pointer", 1), ("push", "constant", 5),
+                          ("pop", "that", 0), ("push", "constant", 0), ("return",)])
+
+    def test_array_store_from_that_is_kept(self):
+        commands = [("push", "local", 0), ("push", "that", 0), ("pop", "temp", 0),
+                    ("pop", "pointer", 1), ("push", "temp", 0), ("pop", "that", 0),
+                    ("push", "constant", 0), ("return",)]
+        self.assertEqual(optimize(*commands), commands)
+
+    def test_if_on_comparison(self):
+        self.assertEqual(optimize(("push", "local", 0), ("push", "local", 1), ("eq",), ("not",),
+                                  ("if-goto", "IF_TRUE0"), ("goto", "IF_FALSE0"), ("label", "IF_TRUE0"),
+                                  ("push", "constant", 1), ("pop", "local", 0),
+                                  ("goto", "IF_END0"), ("label", "IF_FALSE0"), ("label", "IF_END0"),
+                                  ("push", "constant", 0), ("return",)),
+                         [("push", "local", 0), ("push", "local", 1), ("eq",),
+                          ("if-goto", "IF_FALSE0"),
+                          ("push", "constant", 1), ("pop", "local", 0),
+                          ("label", "IF_FALSE0"),
+                          ("push", "constant", 0), ("return",)])
+
+    def test_if_on_unknown_value_is_kept(self):
+        commands = [("push", "local", 0), ("if-goto", "IF_TRUE0"), ("goto", "IF_FALSE0"),
+                    ("label", "IF_TRUE0"), ("push", "constant", 1), ("return",),
+                    ("label", "IF_FALSE0"), ("push", "constant", 0), ("return",)]
+        self.assertEqual(optimize(*commands), commands)
+
+    def test_unreachable_after_return(self):
+        self.assertEqual(optimize(("push", "constant", 1), ("return",), ("goto", "IF_END0"),
+                                  ("label", "IF_END0"), ("push", "constant", 0), ("return",)),
+                         [("push", "constant", 1), ("return",)])
+
+    def test_jump_threading(self):
+        self.assertEqual(optimize(("label", "A"), ("push", "local", 0), ("if-goto", "B"),
+                                  ("push", "constant", 0), ("return",),
+                                  ("label", "B"), ("goto", "A")),
+                         [("label", "A"), ("push", "local", 0), ("if-goto", "A"),
+                          ("push", "constant", 0), ("return",)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import io
+import os
+import tempfile
+import unittest
+import jack_analyzer.vm_writer as vw
+
+def write_commands(vm_writer):
+    vm_writer.write_function("Main.main", 0)
+    vm_writer.write_push("constant", 7)
+    vm_writer.write_return()
+    vm_writer.close()
+
+EXPECTED = "function Main.main 0\npush constant 7\nreturn\n"
+
+class TestVMWriterSinks(unittest.TestCase):
+    def test_list(self):
+        lines = []
+        write_commands(vw.VMWriter(lines))
+        self.assertEqual("".join(lines), EXPECTED)
+        self.assertEqual(len(lines), 1, "Expected one entry per function")
+
+    def test_string_io(self):
+        output = io.StringIO()
+        write_commands(vw.VMWriter(output))
+        self.assertEqual(output.getvalue(), EXPECTED)
+        self.assertFalse(output.closed, "Caller supplied stream should be left open")
+
+    def test_list_sink(self):
+        sink = vw.ListSink()
+        write_commands(vw.VMWriter(sink))
+        self.assertEqual(sink.getvalue(), EXPECTED)
+
+    def test_ir_sink(self):
+        sink = vw.IRSink()
+        write_commands(vw.VMWriter(sink))
+        self.assertEqual(list(sink.code), [("function", "Main.main", 0), ("push", "constant", 7), ("return",)])
+        self.assertEqual(sink.code.to_text(), EXPECTED)
+
+    def test_buffered_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "Main.vm")
+            sink = vw.BufferedFileSink(path, buffer_size = 16)
+            vm_writer = vw.VMWriter(sink)
+            vm_writer.write_function("Main.main", 0)
+            self.assertEqual(sink.buffered, 0, "Buffer should flush once full")
+            vm_writer.write_push("constant", 7)
+            vm_writer.write_return()
+            vm_writer.close()
+            vm_writer.close()
+            with open(path) as vm_file:
+                self.assertEqual(vm_file.read(), EXPECTED)
+
+    def test_file_path(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "Main.vm")
+            write_commands(vw.VMWriter(path))
+            with open(path) as vm_file:
+                self.assertEqual(vm_file.read(), EXPECTED)
+
+    def test_bad_output(self):
+        self.assertRaises(TypeError, vw.VMWriter, 42)
+
+class TestVMWriterOptimize(unittest.TestCase):
+    def write_function(self, optimize):
+        output = io.StringIO()
+        vm_writer = vw.VMWriter(output, optimize = optimize)
+        vm_writer.write_function("Main.main", 0)
+        vm_writer.write_push("constant", 2)
+        vm_writer.write_push("constant", "3")
+        vm_writer.write_arithmetic("add")
+        vm_writer.write_return()
+        vm_writer.close()
+        return output.getvalue(), vm_writer.commands_removed
+
+    def test_unoptimized(self):
+        self.assertEqual(self.write_function(False),
+                         ("function Main.main 0\npush constant 2\npush constant 3\nadd\nreturn\n", 0))
+
+    def test_optimized(self):
+        self.assertEqual(self.write_function(True),
+                         ("function Main.main 0\npush constant 5\nreturn\n", 2))
+
+if __name__ == "__main__":
+    unittest.main()